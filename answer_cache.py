@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from state_store import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_PUNCT_RE = re.compile(r"[^\w\s']+")
+_SPACE_RE = re.compile(r"\s+")
+_REPLAY_CHUNK_RE = re.compile(r"\S+\s*")
+
+
+def normalize_question(question):
+    """Case, punctuation and whitespace-insensitive form of a question used as the cache key."""
+    return _SPACE_RE.sub(" ", _PUNCT_RE.sub(" ", question.lower())).strip()
+
+
+def shingles(normalized, size=2):
+    """Word n-gram shingles (plus single words, so very short questions still compare)."""
+    words = normalized.split()
+    grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return grams | set(words)
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def replay_chunks(answer, words_per_chunk=4):
+    """Split a cached answer into stream-sized pieces that concatenate back to the original."""
+    pieces = _REPLAY_CHUNK_RE.findall(answer)
+    leading = answer[:len(answer) - len(answer.lstrip())]
+    chunks = ["".join(pieces[i:i + words_per_chunk]) for i in range(0, len(pieces), words_per_chunk)]
+    if chunks and leading:
+        chunks[0] = leading + chunks[0]
+    return chunks
+
+
+class AnswerCache:
+    """
+    Answers keyed on (video_id, normalized question, prompt/model version).
+
+    The exact tier is a TTL+LRU map. The optional similar tier compares a new
+    question's word shingles with recent questions for the same video and
+    version, and reuses the answer when the Jaccard similarity reaches
+    similarity_threshold (0 disables it).
+    """
+
+    def __init__(self, max_entries=2000, ttl=7 * 24 * 3600, similarity_threshold=0.0, max_candidates=200):
+        self.entries = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.similarity_threshold = similarity_threshold
+        self.max_candidates = max_candidates
+        self._candidates = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits_exact": 0, "hits_similar": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0")),
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def record_bypass(self):
+        self._count("bypassed")
+
+    def get(self, video_id, question, version):
+        """Return (answer, tier) with tier "exact" or "similar", or None on a miss."""
+        normalized = normalize_question(question)
+        answer = self.entries.get((video_id, version, normalized))
+        if answer is not None:
+            self._count("hits_exact")
+            return answer, "exact"
+
+        if self.similarity_threshold > 0:
+            query = shingles(normalized)
+            with self._lock:
+                candidates = list(self._candidates.get((video_id, version), {}).items())
+            best, best_score = None, 0.0
+            for candidate, candidate_shingles in candidates:
+                score = jaccard(query, candidate_shingles)
+                if score > best_score:
+                    best, best_score = candidate, score
+            if best is not None and best_score >= self.similarity_threshold:
+                answer = self.entries.get((video_id, version, best))
+                if answer is not None:
+                    logger.info(f"Answer cache similar hit ({best_score:.2f}): {question!r} ~ {best!r}")
+                    self._count("hits_similar")
+                    return answer, "similar"
+
+        self._count("misses")
+        return None
+
+    def put(self, video_id, question, version, answer):
+        normalized = normalize_question(question)
+        self.entries.set((video_id, version, normalized), answer)
+        if self.similarity_threshold > 0:
+            with self._lock:
+                candidates = self._candidates.setdefault((video_id, version), OrderedDict())
+                candidates[normalized] = shingles(normalized)
+                candidates.move_to_end(normalized)
+                while len(candidates) > self.max_candidates:
+                    candidates.popitem(last=False)
+        self._count("stores")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits_exact"] + counters["hits_similar"] + counters["misses"]
+        counters["hit_rate"] = (counters["hits_exact"] + counters["hits_similar"]) / lookups if lookups else 0.0
+        counters["entries"] = len(self.entries)
+        counters["similarity_threshold"] = self.similarity_threshold
+        return counters
+
+
+def replay(answer, delay):
+    """Yield a cached answer as stream chunks, sleeping `delay` seconds between them (0 = all at once)."""
+    if delay <= 0:
+        yield answer
+        return
+    for i, chunk in enumerate(replay_chunks(answer)):
+        if i:
+            time.sleep(delay)
+        yield chunk
+
+
+async def replay_async(answer, delay):
+    """replay() for the event loop."""
+    if delay <= 0:
+        yield answer
+        return
+    for i, chunk in enumerate(replay_chunks(answer)):
+        if i:
+            await asyncio.sleep(delay)
+        yield chunk
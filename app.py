@@ -1,13 +1,56 @@
+import csv
+import io
+import json
 import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
 from functools import wraps
-from flask import Flask, request, jsonify, render_template, send_file, Response, session, redirect, url_for, stream_with_context
-from youtube_qa_app import YouTubeQAApp
+from flask import Flask, request, jsonify, render_template, Response, session, redirect, url_for, stream_with_context
+from metrics import current_trace_id, metrics, set_trace_id
+from rate_limiter import RateLimitExceeded
+from state_store import SessionStore
+from youtube_qa_app import YouTubeQAApp, logger
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Set a secret key for session management
+# All gunicorn workers must share the key, otherwise a session cookie issued
+# by one worker is rejected by the next one that serves the browser.
+app.secret_key = os.getenv('SECRET_KEY') or os.urandom(24)
+if not os.getenv('SECRET_KEY'):
+    logger.warning("SECRET_KEY not set; sessions will not survive restarts or span multiple workers")
 
-# Create an instance of YouTubeQAApp
+# Shared, stateless engine; per-user state lives in the session store
 youtube_qa = YouTubeQAApp()
+sessions = SessionStore()
+
+# The first eight columns match the original qa_feedback_log.csv layout
+CSV_FIELDS = ["timestamp", "participant_id", "work_status", "gender", "video_url", "question", "answer", "feedback",
+              "id", "video_id", "cache", "error", "latency_ms", "first_token_ms", "prompt_tokens",
+              "completion_tokens", "model", "cached_tokens"]
+EXPORT_CHUNK_BYTES = 64 * 1024
+_LINE_BREAK_RE = re.compile(r"\r\n|\r|\n")
+
+
+@app.before_request
+def start_trace():
+    # Background workers start in the process that serves requests, which
+    # under gunicorn --preload is a worker forked after this module loaded
+    youtube_qa.start()
+    # Reuse the id from a proxy/load balancer so its logs and ours line up
+    set_trace_id(request.headers.get('X-Request-ID'))
+
+@app.after_request
+def finish_trace(response):
+    response.headers['X-Request-ID'] = current_trace_id()
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.inc("http_requests_total", endpoint=endpoint, status=response.status_code)
+    return response
+
+def current_state():
+    """Return the conversation state for the browser session making this request."""
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return sessions.get(session['sid'])
 
 # Authentication decorator
 def login_required(f):
@@ -18,6 +61,18 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_token_required(f):
+    # The login is shared by every student, so destructive admin actions also need ADMIN_TOKEN
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = os.getenv('ADMIN_TOKEN')
+        if not token:
+            return jsonify({"error": "Set ADMIN_TOKEN on the server to enable this action"}), 403
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            return jsonify({"error": "Invalid admin token"}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -25,6 +80,7 @@ def login():
         password = request.form['password']
         if username == os.getenv('AUTH_USERNAME') and password == os.getenv('AUTH_PASSWORD'):
             session['logged_in'] = True
+            session['sid'] = uuid.uuid4().hex
             return redirect(url_for('home'))
         else:
             return render_template('login.html', error='Invalid credentials')
@@ -33,6 +89,9 @@ def login():
 @app.route('/logout')
 def logout():
     session.pop('logged_in', None)
+    sid = session.pop('sid', None)
+    if sid:
+        sessions.discard(sid)
     return redirect(url_for('login'))
 
 @app.route('/')
@@ -42,40 +101,109 @@ def home():
     offline_mode = os.getenv('OFFLINE_MODE', '0').lower() in ('1','true','yes')
     return render_template('index.html', default_video_url=default_video_url, offline_mode=offline_mode)
 
+def progress_lines(events):
+    """Render ingestion progress events as the line protocol read by index.html."""
+    for progress in events:
+        if isinstance(progress, tuple):
+            if progress[0] == 'download':
+                yield f"download:{progress[1]}\n"
+            elif progress[0] == 'transcribe':
+                yield f"transcribe:{progress[1]}\n"
+            elif progress[0] == 'status':
+                yield f"status:{progress[1]}\n"
+        elif progress == "done":
+            yield "done\n"
+        else:
+            yield f"{progress}\n"
+
 @app.route('/load_video', methods=['POST'])
 @login_required
 def load_video():
     youtube_url = request.json.get('youtube_url')
+    state = current_state()
+    events = youtube_qa.process_video(youtube_url, state)
+    return Response(stream_with_context(progress_lines(events)), content_type='text/plain')
 
-    def generate():
-        for progress in youtube_qa.process_video(youtube_url):
-            if isinstance(progress, tuple):
-                if progress[0] == 'download':
-                    yield f"download:{progress[1]}\n"
-                elif progress[0] == 'transcribe':
-                    yield f"transcribe:{progress[1]}\n"
-            elif progress == "done":
-                yield "done\n"
-            else:
-                yield f"{progress}\n"
-
-    return Response(stream_with_context(generate()), content_type='text/plain')
+@app.route('/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    youtube_url = (request.json or {}).get('youtube_url')
+    try:
+        job_id = youtube_qa.submit_ingest(youtube_url)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job = youtube_qa.jobs.get(job_id)
+    return jsonify(job), 200 if job["status"] == "succeeded" else 202
 
-@app.route('/ask_stream')
+@app.route('/jobs/<job_id>')
 @login_required
-def ask_question_stream():
-    youtube_url = request.args.get('youtube_url')
-    question = request.args.get('question')
+def job_status(job_id):
+    job = youtube_qa.jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/stream')
+@login_required
+def job_stream(job_id):
+    if youtube_qa.jobs.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    events = youtube_qa.jobs.stream(job_id)
+    return Response(stream_with_context(progress_lines(events)), content_type='text/plain')
+
+def question_args(args):
+    """(youtube_url, question, user_info, use_cache) from /ask_stream query args."""
     user_info = {
-        "participant_id": request.args.get('participant_id', ''),
-        "work_status": request.args.get('work_status', 'N/A'),
-        "gender": request.args.get('gender', 'N/A')
+        "participant_id": args.get('participant_id', ''),
+        "work_status": args.get('work_status', 'N/A'),
+        "gender": args.get('gender', 'N/A')
     }
+    use_cache = args.get('no_cache', '0').lower() not in ('1', 'true', 'yes')
+    return args.get('youtube_url'), args.get('question'), user_info, use_cache
+
+def sse_data(chunk):
+    # One data: field per line; EventSource joins them back with \n, so
+    # answers with blank lines don't end the event early
+    return "".join(f"data: {line}\n" for line in _LINE_BREAK_RE.split(chunk)) + "\n"
+
+def sse_interaction(interaction_id):
+    # Sent back with the answer so feedback lands on the right row on any worker
+    return f"event: interaction\ndata: {json.dumps({'id': interaction_id})}\n\n"
+
+def sse_citations(citations):
+    # Where in the video the answer's sources are, for jump-to links
+    return f"event: citations\ndata: {json.dumps(citations)}\n\n"
+
+def sse_answer(chunk):
+    """An item of process_question_stream(): answer text or a ("citations", [...]) event."""
+    if isinstance(chunk, tuple):
+        return sse_citations(chunk[1])
+    return sse_data(chunk)
+
+def sse_rate_limited(e):
+    # The stream has already started, so signal the 429 in-band
+    retry_after = round(e.retry_after, 1)
+    payload = json.dumps({"status": 429, "reason": e.reason, "retry_after": retry_after})
+    return f"retry: {int(retry_after * 1000)}\nevent: rate_limited\ndata: {payload}\n\n"
+
+SSE_DONE = "data: [DONE]\n\n"
+
+@app.route('/ask_stream')
+@login_required
+def ask_question_stream():
+    youtube_url, question, user_info, use_cache = question_args(request.args)
+    state = current_state()
+    interaction_id = uuid.uuid4().hex
 
     def generate():
-        for chunk in youtube_qa.process_question_stream(youtube_url, question, user_info):
-            yield f"data: {chunk}\n\n"
-        yield "data: [DONE]\n\n"
+        try:
+            for chunk in youtube_qa.process_question_stream(youtube_url, question, user_info, state, use_cache,
+                                                            interaction_id=interaction_id):
+                yield sse_answer(chunk)
+            yield sse_interaction(interaction_id)
+        except RateLimitExceeded as e:
+            yield sse_rate_limited(e)
+        yield SSE_DONE
 
     return Response(generate(), content_type='text/event-stream')
 
@@ -87,22 +215,117 @@ def submit_feedback():
         return jsonify({"error": "Missing feedback"}), 400
 
     feedback = data['feedback']
-    result = youtube_qa.submit_feedback(feedback)
+    result = youtube_qa.submit_feedback(feedback, current_state(), fallback=data)
     return jsonify(result)
 
+@app.route('/metrics')
+def prometheus_metrics():
+    # Scraped by Prometheus rather than a browser, so guarded by a bearer token instead of the login
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response("Unauthorized\n", status=401, content_type='text/plain')
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/admin')
 @login_required
 def admin():
     return render_template('admin.html')
 
+@app.route('/admin/rate_limit')
+@login_required
+def rate_limit_stats():
+    return jsonify(youtube_qa.rate_limiter.stats())
+
+@app.route('/admin/answer_cache')
+@login_required
+def answer_cache_stats():
+    return jsonify(youtube_qa.answer_cache.stats())
+
+def export_filters(args):
+    """
+    Interaction filters from query args: start/end are inclusive UTC dates
+    (YYYY-MM-DD), video is an id or URL, participant a participant id.
+    Raises ValueError on a malformed date.
+    """
+    def day_start(value, offset=0):
+        day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        return (day + timedelta(days=offset)).timestamp()
+
+    video = args.get('video', '').strip()
+    return {
+        "start": day_start(args['start']) if args.get('start') else None,
+        "end": day_start(args['end'], offset=1) if args.get('end') else None,
+        "video_id": (youtube_qa.extract_video_id(video) or video) if video else None,
+        "participant_id": args.get('participant', '').strip() or None,
+    }
+
+@app.route('/admin/export')
+@login_required
+def export_interactions():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"error": "format must be csv or jsonl"}), 400
+    try:
+        filters = export_filters(request.args)
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+    rows = youtube_qa.interactions.iter_rows(**filters)
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            created = datetime.fromtimestamp(row["created_at"], timezone.utc)
+            row["timestamp"] = created.strftime("%Y-%m-%d %H:%M:%S")
+            writer.writerow(row)
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_jsonl():
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(row) + "\n")
+            if len(lines) >= 500:
+                yield "".join(lines)
+                lines = []
+        yield "".join(lines)
+
+    if fmt == 'jsonl':
+        return Response(generate_jsonl(), content_type='application/x-ndjson',
+                        headers={"Content-Disposition": "attachment; filename=interactions.jsonl"})
+    return Response(generate_csv(), content_type='text/csv',
+                    headers={"Content-Disposition": "attachment; filename=qa_feedback_log.csv"})
+
 @app.route('/admin/download_csv')
 @login_required
 def download_csv():
-    csv_path = "qa_feedback_log.csv"
-    if os.path.exists(csv_path):
-        return send_file(csv_path, as_attachment=True, download_name="qa_feedback_log.csv")
-    else:
-        return jsonify({"error": "CSV file not found"}), 404
+    return export_interactions()
+
+@app.route('/admin/analytics')
+@login_required
+def analytics():
+    start, end = request.args.get('start'), request.args.get('end')
+    try:
+        for value in (start, end):
+            if value:
+                datetime.strptime(value, "%Y-%m-%d")
+        top_videos = int(request.args.get('top', '50'))
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD and top an integer"}), 400
+    return jsonify(youtube_qa.interactions.analytics(start, end, top_videos))
+
+@app.route('/admin/reset_csv', methods=['POST'])
+@login_required
+@admin_token_required
+def reset_csv():
+    archive_path = youtube_qa.interactions.archive_and_reset()
+    if archive_path is None:
+        return jsonify({"message": "Interaction log reset"})
+    return jsonify({"message": f"Interaction log reset; previous data archived to {os.path.basename(archive_path)}"})
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
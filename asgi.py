@@ -0,0 +1,133 @@
+"""
+ASGI entry point.
+
+/ask_stream is served natively on the event loop with the async OpenAI
+client, so a worker can hold hundreds of open answer streams. Every other
+route is the unchanged Flask app, run on a thread pool
+(FLASK_THREADS per worker, so long /load_video streams don't block logins).
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import uuid
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+
+from app import (SSE_DONE, app as flask_app, question_args, sessions, sse_answer, sse_interaction, sse_rate_limited,
+                 youtube_qa)
+from metrics import metrics, set_trace_id
+from rate_limiter import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+_wsgi = WSGIMiddleware(flask_app, workers=int(os.getenv("FLASK_THREADS", "32")))
+
+
+def flask_session(scope):
+    """Decode the signed Flask session cookie from an ASGI scope ({} if missing or invalid)."""
+    cookies = SimpleCookie()
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            cookies.load(value.decode("latin-1"))
+    morsel = cookies.get(flask_app.config["SESSION_COOKIE_NAME"])
+    if morsel is None:
+        return {}
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        return serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return {}
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _answer_events(args, state):
+    youtube_url, question, user_info, use_cache = question_args(args)
+    interaction_id = uuid.uuid4().hex
+    try:
+        stream = youtube_qa.process_question_stream_async(youtube_url, question, user_info, state, use_cache,
+                                                          interaction_id=interaction_id)
+        async with contextlib.aclosing(stream):
+            async for chunk in stream:
+                yield sse_answer(chunk)
+        yield sse_interaction(interaction_id)
+    except RateLimitExceeded as e:
+        yield sse_rate_limited(e)
+    yield SSE_DONE
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def ask_stream(scope, receive, send, session):
+    args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+    state = sessions.get(session["sid"])
+    trace_id = set_trace_id(_header(scope, b"x-request-id"))
+    metrics.inc("http_requests_total", endpoint="/ask_stream", status=200)
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                    (b"x-request-id", trace_id.encode("latin-1"))],
+    })
+
+    async def produce():
+        async with contextlib.aclosing(_answer_events(args, state)) as events:
+            async for event in events:
+                await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    producer = asyncio.ensure_future(produce())
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    await asyncio.wait({producer, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    if not producer.done():
+        # The browser went away: cancelling the producer closes the OpenAI stream
+        logger.info("Client disconnected from /ask_stream; cancelling the answer")
+        producer.cancel()
+    disconnect.cancel()
+    try:
+        await producer
+    except asyncio.CancelledError:
+        pass
+    except OSError as e:
+        logger.info(f"/ask_stream client connection lost: {e}")
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            youtube_qa.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await youtube_qa.close_async_client()
+            await asyncio.to_thread(youtube_qa.interactions.close)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["path"] == "/ask_stream" and scope["method"] == "GET":
+        session = flask_session(scope)
+        # Sessions without an id yet (or not logged in) take the Flask route,
+        # which sets the cookie or redirects to the login page
+        if session.get("logged_in") and session.get("sid"):
+            return await ask_stream(scope, receive, send, session)
+    await _wsgi(scope, receive, send)
@@ -0,0 +1,232 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load tests.
+
+Streams a canned answer in the chat.completion.chunk format at a configurable
+token rate after a configurable time to first token, and ends with a usage
+chunk when stream_options.include_usage is set. Like OpenAI's prompt cache,
+prompt prefixes it has seen before are reported as
+usage.prompt_tokens_details.cached_tokens (in 128-token steps once a prompt
+reaches --cache-min-tokens). Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python -m bench.fake_openai --port 8765 --ttft-ms 400 --tokens-per-second 40
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the video explains that students can book a session with the library team to get help with "
+         "assistive software quiet study spaces and extended loans which are described in the "
+         "second half of the recording").split()
+
+
+class FakeOpenAIConfig:
+    def __init__(self, ttft_ms=400.0, tokens_per_second=40.0, completion_tokens=120, jitter=0.2,
+                 error_rate=0.0, cache_min_tokens=1024, keep_requests=0):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.cache_min_tokens = cache_min_tokens
+        self.keep_requests = keep_requests  # most recent request bodies kept for inspection
+
+
+class FakeOpenAIStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "completed": 0, "disconnected": 0, "errors_injected": 0, "open": 0,
+                       "max_open": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+            if name == "open":
+                self.counts["max_open"] = max(self.counts["max_open"], self.counts["open"])
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+# Roughly four characters per token, as estimated for prompt_tokens
+CHARS_PER_TOKEN = 4
+CACHE_BLOCK_TOKENS = 128
+
+
+def _estimate_tokens(messages):
+    return max(1, sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN)
+
+
+class PromptCache:
+    """Remembers hashes of prompt prefixes and reports how much of a new prompt was seen before."""
+
+    def __init__(self, min_tokens=1024):
+        self.min_tokens = min_tokens
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def lookup_and_add(self, messages):
+        text = "".join(f"{m.get('role')}\n{m.get('content', '')}\n" for m in messages)
+        block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        prefix_hash, digests = hashlib.sha256(), []
+        for end in range(block, len(text) + 1, block):
+            prefix_hash.update(text[end - block:end].encode())
+            digests.append((end // CHARS_PER_TOKEN, prefix_hash.copy().hexdigest()))
+        cached = 0
+        with self._lock:
+            for tokens, digest in digests:
+                if tokens >= self.min_tokens and digest in self._prefixes:
+                    cached = tokens
+                self._prefixes.add(digest)
+        return cached
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        pass  # one line per request would dominate the benchmark output
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        config, stats = self.server.config, self.server.stats
+        stats.add("requests")
+        if config.keep_requests:
+            self.server.requests.append(request)
+            del self.server.requests[:-config.keep_requests]
+        if random.random() < config.error_rate:
+            stats.add("errors_injected")
+            self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+
+        scale = 1 + random.uniform(-config.jitter, config.jitter)
+        prompt_tokens = _estimate_tokens(request.get("messages", []))
+        words = [WORDS[i % len(WORDS)] for i in range(config.completion_tokens)]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = request.get("model", "gpt-4o-mini")
+        cached_tokens = self.server.prompt_cache.lookup_and_add(request.get("messages", []))
+        stats.add("prompt_tokens", prompt_tokens)
+        stats.add("cached_tokens", cached_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words),
+                 "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+
+        if not request.get("stream"):
+            time.sleep(config.ttft_ms / 1000 * scale + len(words) / config.tokens_per_second * scale)
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": usage,
+            })
+            stats.add("completed")
+            return
+
+        def chunk(choices, **extra):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": choices, **extra}
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        stats.add("open")
+        try:
+            time.sleep(config.ttft_ms / 1000 * scale)
+            interval = scale / config.tokens_per_second
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(interval)
+                content = word if i == 0 else " " + word
+                self._write_chunk(chunk([{"index": 0, "delta": {"content": content}, "finish_reason": None}]))
+            self._write_chunk(chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self._write_chunk(chunk([], usage=usage))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            stats.add("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            stats.add("disconnected")
+            self.close_connection = True
+        finally:
+            stats.add("open", -1)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, FakeOpenAIHandler)
+        self.config = config
+        self.stats = FakeOpenAIStats()
+        self.prompt_cache = PromptCache(config.cache_min_tokens)
+        self.requests = []
+
+    def start(self):
+        """Serve from a background thread; returns the base URL to use as OPENAI_BASE_URL."""
+        threading.Thread(target=self.serve_forever, name="fake-openai", daemon=True).start()
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def add_arguments(parser):
+    parser.add_argument("--ttft-ms", type=float, default=400.0, help="Delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="Streaming rate per answer")
+    parser.add_argument("--completion-tokens", type=int, default=120, help="Tokens per answer")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random +/- fraction applied to timings")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024,
+                        help="Shortest prompt whose prefix counts as cached")
+
+
+def config_from_args(args):
+    return FakeOpenAIConfig(ttft_ms=args.ttft_ms, tokens_per_second=args.tokens_per_second,
+                            completion_tokens=args.completion_tokens, jitter=args.jitter,
+                            error_rate=args.error_rate, cache_min_tokens=args.cache_min_tokens)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    server = FakeOpenAIServer((args.host, args.port), config_from_args(args))
+    print(f"Fake OpenAI listening on http://{args.host}:{args.port}/v1 (stats at /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Load driver: simulated students log in, load a video, ask questions over
+/ask_stream and leave feedback, all concurrently.
+
+    python -m bench.load --base-url http://127.0.0.1:8000 --students 50 --questions 5
+
+Reports throughput, time to first token and p50/p95/p99 latency per
+endpoint plus error rates, and writes them as JSON (see --out / --compare).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime
+
+import httpx
+
+QUESTIONS = (
+    "What is this video about?",
+    "Who can get additional support from the library?",
+    "How do I book an appointment?",
+    "Summarise the main points in three bullet points.",
+    "What assistive software is mentioned?",
+    "Are there quiet study spaces?",
+    "What does the speaker say about extended loans?",
+    "Who is presenting the video?",
+)
+
+ENDPOINTS = ("login", "load_video", "ask_stream", "feedback")
+
+
+def bench_video_url(index):
+    """Synthetic but well-formed video URLs; the stub backends serve the same fixture for all of them."""
+    return f"https://www.youtube.com/watch?v=bench{index:06d}"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.ttft = []
+        self.requests = {name: 0 for name in ENDPOINTS}
+        self.errors = {name: {} for name in ENDPOINTS}
+        self.answer_tokens = 0
+
+    def ok(self, endpoint, seconds):
+        self.requests[endpoint] += 1
+        self.latencies[endpoint].append(seconds)
+
+    def error(self, endpoint, kind):
+        self.requests[endpoint] += 1
+        self.errors[endpoint][kind] = self.errors[endpoint].get(kind, 0) + 1
+
+
+async def _login(client, args, rec):
+    started = time.perf_counter()
+    r = await client.post("/login", data={"username": args.username, "password": args.password})
+    if r.status_code == 302:
+        rec.ok("login", time.perf_counter() - started)
+        return True
+    rec.error("login", f"status_{r.status_code}" if r.status_code != 200 else "bad_credentials")
+    return False
+
+
+async def _load_video(client, url, rec):
+    started = time.perf_counter()
+    last = ""
+    async with client.stream("POST", "/load_video", json={"youtube_url": url}) as r:
+        if r.status_code != 200:
+            rec.error("load_video", f"status_{r.status_code}")
+            return False
+        async for line in r.aiter_lines():
+            if line.strip():
+                last = line.strip()
+    if last == "done":
+        rec.ok("load_video", time.perf_counter() - started)
+        return True
+    rec.error("load_video", "pipeline_error" if last.startswith("Error") else "incomplete")
+    return False
+
+
+async def _ask(client, url, question, participant, rec, no_cache=False):
+    """Returns (answer, interaction_id) or None on failure."""
+    params = {"youtube_url": url, "question": question, "participant_id": participant,
+              "work_status": "bench", "gender": "N/A", "no_cache": "1" if no_cache else "0"}
+    started = time.perf_counter()
+    first = None
+    answer, interaction_id, event, data_lines = [], None, None, []
+    async with client.stream("GET", "/ask_stream", params=params) as r:
+        if r.status_code != 200:
+            rec.error("ask_stream", f"status_{r.status_code}")
+            return None
+        async for line in r.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data:"):
+                data_lines.append(line[6:] if line.startswith("data: ") else line[5:])
+            elif not line:
+                # A blank line ends the event; its data lines are joined with \n, as EventSource does
+                data, data_lines = "\n".join(data_lines), []
+                if event == "rate_limited":
+                    rec.error("ask_stream", "rate_limited")
+                    return None
+                if event == "interaction":
+                    interaction_id = json.loads(data)["id"]
+                elif data == "[DONE]":
+                    break
+                elif event is None and data:
+                    if first is None:
+                        first = time.perf_counter() - started
+                    answer.append(data)
+                event = None
+    text = "".join(answer)
+    if not text or text.startswith("Sorry, I couldn't generate an answer") or text.startswith("Please load"):
+        rec.error("ask_stream", "no_answer" if not text else "upstream_error")
+        return None
+    rec.ok("ask_stream", time.perf_counter() - started)
+    rec.ttft.append(first)
+    rec.answer_tokens += len(text.split())
+    return text, interaction_id
+
+
+async def _feedback(client, url, question, answer, interaction_id, participant, rec):
+    started = time.perf_counter()
+    r = await client.post("/feedback", json={
+        "feedback": random.choice(("yes", "no")), "question": question, "answer": answer,
+        "interaction_id": interaction_id, "youtube_url": url, "participant_id": participant,
+        "work_status": "bench", "gender": "N/A",
+    })
+    if r.status_code == 200 and "message" in r.json():
+        rec.ok("feedback", time.perf_counter() - started)
+    else:
+        rec.error("feedback", f"status_{r.status_code}")
+
+
+async def student(index, args, rec):
+    url = bench_video_url(index % args.videos)
+    participant = f"bench-{index:03d}"
+    # Stagger arrivals so the class doesn't start within the same millisecond
+    await asyncio.sleep(random.uniform(0, args.ramp_up))
+    stage = "login"
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        try:
+            if not await _login(client, args, rec):
+                return
+            stage = "load_video"
+            if not await _load_video(client, url, rec):
+                return
+            for _ in range(args.questions):
+                question = random.choice(QUESTIONS)
+                stage = "ask_stream"
+                result = await _ask(client, url, question, participant, rec, args.no_answer_cache)
+                if result is not None:
+                    await asyncio.sleep(random.uniform(0, args.think_time))
+                    stage = "feedback"
+                    await _feedback(client, url, question, result[0], result[1], participant, rec)
+                await asyncio.sleep(random.uniform(0, args.think_time))
+        except httpx.HTTPError as e:
+            # Connection errors and timeouts; the student gives up like a real one would
+            rec.error(stage, type(e).__name__)
+
+
+async def run_load(args):
+    rec = Recorder()
+    started = time.perf_counter()
+    await asyncio.gather(*(student(i, args, rec) for i in range(args.students)))
+    duration = time.perf_counter() - started
+
+    endpoints = {}
+    for name in ENDPOINTS:
+        failed = sum(rec.errors[name].values())
+        endpoints[name] = dict(summarize(rec.latencies[name]), requests=rec.requests[name], errors=rec.errors[name],
+                               error_rate=failed / rec.requests[name] if rec.requests[name] else 0.0)
+    total_requests = sum(rec.requests.values())
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("password", "compare", "out")},
+        "duration_s": duration,
+        "throughput": {
+            "requests_per_s": total_requests / duration,
+            "answers_per_s": len(rec.latencies["ask_stream"]) / duration,
+            "answer_words_per_s": rec.answer_tokens / duration,
+        },
+        "ttft_s": summarize(rec.ttft),
+        "endpoints": endpoints,
+        "error_rate": sum(sum(e.values()) for e in rec.errors.values()) / total_requests if total_requests else 0.0,
+    }
+
+
+def _fmt(value, scale=1000.0, unit="ms"):
+    return "-" if value is None else f"{value * scale:.0f}{unit}"
+
+
+def print_report(result):
+    print(f"\n{result['config']['students']} students, {result['duration_s']:.1f}s, "
+          f"{result['throughput']['requests_per_s']:.1f} req/s, "
+          f"{result['throughput']['answers_per_s']:.2f} answers/s, error rate {result['error_rate']:.1%}")
+    ttft = result["ttft_s"]
+    print(f"time to first token: p50 {_fmt(ttft['p50'])}  p95 {_fmt(ttft['p95'])}  p99 {_fmt(ttft['p99'])}")
+    print(f"{'endpoint':<12}{'reqs':>6}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}  errors")
+    for name, stats in result["endpoints"].items():
+        print(f"{name:<12}{stats['requests']:>6}{stats['error_rate']:>7.1%}{_fmt(stats['p50']):>9}"
+              f"{_fmt(stats['p95']):>9}{_fmt(stats['p99']):>9}  {stats['errors'] or ''}")
+
+
+def print_comparison(result, baseline):
+    """Relative change of the headline numbers against an earlier results file."""
+    rows = [("requests/s", result["throughput"]["requests_per_s"], baseline["throughput"]["requests_per_s"]),
+            ("ttft p50", result["ttft_s"]["p50"], baseline["ttft_s"]["p50"]),
+            ("ttft p95", result["ttft_s"]["p95"], baseline["ttft_s"]["p95"]),
+            ("error rate", result["error_rate"], baseline["error_rate"])]
+    for name in ENDPOINTS:
+        for pct in ("p50", "p95", "p99"):
+            rows.append((f"{name} {pct}", result["endpoints"][name][pct], baseline["endpoints"][name][pct]))
+    print(f"\nvs {baseline['timestamp']}:")
+    for name, new, old in rows:
+        if new is None or old is None:
+            continue
+        change = f"{(new - old) / old:+.1%}" if old else "n/a"
+        print(f"  {name:<20}{old:>12.4g} -> {new:<12.4g}{change}")
+
+
+def save_result(result, out):
+    out = out or os.path.join("bench", "results", f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {out}")
+    return out
+
+
+def add_arguments(parser):
+    parser.add_argument("--students", type=int, default=50, help="Concurrent simulated users")
+    parser.add_argument("--questions", type=int, default=5, help="Questions per student")
+    parser.add_argument("--videos", type=int, default=3, help="Distinct videos shared among the students")
+    parser.add_argument("--think-time", type=float, default=3.0, help="Max seconds between a student's actions")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Students arrive over this many seconds")
+    parser.add_argument("--no-answer-cache", action="store_true",
+                        help="Send no_cache=1 so every question reaches the model")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--username", default=os.getenv("AUTH_USERNAME", "bench"))
+    parser.add_argument("--password", default=os.getenv("AUTH_PASSWORD", "bench"))
+    parser.add_argument("--out", help="Results file (default bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+
+
+def report(result, args):
+    print_report(result)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+    save_result(result, args.out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the load driver against an already running server.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    report(asyncio.run(run_load(args)), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Check that questions about the same video share a byte-identical prompt
+prefix, so OpenAI's prompt cache can serve it.
+
+Runs the app in-process against bench.fake_openai with the checked-in
+fixture video, asks several questions from several sessions (bypassing the
+answer cache) and verifies that:
+
+- every request starts with the same instruction and transcript messages
+  (or, for transcripts over the context budget, the instructions and, with
+  --outline-tokens, the outline);
+- that shared prefix is at least --cache-min-tokens long, unless it is only
+  the instructions of an excerpt prompt without an outline;
+- everything that varies (excerpts, conversation history, question) comes
+  after it;
+- the cached-token counts the fake reports end up in the interaction log.
+
+    python -m bench.prompt_cache_check --sessions 3 --questions 4
+    python -m bench.prompt_cache_check --context-token-budget 200
+    python -m bench.prompt_cache_check --context-token-budget 200 --outline-tokens 300
+
+A small --context-token-budget makes the short fixture behave like a long
+lecture, which is answered from retrieved excerpts. The last two runs
+compare the cost of excerpt prompts without and with an outline: uncached
+prompt tokens are billed in full, cached ones at a discount.
+
+Exits non-zero if any check fails.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from bench import fake_openai
+from bench.load import QUESTIONS
+from bench.stubs import FIXTURE_VIDEO_ID, REPO_ROOT
+
+PREFIX_MESSAGES = 2  # system instructions, then the transcript or the outline
+EXCERPT_INTRO = "Here are the most relevant excerpts"
+
+
+def ask(client, url, question):
+    r = client.get("/ask_stream", query_string={"youtube_url": url, "question": question, "no_cache": "1",
+                                                "participant_id": "prefix-check"})
+    return r.get_data(as_text=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check prompt prefix stability against the fake OpenAI server.")
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=4, help="Questions per session")
+    parser.add_argument("--cache-min-tokens", type=int, default=256,
+                        help="Fake prompt cache threshold (the fixture transcript is shorter than OpenAI's 1024)")
+    parser.add_argument("--context-token-budget", type=int,
+                        help="CONTEXT_TOKEN_BUDGET for the app; below the fixture's size, prompts use excerpts")
+    parser.add_argument("--outline-tokens", type=int, help="PROMPT_OUTLINE_TOKENS for the app")
+    args = parser.parse_args(argv)
+
+    fake = fake_openai.FakeOpenAIServer(("127.0.0.1", 0), fake_openai.FakeOpenAIConfig(
+        ttft_ms=0, tokens_per_second=10000, completion_tokens=20, jitter=0,
+        cache_min_tokens=args.cache_min_tokens, keep_requests=1000))
+    workdir = tempfile.mkdtemp(prefix="prefix-check-")
+    os.environ.update(
+        OPENAI_BASE_URL=fake.start(), OPENAI_API_KEY="sk-bench", ASSEMBLYAI_API_KEY="bench",
+        AUTH_USERNAME="bench", AUTH_PASSWORD="bench", SECRET_KEY="bench", OFFLINE_MODE="1",
+        DATA_DIR=os.path.join(workdir, "data"), INTERACTION_LOG_FLUSH_SECONDS="0.1",
+        USER_RATE_LIMIT_BURST="1000", OPENAI_RATE_LIMIT_BURST="1000",
+    )
+    excerpts = args.context_token_budget is not None
+    if excerpts:
+        # Chunks small enough that several fit in the budget
+        os.environ.update(CONTEXT_TOKEN_BUDGET=str(args.context_token_budget),
+                          RETRIEVAL_CHUNK_TOKENS=str(max(20, args.context_token_budget // 3)),
+                          RETRIEVAL_CHUNK_OVERLAP_TOKENS="10")
+    if args.outline_tokens is not None:
+        os.environ["PROMPT_OUTLINE_TOKENS"] = str(args.outline_tokens)
+    # The fixture transcript lives in the repo's transcript_cache/
+    os.chdir(REPO_ROOT)
+    from app import app, youtube_qa
+    from retrieval import count_tokens
+
+    url = f"https://www.youtube.com/watch?v={FIXTURE_VIDEO_ID}"
+    asked = []
+    for session in range(args.sessions):
+        client = app.test_client()
+        client.post("/login", data={"username": "bench", "password": "bench"})
+        client.post("/load_video", json={"youtube_url": url}).get_data()
+        for i in range(args.questions):
+            question = QUESTIONS[(session + i) % len(QUESTIONS)]
+            ask(client, url, question)
+            asked.append(question)
+    youtube_qa.interactions.close()
+
+    # Without an outline, only the instructions come before the excerpts, too short to be cached
+    cacheable = not excerpts or youtube_qa.outline_tokens > 0
+    prefix_messages = PREFIX_MESSAGES if cacheable else 1
+    failures = []
+    answers = [r for r in fake.requests if r.get("stream")]
+    if len(answers) != len(asked):
+        failures.append(f"expected {len(asked)} answer requests, the fake saw {len(answers)}")
+    prefixes = {json.dumps(r["messages"][:prefix_messages], sort_keys=True) for r in answers}
+    if len(prefixes) != 1:
+        failures.append(f"{len(prefixes)} different prompt prefixes across {len(answers)} requests")
+    prefix_tokens = sum(count_tokens(m["content"]) for m in answers[0]["messages"][:prefix_messages]) if answers else 0
+    if cacheable and prefix_tokens < args.cache_min_tokens:
+        failures.append(f"the shared prefix is {prefix_tokens} tokens, below the {args.cache_min_tokens}-token "
+                        f"cache minimum")
+    excerpt_prompts = sum(1 for r in answers if any(m["role"] == "system" and m["content"].startswith(EXCERPT_INTRO)
+                                                     for m in r["messages"]))
+    if excerpts and excerpt_prompts != len(answers):
+        failures.append(f"only {excerpt_prompts} of {len(answers)} prompts used excerpts")
+    for request, question in zip(answers, asked):
+        last = request["messages"][-1]
+        if last != {"role": "user", "content": question}:
+            failures.append(f"last message is not the bare question: {last}")
+        if any(question in m["content"] for m in request["messages"][:prefix_messages]):
+            failures.append("the question appears inside the cached prefix")
+
+    rows = [row for row in youtube_qa.interactions.iter_rows() if row["participant_id"] == "prefix-check"]
+    uncached = [row for row in rows[1:] if not row["cached_tokens"]]
+    if len(rows) != len(asked):
+        failures.append(f"expected {len(asked)} logged interactions, found {len(rows)}")
+    if cacheable and uncached:
+        failures.append(f"{len(uncached)} repeat request(s) logged without cached tokens")
+
+    stats = fake.stats.snapshot()
+    fake.shutdown()
+    ratio = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    print(f"{len(answers)} answer requests ({excerpt_prompts} with excerpts), {len(prefixes)} distinct prefix(es) "
+          f"of {prefix_tokens} tokens, {stats['cached_tokens']}/{stats['prompt_tokens']} prompt tokens cached "
+          f"({ratio:.0%}), {stats['prompt_tokens'] - stats['cached_tokens']} uncached")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: prompt prefix is stable across questions and sessions")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+One-command offline benchmark: starts the fake OpenAI server, runs the app
+with stub backends in a fresh scratch directory (so every run starts with
+empty caches), drives it with bench.load and writes the results as JSON.
+
+    python -m bench.run --students 50 --questions 5
+    python -m bench.run --server gunicorn --workers 2 --compare bench/results/<earlier>.json
+
+Any other app setting (rate limits, cache sizes, ...) can be set in the
+environment as usual; it is passed through to the server.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench import fake_openai, load
+from bench.stubs import REPO_ROOT
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_command(args, port):
+    if args.server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "bench.stubbed_app:app", "--bind", f"127.0.0.1:{port}",
+                "--workers", str(args.workers), "--threads", str(args.threads), "--timeout", "300"]
+    return [sys.executable, "-m", "uvicorn", "bench.stubbed_app:application", "--host", "127.0.0.1",
+            "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"]
+
+
+def wait_until_up(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/login", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    raise RuntimeError(f"Server did not start within {timeout}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test with fake OpenAI, yt-dlp and AssemblyAI.")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8, help="Threads per gunicorn worker")
+    parser.add_argument("--download-seconds", type=float, default=2.0, help="Stub download time per video")
+    parser.add_argument("--transcribe-seconds", type=float, default=5.0, help="Stub transcription time per video")
+    parser.add_argument("--captions", action="store_true", help="Serve the fixture as captions instead of ASR")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the scratch directory for inspection")
+    fake_openai.add_arguments(parser)
+    load.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    fake = fake_openai.FakeOpenAIServer(("127.0.0.1", free_port()), fake_openai.config_from_args(args))
+    openai_url = fake.start()
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    port = free_port()
+    args.base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")])),
+        OPENAI_BASE_URL=openai_url,
+        OPENAI_API_KEY="sk-bench",
+        ASSEMBLYAI_API_KEY="bench",
+        AUTH_USERNAME=args.username,
+        AUTH_PASSWORD=args.password,
+        SECRET_KEY="bench",
+        OFFLINE_MODE="0",
+        DATA_DIR=os.path.join(workdir, "data"),
+        WEB_CONCURRENCY=str(args.workers),
+        BENCH_DOWNLOAD_SECONDS=str(args.download_seconds),
+        BENCH_TRANSCRIBE_SECONDS=str(args.transcribe_seconds),
+        BENCH_CAPTIONS="1" if args.captions else "0",
+    )
+    log_path = os.path.join(workdir, "server.log")
+    print(f"Fake OpenAI at {openai_url}; starting {args.server} on {args.base_url} (log: {log_path})")
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(server_command(args, port), cwd=workdir, env=env, stdout=log,
+                                   stderr=subprocess.STDOUT)
+    try:
+        wait_until_up(args.base_url, process)
+        result = asyncio.run(load.run_load(args))
+        result["fake_openai"] = fake.stats.snapshot()
+        load.report(result, args)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        fake.shutdown()
+        if args.keep_workdir:
+            print(f"Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
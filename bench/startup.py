@@ -0,0 +1,173 @@
+"""
+Startup benchmark: how long a fresh worker takes to import the app and to
+serve its first requests, with OFFLINE_MODE on and off.
+
+    python -m bench.startup
+    python -m bench.startup --server gunicorn --runs 5
+
+For each mode it reports
+
+- import time of the server entry point (asgi, or app for gunicorn) in a
+  fresh interpreter, and which heavy dependencies that import pulled in;
+- time from starting the server to its first response (/login);
+- time for the first /load_video of the checked-in fixture and the first
+  /ask_stream answer (first token and complete), which is where the OpenAI
+  client is created.
+
+The server runs in a scratch directory against bench.fake_openai, with a
+copy of the fixture transcript, so nothing is downloaded or transcribed.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench import fake_openai
+from bench.run import free_port
+from bench.stubs import FIXTURE_TRANSCRIPT, FIXTURE_VIDEO_ID, REPO_ROOT
+
+HEAVY_MODULES = ("yt_dlp", "assemblyai", "openai", "httpx", "tiktoken")
+
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, env, cwd, runs):
+    samples, loaded = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                             cwd=cwd, env=env, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded = result["loaded"]
+    return {"median_seconds": statistics.median(samples), "min_seconds": min(samples), "loaded": loaded}
+
+
+def server_command(server, port):
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "app:app", "--preload", "--bind", f"127.0.0.1:{port}",
+                "--workers", "1", "--threads", "4"]
+    return [sys.executable, "-m", "uvicorn", "asgi:application", "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning"]
+
+
+def first_requests(base_url, process, timeout=60):
+    """Seconds from launch to the first response, then for the first load and answer."""
+    launched = time.monotonic()
+    timings = {}
+    with httpx.Client(base_url=base_url, timeout=timeout) as client:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            if time.monotonic() - launched > timeout:
+                raise RuntimeError(f"Server did not start within {timeout}s")
+            try:
+                client.get("/login")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.02)
+        timings["first_response_seconds"] = time.monotonic() - launched
+
+        client.post("/login", data={"username": "bench", "password": "bench"})
+        url = f"https://www.youtube.com/watch?v={FIXTURE_VIDEO_ID}"
+        started = time.monotonic()
+        with client.stream("POST", "/load_video", json={"youtube_url": url}) as r:
+            body = "".join(r.iter_text())
+        if "done" not in body:
+            raise RuntimeError(f"/load_video did not finish: {body[-200:]}")
+        timings["first_load_video_seconds"] = time.monotonic() - started
+
+        started, first_token = time.monotonic(), None
+        params = {"youtube_url": url, "question": "What is this video about?", "no_cache": "1"}
+        with client.stream("GET", "/ask_stream", params=params) as r:
+            for line in r.iter_lines():
+                if first_token is None and line.startswith("data: ") and line != "data: [DONE]":
+                    first_token = time.monotonic() - started
+        timings["first_answer_ttft_seconds"] = first_token
+        timings["first_answer_seconds"] = time.monotonic() - started
+    timings["launch_to_first_answer_seconds"] = time.monotonic() - launched
+    return timings
+
+
+def run_mode(args, offline, openai_url):
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    os.makedirs(os.path.join(workdir, "transcript_cache"))
+    shutil.copyfile(FIXTURE_TRANSCRIPT, os.path.join(workdir, "transcript_cache", f"{FIXTURE_VIDEO_ID}.json"))
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")])),
+        OPENAI_BASE_URL=openai_url, OPENAI_API_KEY="sk-bench", ASSEMBLYAI_API_KEY="bench",
+        AUTH_USERNAME="bench", AUTH_PASSWORD="bench", SECRET_KEY="bench",
+        OFFLINE_MODE="1" if offline else "0", DATA_DIR=os.path.join(workdir, "data"),
+        PRELOAD_DEPENDENCIES="1" if args.preload_dependencies else "0",
+    )
+    module = "app" if args.server == "gunicorn" else "asgi"
+    result = {"offline_mode": offline, "import": measure_import(module, env, workdir, args.runs)}
+    port = free_port()
+    with open(os.path.join(workdir, "server.log"), "w") as log:
+        process = subprocess.Popen(server_command(args.server, port), cwd=workdir, env=env, stdout=log,
+                                   stderr=subprocess.STDOUT)
+    try:
+        result.update(first_requests(f"http://127.0.0.1:{port}", process))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def report(results):
+    for r in results:
+        mode = "offline" if r["offline_mode"] else "online"
+        imp = r["import"]
+        print(f"{mode:8} import {imp['median_seconds'] * 1000:6.0f} ms (min {imp['min_seconds'] * 1000:.0f}), "
+              f"loaded: {', '.join(imp['loaded']) or 'none'}")
+        print(f"{'':8} first response {r['first_response_seconds'] * 1000:6.0f} ms after launch, "
+              f"first load_video {r['first_load_video_seconds'] * 1000:.0f} ms, "
+              f"first answer ttft {r['first_answer_ttft_seconds'] * 1000:.0f} ms / "
+              f"total {r['first_answer_seconds'] * 1000:.0f} ms "
+              f"(launch to answer {r['launch_to_first_answer_seconds'] * 1000:.0f} ms)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time and time to first request.")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per import measurement")
+    parser.add_argument("--modes", choices=("both", "offline", "online"), default="both")
+    parser.add_argument("--preload-dependencies", action="store_true",
+                        help="Set PRELOAD_DEPENDENCIES=1 (import client libraries at startup, not in the background)")
+    parser.add_argument("--out", help="Also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    fake = fake_openai.FakeOpenAIServer(("127.0.0.1", 0), fake_openai.FakeOpenAIConfig(
+        ttft_ms=0, tokens_per_second=10000, completion_tokens=20, jitter=0))
+    openai_url = fake.start()
+    modes = {"both": (True, False), "offline": (True,), "online": (False,)}[args.modes]
+    try:
+        results = [run_mode(args, offline, openai_url) for offline in modes]
+    finally:
+        fake.shutdown()
+    report(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"server": args.server, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+"""
+The app with benchmark stubs installed, for the load driver to run against:
+
+    uvicorn bench.stubbed_app:application      # ASGI, as deployed
+    gunicorn bench.stubbed_app:app             # WSGI
+
+Stub timings come from BENCH_DOWNLOAD_SECONDS, BENCH_TRANSCRIBE_SECONDS and
+BENCH_CAPTIONS. OPENAI_BASE_URL should point at bench.fake_openai.
+"""
+import os
+
+from asgi import application
+from app import app, youtube_qa
+from bench import stubs
+
+stubs.install(
+    youtube_qa,
+    download_seconds=float(os.getenv("BENCH_DOWNLOAD_SECONDS", "2")),
+    transcribe_seconds=float(os.getenv("BENCH_TRANSCRIBE_SECONDS", "5")),
+    captions=os.getenv("BENCH_CAPTIONS", "0").lower() in ("1", "true", "yes"),
+)
+
+__all__ = ["app", "application"]
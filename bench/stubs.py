@@ -0,0 +1,86 @@
+"""
+Stub caption fetcher, downloader and transcriber for benchmarks.
+
+install() replaces the methods YouTubeQAApp uses to reach YouTube and
+AssemblyAI, so ingestion runs through the real job queue, single-flight
+locks and transcript store while serving the checked-in fixtures for any
+video id.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from types import SimpleNamespace
+
+from transcript_segments import Segments
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_VIDEO_ID = "2gv6mToyztM"
+FIXTURE_AUDIO = os.path.join(REPO_ROOT, "audio_downloads", f"{FIXTURE_VIDEO_ID}.m4a")
+FIXTURE_TRANSCRIPT = os.path.join(REPO_ROOT, "transcript_cache", f"{FIXTURE_VIDEO_ID}.json")
+FIXTURE_DURATION = 300.0
+
+
+def load_fixture_transcript():
+    with open(FIXTURE_TRANSCRIPT) as f:
+        return json.load(f)["transcript"]
+
+
+def fixture_words(transcript):
+    """
+    Word timings for the fixture transcript, spread evenly by character
+    position over FIXTURE_DURATION, so stub ingestion stores timestamped
+    segments like real captions and ASR do.
+    """
+    words, position, total = [], 0, max(1, len(transcript))
+    for word in transcript.split():
+        position = transcript.index(word, position)
+        start = position / total * FIXTURE_DURATION * 1000
+        position += len(word)
+        words.append(SimpleNamespace(text=word, start=int(start), end=int(position / total * FIXTURE_DURATION * 1000)))
+    return words
+
+
+def _progress_steps(progress, kind, seconds, steps=10):
+    for step in range(1, steps + 1):
+        time.sleep(seconds / steps)
+        if progress:
+            progress((kind, step * 100 // steps))
+
+
+def install(qa_app, download_seconds=2.0, transcribe_seconds=5.0, captions=False):
+    """
+    Point qa_app at the fixtures. With captions=True the caption fetch
+    succeeds (after download_seconds) and no audio is downloaded.
+    """
+    transcript = load_fixture_transcript()
+    words = fixture_words(transcript)
+
+    def get_captions(video_url):
+        if not captions:
+            return None
+        time.sleep(download_seconds)
+        return Segments.from_words(words), "captions:manual", FIXTURE_DURATION
+
+    def download_audio(video_url, progress=None, info=None):
+        video_id = qa_app.extract_video_id(video_url)
+        _progress_steps(progress, "download", download_seconds)
+        os.makedirs(qa_app.download_dir, exist_ok=True)
+        path = os.path.join(qa_app.download_dir, f"{video_id}.m4a")
+        shutil.copyfile(FIXTURE_AUDIO, path)
+        if info is not None:
+            info["duration"] = FIXTURE_DURATION
+        return path
+
+    def transcribe_audio(audio_file, progress, duration=None):
+        _progress_steps(progress, "transcribe", transcribe_seconds)
+        return SimpleNamespace(text=transcript, words=words)
+
+    qa_app.get_captions = get_captions
+    qa_app.download_audio = download_audio
+    qa_app.transcribe_audio = transcribe_audio
+    logger.info(f"Benchmark stubs installed (download {download_seconds}s, transcribe {transcribe_seconds}s, "
+                f"captions={captions})")
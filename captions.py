@@ -0,0 +1,123 @@
+import html
+import logging
+import re
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+# Preferred subtitle formats, best first. srv3 carries per-word timing without
+# the rolling duplicate lines that YouTube puts in auto-generated VTT.
+FORMAT_PREFERENCE = ("srv3", "vtt")
+
+_VTT_TIMING_RE = re.compile(r"^((?:\d+:)?\d{2}:\d{2}\.\d{3})\s+-->\s+((?:\d+:)?\d{2}:\d{2}\.\d{3})")
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _vtt_seconds(stamp):
+    seconds = 0.0
+    for part in stamp.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def _clean(text):
+    return _SPACE_RE.sub(" ", html.unescape(_TAG_RE.sub("", text))).strip()
+
+
+def parse_vtt(content, rolling=False):
+    """
+    Parse WebVTT into (start_seconds, end_seconds, text) segments.
+
+    YouTube's auto-generated VTT repeats the previous caption line at the top
+    of each cue so it scrolls on screen; with rolling=True (for auto tracks),
+    lines already emitted are dropped so every spoken phrase appears once.
+    Uploaded captions keep every line, including speech that really repeats.
+    """
+    segments = []
+    previous_lines = []
+    blocks = re.split(r"\r?\n\r?\n", content.strip())
+    for block in blocks:
+        lines = block.splitlines()
+        for i, line in enumerate(lines):
+            match = _VTT_TIMING_RE.match(line.strip())
+            if match:
+                break
+        else:
+            continue  # header, NOTE or STYLE block
+        start, end = _vtt_seconds(match.group(1)), _vtt_seconds(match.group(2))
+        text_lines = [_clean(l) for l in lines[i + 1:]]
+        text_lines = [l for l in text_lines if l]
+        new_lines = [l for l in text_lines if l not in previous_lines] if rolling else text_lines
+        if text_lines:
+            previous_lines = text_lines
+        if new_lines:
+            segments.append((start, end, " ".join(new_lines)))
+    return segments
+
+
+def parse_srv3(content):
+    """Parse YouTube's srv3 (timedtext format 3) XML into (start_seconds, end_seconds, text) segments."""
+    root = ET.fromstring(content)
+    segments = []
+    for p in root.iter("p"):
+        text = _clean("".join(p.itertext()))
+        if not text:
+            continue  # auto captions use empty <p> elements as line breaks
+        start = int(p.get("t", 0)) / 1000.0
+        end = start + int(p.get("d", 0)) / 1000.0
+        segments.append((start, end, text))
+    return segments
+
+
+def parse_captions(content, ext, auto=False):
+    if ext == "srv3":
+        return parse_srv3(content)
+    if ext == "vtt":
+        return parse_vtt(content, rolling=auto)
+    raise ValueError(f"Unsupported caption format: {ext}")
+
+
+def segments_to_text(segments):
+    return _SPACE_RE.sub(" ", " ".join(text for _, _, text in segments)).strip()
+
+
+def _pick_track(tracks, languages):
+    """Choose the best (language, format entry) from a yt-dlp subtitles mapping."""
+    for lang in languages:
+        candidates = sorted((code for code in tracks if code == lang or code.startswith(lang + "-")),
+                            key=lambda code: code != lang)
+        for code in candidates:
+            by_ext = {entry.get("ext"): entry for entry in tracks[code]}
+            for ext in FORMAT_PREFERENCE:
+                if ext in by_ext:
+                    return code, by_ext[ext]
+    return None, None
+
+
+def fetch_captions(video_url, ydl_opts, languages=("en",), min_words=50):
+    """
+    Fetch and parse the best caption track for video_url without downloading media.
+
+    Uploaded captions are preferred over auto-generated ones. Returns
+    (segments, source) where source is "captions:manual" or "captions:auto",
+    or None if no usable track exists.
+    """
+    import yt_dlp
+
+    opts = {**ydl_opts, 'skip_download': True, 'writesubtitles': True, 'writeautomaticsub': True}
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(video_url, download=False)
+        for kind, tracks in (("manual", info.get("subtitles") or {}), ("auto", info.get("automatic_captions") or {})):
+            lang, entry = _pick_track(tracks, languages)
+            if entry is None:
+                continue
+            content = ydl.urlopen(entry["url"]).read().decode("utf-8")
+            segments = parse_captions(content, entry["ext"], auto=kind == "auto")
+            words = len(segments_to_text(segments).split())
+            if words < min_words:
+                logger.info(f"Ignoring {kind} {lang} captions with only {words} words")
+                continue
+            logger.info(f"Using {kind} {lang} captions ({entry['ext']}, {len(segments)} segments, {words} words)")
+            return segments, f"captions:{kind}"
+    return None
@@ -0,0 +1,228 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from transcript_segments import Segments
+
+logger = logging.getLogger(__name__)
+
+_WORD_NORMALISE_RE = re.compile(r"[^\w']+")
+
+
+def plan_segments(duration_ms, segment_ms, overlap_ms):
+    """Return (start_ms, end_ms) windows covering duration_ms, each overlapping the previous by overlap_ms."""
+    if duration_ms <= segment_ms:
+        return [(0, duration_ms)]
+    step = segment_ms - overlap_ms
+    segments, start = [], 0
+    while start < duration_ms:
+        end = min(start + segment_ms, duration_ms)
+        segments.append((start, end))
+        if end >= duration_ms:
+            break
+        start += step
+    return segments
+
+
+def _normalise(word):
+    return _WORD_NORMALISE_RE.sub("", word.lower())
+
+
+def _same_word(left_word, right_word, cut_left=False, cut_right=False):
+    """
+    Whether two normalised words are the same, allowing the word at a cut to
+    be clipped: the end of left's last word (cut_left) or the start of
+    right's first word (cut_right) may be missing.
+    """
+    if left_word == right_word:
+        return True
+    if cut_left and left_word and right_word.startswith(left_word):
+        return True
+    return bool(cut_right and right_word and left_word.endswith(right_word))
+
+
+def _overlap_length(left, right, max_words, min_words=3, max_skip=2):
+    """
+    Find where `right` starts repeating the tail of `left`. Words next to a
+    cut are often garbled or clipped, so up to max_skip words at the end of
+    left and the start of right may be ignored when aligning, and the words
+    right at the cut may be partial. Returns (drop_left, drop_right): the
+    garbled words to drop from the end of left, which right has in full, and
+    the number of words to drop from the start of right.
+    """
+    left_norm = [_normalise(w) for w in left[-(max_words + max_skip):]]
+    right_norm = [_normalise(w) for w in right[:max_words + max_skip]]
+    for k in range(min(max_words, len(left_norm), len(right_norm)), min_words - 1, -1):
+        for skip_left in range(max_skip + 1):
+            end = len(left_norm) - skip_left
+            if end - k < 0:
+                continue
+            tail = left_norm[end - k:end]
+            for skip_right in range(max_skip + 1):
+                candidate = right_norm[skip_right:skip_right + k]
+                if len(candidate) < k:
+                    continue
+                if all(_same_word(a, b, cut_left=j == k - 1 and not skip_left, cut_right=j == 0 and not skip_right)
+                       for j, (a, b) in enumerate(zip(tail, candidate))):
+                    if not skip_left and tail[-1] != candidate[-1] and candidate[-1].startswith(tail[-1]):
+                        # left's last word was clipped; keep right's full one
+                        return 1, skip_right + k - 1
+                    return skip_left, skip_right + k
+    return 0, 0
+
+
+def stitch_pieces(texts, max_overlap_words=80):
+    """Per-segment transcripts with the words repeated from the previous segment removed."""
+    words, pieces = [], []
+    for text in texts:
+        segment_words = text.split()
+        if words:
+            drop_left, drop_right = _overlap_length(words, segment_words, max_overlap_words)
+            segment_words = segment_words[drop_right:]
+            # The dropped words are at the end of the last non-empty pieces
+            for _ in range(drop_left):
+                words.pop()
+                pieces[max(i for i, piece in enumerate(pieces) if piece)].pop()
+        words.extend(segment_words)
+        pieces.append(segment_words)
+    return [" ".join(piece) for piece in pieces]
+
+
+def stitch(texts, max_overlap_words=80):
+    """Join per-segment transcripts, removing the words repeated by overlapping segments."""
+    return " ".join(piece for piece in stitch_pieces(texts, max_overlap_words) if piece)
+
+
+class ChunkedTranscriber:
+    """
+    Transcribe long audio as overlapping segments in parallel.
+
+    `transcriber` is anything with a blocking transcribe(path) returning an
+    object with `status`, `text` and `error` (an assemblyai.Transcriber, or a
+    local stub). Segments are cut from the file with ffmpeg seeks, one per
+    worker at a time, so the audio is never decoded into memory. Finished
+    segment transcripts are cached under cache_dir, so after a failure only
+    the missing segments are sent again.
+    """
+
+    def __init__(self, transcriber, cache_dir, segment_seconds=600, overlap_seconds=10, max_workers=4,
+                 export_format=None):
+        self.transcriber = transcriber
+        self.cache_dir = cache_dir
+        self.segment_ms = int(segment_seconds * 1000)
+        self.overlap_ms = int(overlap_seconds * 1000)
+        self.max_workers = max_workers
+        # None copies the audio stream into the source's container without re-encoding
+        self.export_format = export_format
+
+    def _segment_cache_path(self, key, start_ms, end_ms):
+        return os.path.join(self.cache_dir, key, f"seg-{start_ms:010d}-{end_ms:010d}.txt")
+
+    def _read_cached(self, path):
+        try:
+            with open(path, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_cached(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _run(command):
+        try:
+            return subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        except FileNotFoundError:
+            raise RuntimeError(f"{command[0]} is required for chunked transcription")
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"{command[0]} failed: {e.stderr.strip()[-500:]}")
+
+    def probe_duration_ms(self, audio_file):
+        """Duration of audio_file from its container metadata (ffprobe), without decoding it."""
+        out = self._run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", audio_file])
+        return int(float(out.strip()) * 1000)
+
+    def segment_path(self, work_dir, index, audio_file):
+        ext = self.export_format or os.path.splitext(audio_file)[1].lstrip(".") or "m4a"
+        return os.path.join(work_dir, f"{index:04d}.{ext}")
+
+    def cut(self, audio_file, start_ms, end_ms, path):
+        """Write [start_ms, end_ms) of audio_file to path; ffmpeg seeks to the start instead of decoding up to it."""
+        codec = ["-c:a", "copy"] if self.export_format is None else []
+        self._run(["ffmpeg", "-v", "error", "-nostdin", "-y", "-ss", f"{start_ms / 1000:.3f}",
+                   "-t", f"{(end_ms - start_ms) / 1000:.3f}", "-i", audio_file, "-vn", *codec, path])
+
+    def _transcribe_segment(self, audio_file, window, path):
+        self.cut(audio_file, *window, path)
+        try:
+            transcript = self.transcriber.transcribe(path)
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if transcript.status != "completed":
+            raise RuntimeError(getattr(transcript, "error", None) or f"status {transcript.status}")
+        return transcript.text or ""
+
+    def transcribe(self, audio_file, key, progress=None, duration=None):
+        """
+        Return the stitched transcript of audio_file as Segments, one per
+        audio segment (without its overlap); `key` names its segment cache
+        (the video id). `duration` in seconds, if known, saves probing the file.
+        """
+        progress = progress or (lambda event: None)
+        duration_ms = int(duration * 1000) if duration else self.probe_duration_ms(audio_file)
+        segments = plan_segments(duration_ms, self.segment_ms, self.overlap_ms)
+        texts = [self._read_cached(self._segment_cache_path(key, s, e)) for s, e in segments]
+        missing = [i for i, text in enumerate(texts) if text is None]
+        logger.info(
+            f"Chunked transcription of {key}: {len(segments)} segments, {len(segments) - len(missing)} cached"
+        )
+
+        work_dir = tempfile.mkdtemp(prefix=f"{key}-segments-")
+        try:
+            done = len(segments) - len(missing)
+            progress(('status', f"transcribing {len(segments)} segments"))
+            progress(('transcribe', int(100 * done / len(segments)) if done else 5))
+            failures = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {
+                    pool.submit(self._transcribe_segment, audio_file, segments[i],
+                                self.segment_path(work_dir, i, audio_file)): i
+                    for i in missing
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        texts[i] = future.result()
+                        self._write_cached(self._segment_cache_path(key, *segments[i]), texts[i])
+                        done += 1
+                        progress(('transcribe', min(99, int(100 * done / len(segments)))))
+                    except Exception as e:
+                        logger.error(f"Segment {i} of {key} failed: {e}")
+                        failures.append(i)
+            if failures:
+                raise RuntimeError(f"{len(failures)} of {len(segments)} segments failed; completed segments are cached")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        progress(('transcribe', 100))
+        pieces = stitch_pieces(texts, max_overlap_words=max(20, self.overlap_ms // 250))
+        # Words repeated in the overlap were kept from the previous segment,
+        # so each piece starts roughly where that segment ended
+        timed = [(segments[i - 1][1] if i else start, end, piece)
+                 for i, ((start, end), piece) in enumerate(zip(segments, pieces))]
+        return Segments.from_triples((start / 1000, end / 1000, piece) for start, end, piece in timed)
+
+    def discard(self, key):
+        """Drop cached segments once the full transcript has been stored."""
+        shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
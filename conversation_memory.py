@@ -0,0 +1,178 @@
+import logging
+import os
+import re
+import threading
+
+from retrieval import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Words and openings that refer back to earlier turns ("what about it?", "tell me more").
+# Erring towards follow-up only costs a cache hit; missing one could serve an answer out of context,
+# so personal pronouns ("they", "it", "she") always count, even where the question names what they mean.
+_FOLLOW_UP_OPENING_RE = re.compile(r"^(and|but|so|also|then|what about|how about|ok|okay|why not|really)\b")
+_REFERENCE_RE = re.compile(
+    r"\b(it|its|they|them|their|he|him|his|she|her|this|that|these|those|above|earlier|previous|previously|"
+    r"again|else|more|another|same|further|elaborate|expand|example|examples|you said|you mentioned|you just)\b")
+# "this video", "the speaker" etc. name the video itself, not an earlier answer
+_VIDEO_REFERENCE_RE = re.compile(
+    r"\b(this|that|the) (video|lecture|talk|clip|course|module|presentation|session|speaker|presenter)\b")
+# "that" introducing a clause ("rooms that students can book") and "it" with no referent ("is it possible to",
+# "how long does it take to") don't point back; "this", "these" and "those" always count
+_RELATIVE_THAT_RE = re.compile(
+    r"\bthat (?=(i|you|we|students?|people|staff|the|a|an|can|could|will|would|should|must|are|has|have)\b)")
+_DUMMY_IT_RE = re.compile(
+    r"\bit('s| is| was)? (?=(possible|necessary|important|true|allowed|free|required|worth|easy|hard|take|takes)\b)")
+# Questions made only of these ("why?", "how so?", "like what?") say nothing without the previous answer
+_FUNCTION_WORDS = frozenset(
+    "a an the is are was were be do does did can could would should will i me you we us my your what why how who "
+    "whom when where which ok okay yes no please so and but or then really like such as".split())
+
+
+def looks_like_follow_up(question):
+    """
+    Whether a question seems to lean on the conversation rather than stand on
+    its own: it opens like a continuation, refers back to an earlier turn, or
+    has no content words at all.
+    """
+    words = re.findall(r"[a-z0-9']+", question.lower())
+    if all(word in _FUNCTION_WORDS for word in words):
+        return True
+    text = _VIDEO_REFERENCE_RE.sub(" ", " ".join(words))
+    text = _DUMMY_IT_RE.sub("", _RELATIVE_THAT_RE.sub("", text))
+    return bool(_FOLLOW_UP_OPENING_RE.match(text)) or bool(_REFERENCE_RE.search(text))
+
+
+class ConversationHistory:
+    """
+    One session's conversation about one video: the recent turns verbatim and
+    a rolling summary of the turns that have been folded out of them.
+    """
+
+    def __init__(self, video_id=None):
+        self.video_id = video_id
+        self.turns = []  # (question, answer, tokens), oldest first, not yet summarised
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summarized_turns = 0
+        self.summarizing = False
+        self.lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.turns or self.summary)
+
+
+class ConversationMemory:
+    """
+    Turns a ConversationHistory into chat messages that never exceed
+    history_tokens (counted with tiktoken): the summary, then as many of the
+    most recent turns as fit.
+
+    When the unsummarised turns outgrow the space left next to the summary,
+    the oldest of them are folded into the summary in the background by
+    `summarize(previous_summary, turns)`, until they fill at most half of it.
+    The summary is only regenerated on those folds, not on every question,
+    so prompt size and latency stay flat as a conversation grows.
+
+    With cache_standalone, questions later in a conversation that do not look
+    like follow-ups still use the answer cache; otherwise every question
+    after the first bypasses it.
+    """
+
+    def __init__(self, summarize, history_tokens=1500, summary_tokens=300, cache_standalone=True):
+        self.summarize = summarize
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.cache_standalone = cache_standalone
+
+    @classmethod
+    def from_env(cls, summarize):
+        return cls(
+            summarize,
+            history_tokens=int(os.getenv("CONVERSATION_HISTORY_TOKENS", "1500")),
+            summary_tokens=int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "300")),
+            cache_standalone=os.getenv("ANSWER_CACHE_IN_CONVERSATION", "1").lower() in ("1", "true", "yes"),
+        )
+
+    @property
+    def enabled(self):
+        return self.history_tokens > 0
+
+    @property
+    def window_tokens(self):
+        """Budget for verbatim turns; the rest is reserved for the summary."""
+        return max(0, self.history_tokens - self.summary_tokens)
+
+    def messages(self, history):
+        """Chat messages carrying the conversation so far, within history_tokens."""
+        if not self.enabled:
+            return []
+        with history.lock:
+            summary, summary_tokens = history.summary, history.summary_tokens
+            turns = list(history.turns)
+
+        budget = self.history_tokens
+        recent = []
+        for question, answer, tokens in reversed(turns):
+            # Turns older than this are (or are about to be) in the summary
+            if tokens > budget - summary_tokens:
+                break
+            recent.append((question, answer))
+            budget -= tokens
+
+        messages = []
+        if summary and summary_tokens <= budget:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        for question, answer in reversed(recent):
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def depends_on_history(self, messages, question):
+        """Whether the answer to `question`, asked after `messages`, must bypass the answer cache."""
+        if not messages:
+            return False
+        return not self.cache_standalone or looks_like_follow_up(question)
+
+    def record(self, history, question, answer):
+        """Add a completed turn and start a fold if the verbatim turns no longer fit."""
+        if not self.enabled or not answer:
+            return
+        tokens = count_tokens(question) + count_tokens(answer)
+        with history.lock:
+            history.turns.append((question, answer, tokens))
+            pending = sum(t[2] for t in history.turns)
+            if pending <= self.window_tokens or history.summarizing:
+                return
+            history.summarizing = True
+        threading.Thread(target=self._fold, args=(history,), name="conversation-summary", daemon=True).start()
+
+    def _fold(self, history):
+        with history.lock:
+            previous = history.summary
+            turns = list(history.turns)
+        # Fold the oldest turns until the rest fill at most half the window,
+        # so the next fold is a few turns away rather than on the next question
+        remaining = sum(t[2] for t in turns)
+        count = 0
+        while count < len(turns) and remaining > self.window_tokens // 2:
+            remaining -= turns[count][2]
+            count += 1
+
+        try:
+            summary = self.summarize(previous, [(q, a) for q, a, _ in turns[:count]]).strip()
+        except Exception as e:
+            logger.warning(f"Could not summarise conversation, keeping {len(turns)} turns verbatim: {e}")
+            with history.lock:
+                history.summarizing = False
+            return
+
+        with history.lock:
+            # Turns recorded while the summary was generated stay in place
+            del history.turns[:count]
+            history.summary = summary
+            history.summary_tokens = count_tokens(summary)
+            history.summarized_turns += count
+            history.summarizing = False
+        logger.info(f"Folded {count} turns into the conversation summary ({history.summary_tokens} tokens, "
+                    f"{history.summarized_turns} turns summarised in total)")
@@ -0,0 +1,558 @@
+import atexit
+import csv
+import logging
+import math
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "id", "created_at", "session_id", "participant_id", "work_status", "gender", "video_id", "video_url",
+    "question", "answer", "feedback", "feedback_at", "model", "cache", "error", "latency_ms",
+    "first_token_ms", "prompt_tokens", "completion_tokens", "cached_tokens",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    session_id TEXT,
+    participant_id TEXT,
+    work_status TEXT,
+    gender TEXT,
+    video_id TEXT,
+    video_url TEXT,
+    question TEXT,
+    answer TEXT,
+    feedback TEXT,
+    feedback_at REAL,
+    model TEXT,
+    cache TEXT,
+    error TEXT,
+    latency_ms REAL,
+    first_token_ms REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cached_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS interactions_created_at ON interactions (created_at);
+CREATE INDEX IF NOT EXISTS interactions_participant ON interactions (participant_id, created_at);
+CREATE INDEX IF NOT EXISTS interactions_video ON interactions (video_id, created_at);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day TEXT PRIMARY KEY,
+    questions INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    cached INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    feedback_yes INTEGER NOT NULL DEFAULT 0,
+    feedback_no INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS video_daily_stats (
+    video_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    questions INTEGER NOT NULL DEFAULT 0,
+    feedback_yes INTEGER NOT NULL DEFAULT 0,
+    feedback_no INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (video_id, day)
+);
+CREATE TABLE IF NOT EXISTS latency_histogram (
+    day TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, bucket)
+);
+"""
+
+# Columns added after the first release, created on startup in older databases
+_ADDED_COLUMNS = (
+    ("interactions", "cached_tokens", "INTEGER"),
+    ("daily_stats", "cached_tokens", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# Bump when the aggregate definitions change; they are then rebuilt on startup
+AGGREGATES_VERSION = "2"
+
+# Latency histogram buckets grow by 5%, so percentiles are within ~5%
+_LATENCY_BASE = 1.05
+
+_INSERT = f"INSERT INTO interactions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)}) "
+_FEEDBACK_COLUMNS = ("feedback", "feedback_at")
+
+# Interactions overwrite whatever is known about the row; feedback only sets
+# the feedback columns and fills in fields that are still missing.
+_UPSERT_INTERACTION = _INSERT + "ON CONFLICT(id) DO UPDATE SET " + ", ".join(
+    f"{c} = COALESCE(excluded.{c}, interactions.{c})" for c in COLUMNS if c not in ("id", "created_at")
+)
+_UPSERT_FEEDBACK = _INSERT + "ON CONFLICT(id) DO UPDATE SET " + ", ".join(
+    f"{c} = excluded.{c}" if c in _FEEDBACK_COLUMNS else f"{c} = COALESCE(interactions.{c}, excluded.{c})"
+    for c in COLUMNS if c not in ("id", "created_at")
+)
+
+_STOP = object()
+
+
+def day_of(timestamp):
+    """UTC calendar day used for aggregates and date filters."""
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp or 0))
+
+
+def latency_bucket(ms):
+    return int(math.log(max(ms, 1.0), _LATENCY_BASE))
+
+
+def bucket_upper_ms(bucket):
+    return _LATENCY_BASE ** (bucket + 1)
+
+
+def _contributions(row):
+    """What one interaction row adds to each aggregate table: {(table, key): {column: amount}}."""
+    if row is None or not row["question"]:
+        return {}
+    day = day_of(row["created_at"])
+    feedback = (row["feedback"] or "").lower()
+    yes, no = int(feedback == "yes"), int(feedback == "no")
+    daily = {
+        "questions": 1,
+        "errors": int(bool(row["error"])),
+        "cached": int(bool(row["cache"])),
+        "prompt_tokens": row["prompt_tokens"] or 0,
+        "completion_tokens": row["completion_tokens"] or 0,
+        "cached_tokens": row["cached_tokens"] or 0,
+        "feedback_yes": yes,
+        "feedback_no": no,
+    }
+    contributions = {
+        ("daily_stats", (day,)): daily,
+        ("video_daily_stats", (row["video_id"] or "", day)): {"questions": 1, "feedback_yes": yes, "feedback_no": no},
+    }
+    if row["latency_ms"] is not None and not row["error"]:
+        contributions[("latency_histogram", (day, latency_bucket(row["latency_ms"])))] = {"count": 1}
+    return contributions
+
+
+_AGGREGATE_KEYS = {
+    "daily_stats": ("day",),
+    "video_daily_stats": ("video_id", "day"),
+    "latency_histogram": ("day", "bucket"),
+}
+
+
+def _apply_delta(conn, before, after):
+    """Move the aggregates from reflecting row `before` to reflecting row `after`."""
+    old, new = _contributions(before), _contributions(after)
+    for target in old.keys() | new.keys():
+        columns = old.get(target) or new.get(target)
+        deltas = {c: new.get(target, {}).get(c, 0) - old.get(target, {}).get(c, 0) for c in columns}
+        if not any(deltas.values()):
+            continue
+        table, key = target
+        names = _AGGREGATE_KEYS[table] + tuple(deltas)
+        conn.execute(
+            f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)}) "
+            f"ON CONFLICT({', '.join(_AGGREGATE_KEYS[table])}) DO UPDATE SET "
+            + ", ".join(f"{c} = {c} + excluded.{c}" for c in deltas),
+            key + tuple(deltas.values()),
+        )
+
+
+def _where(start=None, end=None, video_id=None, participant_id=None):
+    """SQL filter on the indexed interaction columns; start/end are epoch seconds (end exclusive)."""
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("created_at >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("created_at < ?")
+        params.append(end)
+    if video_id:
+        clauses.append("video_id = ?")
+        params.append(video_id)
+    if participant_id:
+        clauses.append("participant_id = ?")
+        params.append(participant_id)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def _percentile(histogram, fraction):
+    """Approximate percentile from sorted (bucket, count) pairs."""
+    total = sum(count for _, count in histogram)
+    if not total:
+        return None
+    threshold, seen = fraction * total, 0
+    for bucket, count in histogram:
+        seen += count
+        if seen >= threshold:
+            return round(bucket_upper_ms(bucket), 1)
+    return round(bucket_upper_ms(histogram[-1][0]), 1)
+
+
+class InteractionLog:
+    """
+    Question/answer/feedback log in a WAL-mode SQLite database.
+
+    Request threads only put records on an in-memory queue; one background
+    thread writes them in batches (every flush_interval seconds or
+    batch_size records, whichever comes first). The queue is drained on
+    interpreter exit. Every process writes to the same database, and SQLite's
+    locking serialises their transactions.
+
+    Per-day and per-video aggregates are updated in the same transaction as
+    each row, so analytics never have to scan the interactions table.
+    """
+
+    def __init__(self, db_path, flush_interval=1.0, batch_size=200, max_queue=10000, max_archives=5):
+        self.db_path = db_path
+        self.max_archives = max_archives
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+        self._setup_lock = threading.Lock()
+        self._ready = False
+
+    @classmethod
+    def from_env(cls, db_path):
+        return cls(
+            db_path,
+            flush_interval=float(os.getenv("INTERACTION_LOG_FLUSH_SECONDS", "1")),
+            batch_size=int(os.getenv("INTERACTION_LOG_BATCH_SIZE", "200")),
+            max_archives=int(os.getenv("INTERACTION_LOG_ARCHIVES", "5")),
+        )
+
+    def setup(self):
+        """
+        Create or migrate the database and rebuild stale aggregates; done on
+        first use, or up front by the app's start().
+        """
+        if self._ready:
+            return
+        with self._setup_lock:
+            if self._ready:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = self._open()
+            try:
+                conn.executescript(_SCHEMA)
+                conn.execute("BEGIN IMMEDIATE")
+                for table, column, definition in _ADDED_COLUMNS:
+                    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                version = conn.execute("SELECT value FROM meta WHERE key = 'aggregates_version'").fetchone()
+                if version is None or version[0] != AGGREGATES_VERSION:
+                    self._rebuild_aggregates(conn)
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+            self._ready = True
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connect(self):
+        self.setup()
+        return self._open()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._writer, name="interaction-log-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def after_fork(self):
+        """In a forked child, start with an empty queue; records queued before the fork are the parent's to write."""
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def close(self, timeout=10.0):
+        """Write everything still queued and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    # Producers
+
+    def _enqueue(self, statement, fields):
+        self.start()
+        fields.setdefault("created_at", time.time())
+        try:
+            self._queue.put_nowait((statement, tuple(fields.get(c) for c in COLUMNS)))
+        except queue.Full:
+            # Never block a request on logging; count what we had to drop
+            self.dropped += 1
+            logger.error("Interaction log queue is full; dropping a record")
+
+    def log_interaction(self, **fields):
+        """Record (or update) an interaction row; fields are a subset of COLUMNS and must include id."""
+        self._enqueue(_UPSERT_INTERACTION, fields)
+
+    def log_feedback(self, interaction_id, feedback, **fallback):
+        """
+        Attach feedback to an interaction. `fallback` fields are only used if
+        no row with this id exists yet (e.g. it was answered elsewhere).
+        """
+        self._enqueue(_UPSERT_FEEDBACK, dict(fallback, id=interaction_id, feedback=feedback, feedback_at=time.time()))
+
+    # Writer
+
+    def _writer(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch, stop = [], False
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is _STOP:
+                        stop = True
+                    else:
+                        batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._write(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        for attempt in range(3):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for statement, params in batch:
+                    self._upsert(conn, statement, params)
+                conn.execute("COMMIT")
+                return
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.warning(f"Interaction log write failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.5 * (attempt + 1))
+        logger.error(f"Dropping {len(batch)} interaction log record(s) after repeated write failures")
+
+    @staticmethod
+    def _upsert(conn, statement, params):
+        select = f"SELECT {', '.join(COLUMNS)} FROM interactions WHERE id = ?"
+        before = conn.execute(select, (params[0],)).fetchone()
+        conn.execute(statement, params)
+        _apply_delta(conn, before, conn.execute(select, (params[0],)).fetchone())
+
+    @staticmethod
+    def _rebuild_aggregates(conn):
+        logger.info("Rebuilding interaction aggregates")
+        for table in _AGGREGATE_KEYS:
+            conn.execute(f"DELETE FROM {table}")
+        for row in conn.execute(f"SELECT {', '.join(COLUMNS)} FROM interactions"):
+            _apply_delta(conn, None, row)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('aggregates_version', ?)",
+                     (AGGREGATES_VERSION,))
+
+    # Readers
+
+    def iter_rows(self, start=None, end=None, video_id=None, participant_id=None, batch_size=500):
+        """Yield matching interactions oldest first as dicts, reading in batches."""
+        where, params = _where(start, end, video_id, participant_id)
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM interactions{where} ORDER BY created_at", params
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+
+    def import_csv(self, csv_path, video_id_of=None):
+        """
+        One-off import of the legacy qa_feedback_log.csv, skipped if already
+        done. The CSV has no video id column; video_id_of(video_url) supplies it.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'csv_imported'").fetchone():
+                if video_id_of:
+                    self._backfill_video_ids(conn, video_id_of)
+                conn.execute("COMMIT")
+                return 0
+            count = 0
+            with open(csv_path, newline="") as f:
+                for i, row in enumerate(csv.DictReader(f)):
+                    try:
+                        created = datetime.strptime(row["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+                    except (KeyError, ValueError):
+                        created = 0.0
+                    record = {
+                        "id": f"csv-{i}", "created_at": created, "participant_id": row.get("participant_id"),
+                        "work_status": row.get("work_status"), "gender": row.get("gender"),
+                        "video_url": row.get("video_url"),
+                        "video_id": video_id_of(row["video_url"]) if video_id_of and row.get("video_url") else None,
+                        "question": row.get("question"),
+                        "answer": row.get("answer"), "feedback": row.get("feedback"),
+                    }
+                    self._upsert(conn, _UPSERT_INTERACTION, tuple(record.get(c) for c in COLUMNS))
+                    count += 1
+            conn.execute("INSERT INTO meta (key, value) VALUES ('csv_imported', ?)", (str(time.time()),))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        logger.info(f"Imported {count} row(s) from {csv_path}")
+        return count
+
+    def _backfill_video_ids(self, conn, video_id_of):
+        """Video ids for CSV rows imported before they were derived from video_url."""
+        rows = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM interactions "
+            "WHERE id LIKE 'csv-%' AND video_id IS NULL AND COALESCE(video_url, '') != ''"
+        ).fetchall()
+        count = 0
+        for row in rows:
+            video_id = video_id_of(row["video_url"])
+            if video_id:
+                record = {**dict(row), "video_id": video_id}
+                self._upsert(conn, _UPSERT_INTERACTION, tuple(record[c] for c in COLUMNS))
+                count += 1
+        if count:
+            logger.info(f"Filled in video ids for {count} imported CSV row(s)")
+
+    def analytics(self, start_day=None, end_day=None, top_videos=50):
+        """
+        Summary for the admin dashboard, read from the aggregate tables only.
+        start_day/end_day are inclusive "YYYY-MM-DD" strings (UTC).
+        """
+        clauses, params = [], []
+        if start_day:
+            clauses.append("day >= ?")
+            params.append(start_day)
+        if end_day:
+            clauses.append("day <= ?")
+            params.append(end_day)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+        conn = self._connect()
+        try:
+            days = [dict(row) for row in conn.execute(f"SELECT * FROM daily_stats{where} ORDER BY day", params)]
+            videos = [dict(row) for row in conn.execute(
+                "SELECT video_id, SUM(questions) AS questions, SUM(feedback_yes) AS feedback_yes, "
+                f"SUM(feedback_no) AS feedback_no FROM video_daily_stats{where} "
+                "GROUP BY video_id ORDER BY questions DESC LIMIT ?", params + [top_videos])]
+            histogram = conn.execute(
+                f"SELECT bucket, SUM(count) FROM latency_histogram{where} GROUP BY bucket ORDER BY bucket", params
+            ).fetchall()
+        finally:
+            conn.close()
+
+        totals = {key: sum(day[key] for day in days) for key in
+                  ("questions", "errors", "cached", "prompt_tokens", "completion_tokens", "cached_tokens",
+                   "feedback_yes", "feedback_no")}
+        rated = totals["feedback_yes"] + totals["feedback_no"]
+        for video in videos:
+            video_rated = video["feedback_yes"] + video["feedback_no"]
+            video["feedback_ratio"] = video["feedback_yes"] / video_rated if video_rated else None
+        histogram = [tuple(row) for row in histogram]
+        return {
+            "totals": totals,
+            "feedback_ratio": totals["feedback_yes"] / rated if rated else None,
+            # Share of prompt tokens served from OpenAI's prompt cache
+            "prompt_cache_ratio": totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else None,
+            "latency_ms": {"p50": _percentile(histogram, 0.50), "p95": _percentile(histogram, 0.95)},
+            "videos": videos,
+            "days": days,
+        }
+
+    def archives(self):
+        """Paths of the archives written by archive_and_reset(), oldest first."""
+        root, ext = os.path.splitext(self.db_path)
+        directory, prefix = os.path.split(root)
+        if not os.path.isdir(directory or "."):
+            return []
+        pattern = re.compile(re.escape(prefix) + r"-(\d{8}-\d{6}(?:-\d{6})?)" + re.escape(ext) + "$")
+        stamps = []
+        for name in os.listdir(directory or "."):
+            match = pattern.match(name)
+            if match:
+                stamps.append((match.group(1), os.path.join(directory, name)))
+        return [path for _, path in sorted(stamps)]
+
+    def _backup(self, archive_path):
+        source = self._connect()
+        archive = sqlite3.connect(archive_path)
+        try:
+            source.backup(archive)
+        finally:
+            archive.close()
+            source.close()
+
+    def archive_and_reset(self):
+        """
+        Copy the database to a timestamped file next to it, then empty the log
+        and its aggregates. Only the newest max_archives copies are kept; with
+        max_archives=0 nothing is archived and None is returned.
+        """
+        archive_path = None
+        if self.max_archives > 0:
+            root, ext = os.path.splitext(self.db_path)
+            archive_path = f"{root}-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        conn = self._connect()
+        try:
+            # Hold the write lock from the copy to the delete, so rows the writers commit in between are not lost.
+            # The copy is read through a second connection, which WAL lets read while this one holds the lock.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if archive_path:
+                    self._backup(archive_path)
+                conn.execute("DELETE FROM interactions")
+                for table in _AGGREGATE_KEYS:
+                    conn.execute(f"DELETE FROM {table}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        if archive_path is None:
+            logger.info("Interaction log reset without archiving")
+            return None
+        for old_path in self.archives()[:-self.max_archives]:
+            os.remove(old_path)
+            logger.info(f"Removed old interaction log archive {old_path}")
+        logger.info(f"Interaction log archived to {archive_path} and reset")
+        return archive_path
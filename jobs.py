@@ -0,0 +1,461 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from progress import ProgressChannel
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    worker TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, run_after);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs (kind, key) WHERE status IN ('queued', 'running');
+CREATE TABLE IF NOT EXISTS job_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq);
+"""
+
+
+class RetryableJobError(Exception):
+    """Raised by a job handler when the job may succeed if run again later."""
+
+
+class JobQueue:
+    """
+    Persistent job queue in SQLite with a pool of worker threads.
+
+    The database lives on the disk shared by all gunicorn workers, so every
+    process can submit, claim, poll and stream any job. At most one job per
+    (kind, key) is queued or running at a time; submitting a duplicate
+    returns the existing job. Failed attempts that raise RetryableJobError
+    are re-queued with exponential backoff up to max_attempts.
+    """
+
+    def __init__(self, db_path, handlers, workers=2, max_attempts=3, retry_backoff=5.0,
+                 poll_interval=1.0, stale_after=600.0, retention=7 * 24 * 3600):
+        self.db_path = db_path
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.retention = retention
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._channels = {}
+        self._channels_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._setup_lock = threading.Lock()
+        self._ready = False
+
+    def setup(self):
+        """Create the database and its schema; done on first use, or up front by the app's start()."""
+        if self._ready:
+            return
+        with self._setup_lock:
+            if self._ready:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = self._open()
+            try:
+                conn.executescript(_SCHEMA)
+            finally:
+                conn.close()
+            self._ready = True
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connect(self):
+        self.setup()
+        return self._open()
+
+    # Submission and inspection
+
+    def submit(self, kind, key, payload):
+        """Queue a job, or return the id of the queued/running job with the same kind and key."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND key = ? AND status IN ('queued', 'running')",
+                (kind, key),
+            ).fetchone()
+            if row:
+                conn.execute("COMMIT")
+                return row["id"]
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, key, payload, status, max_attempts, run_after, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, key, json.dumps(payload), self.max_attempts, now, now, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        logger.info(f"Queued {kind} job {job_id} for {key}")
+        self._wakeup.set()
+        return job_id
+
+    def record_completed(self, kind, key, payload, result, events=()):
+        """
+        Store a job that has nothing left to do (its output already exists) as
+        succeeded, with its progress events, and return its id, so it can be
+        polled and streamed like any other without waiting for a worker. An
+        earlier job recorded this way for the same kind, key and result is
+        returned instead of adding another.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND key = ? AND status = 'succeeded' AND result = ? "
+                "AND attempts = 0 ORDER BY updated_at DESC LIMIT 1",
+                (kind, key, result),
+            ).fetchone()
+            if row:
+                # Refreshed so retention doesn't drop it while a client is polling it
+                conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, row["id"]))
+                conn.execute("COMMIT")
+                return row["id"]
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, key, payload, status, max_attempts, run_after, created_at, updated_at, "
+                "result) VALUES (?, ?, ?, ?, 'succeeded', ?, ?, ?, ?, ?)",
+                (job_id, kind, key, json.dumps(payload), self.max_attempts, now, now, now, result),
+            )
+            conn.executemany("INSERT INTO job_events (job_id, event) VALUES (?, ?)",
+                             [(job_id, json.dumps(event)) for event in events])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return job_id
+
+    def active_keys(self, kind):
+        """Keys of the queued or running jobs of this kind."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT key FROM jobs WHERE kind = ? AND status IN ('queued', 'running')", (kind,))
+            return {row["key"] for row in rows}
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def stream(self, job_id):
+        """
+        Yield a job's progress events followed by its result. Jobs running in
+        this process are followed through their in-memory channel; others are
+        followed by polling the shared database.
+        """
+        last_seq = 0
+        while True:
+            with self._channels_lock:
+                channel = self._channels.get(job_id)
+            if channel is not None:
+                result = None
+                for item in channel.subscribe():
+                    if isinstance(item, tuple):
+                        yield item
+                    else:
+                        result = item
+                if result is not None:
+                    yield result
+                    return
+                # Re-queued for another attempt; skip the events already seen
+                last_seq = self._latest_seq(job_id)
+                continue
+            job = self.get(job_id)
+            if job is None:
+                yield f"Error: Unknown job {job_id}"
+                return
+            # Not running here: poll the database until it finishes or a worker
+            # in this process picks it up (progress events are idempotent, so a
+            # few repeated ones on switching over are harmless).
+            while True:
+                for seq, event in self._events_since(job_id, last_seq):
+                    last_seq = seq
+                    yield event
+                job = self.get(job_id)
+                if job["status"] in TERMINAL_STATUSES:
+                    for seq, event in self._events_since(job_id, last_seq):
+                        yield event
+                    yield job["result"] if job["status"] == "succeeded" else (job["error"] or "Error: Job failed")
+                    return
+                with self._channels_lock:
+                    if job_id in self._channels:
+                        break
+                time.sleep(self.poll_interval)
+
+    def _latest_seq(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT MAX(seq) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] or 0
+
+    def _events_since(self, job_id, seq):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, seq)
+            ).fetchall()
+        finally:
+            conn.close()
+        events = []
+        for row in rows:
+            event = json.loads(row["event"])
+            events.append((row["seq"], tuple(event) if isinstance(event, list) else event))
+        return events
+
+    # Workers
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} job worker(s) on {self.db_path}")
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def after_fork(self):
+        """Reset per-process state in a forked child, which has none of the parent's threads."""
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._channels = {}
+        self._channels_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def release(self):
+        """
+        Re-queue the jobs this process is running, without counting the
+        attempt, so an interrupted process hands them over straight away
+        instead of after stale_after.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            released = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), run_after = ?, updated_at = ? "
+                "WHERE status = 'running' AND worker = ?",
+                (now, now, self.worker_id),
+            ).rowcount
+        finally:
+            conn.close()
+        if released:
+            logger.info(f"Released {released} running job(s)")
+        return released
+
+    def _work_loop(self):
+        last_maintenance = 0.0
+        while not self._stopping.is_set():
+            try:
+                if time.time() - last_maintenance > 60:
+                    self._maintain()
+                    last_maintenance = time.time()
+                job = self._claim()
+                if job is None:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                self._execute(job)
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+                time.sleep(self.poll_interval)
+
+    def _claim(self):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ? ORDER BY run_after LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, updated_at = ? WHERE id = ?",
+                (self.worker_id, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["attempts"] += 1
+        return job
+
+    def _execute(self, job):
+        job_id = job["id"]
+        channel = ProgressChannel()
+        with self._channels_lock:
+            self._channels[job_id] = channel
+
+        def publish(event):
+            channel.publish(event)
+            self._record_event(job_id, event)
+
+        logger.info(f"Running {job['kind']} job {job_id} (attempt {job['attempts']}/{job['max_attempts']})")
+        try:
+            result = self.handlers[job["kind"]](job, publish)
+            self._finish(job_id, "succeeded", result=result)
+            channel.close(result)
+        except RetryableJobError as e:
+            if job["attempts"] < job["max_attempts"]:
+                delay = self.retry_backoff * 2 ** (job["attempts"] - 1)
+                logger.warning(f"Job {job_id} failed ({e}); retrying in {delay:.0f}s")
+                publish(("status", f"retrying in {delay:.0f}s"))
+                self._requeue(job_id, delay, str(e))
+                channel.close(None)
+            else:
+                self._finish(job_id, "failed", error=str(e))
+                channel.close(str(e))
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            error = str(e) if str(e).startswith("Error:") else f"Error: {e}"
+            self._finish(job_id, "failed", error=error)
+            channel.close(error)
+        finally:
+            with self._channels_lock:
+                self._channels.pop(job_id, None)
+
+    def _record_event(self, job_id, event):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT INTO job_events (job_id, event) VALUES (?, ?)", (job_id, json.dumps(event)))
+            # Doubles as a heartbeat so live jobs are not mistaken for stale ones
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+        finally:
+            conn.close()
+
+    def _requeue(self, job_id, delay, error):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', run_after = ?, error = ?, updated_at = ? WHERE id = ?",
+                (now + delay, error, now, job_id),
+            )
+        finally:
+            conn.close()
+
+    def _maintain(self):
+        """
+        Re-queue jobs whose worker stopped heartbeating, or fail them once they
+        have used all their attempts, and drop old finished jobs.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A job that keeps killing its worker (e.g. out of memory on a long video) must not be re-queued
+                # every stale_after forever
+                exhausted = conn.execute(
+                    "SELECT id, attempts FROM jobs "
+                    "WHERE status = 'running' AND updated_at < ? AND attempts >= max_attempts",
+                    (now - self.stale_after,),
+                ).fetchall()
+                for row in exhausted:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                        (f"Error: Job worker stopped responding ({row['attempts']} attempts)", now, row["id"]),
+                    )
+                    conn.execute("INSERT INTO job_events (job_id, event) VALUES (?, ?)",
+                                 (row["id"], json.dumps(("status", "failed: job worker stopped responding"))))
+                stale = conn.execute(
+                    "UPDATE jobs SET status = 'queued', run_after = ?, updated_at = ? "
+                    "WHERE status = 'running' AND updated_at < ?",
+                    (now, now, now - self.stale_after),
+                ).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if exhausted:
+                logger.error(f"Failed {len(exhausted)} stale job(s) that used all their attempts")
+            if stale:
+                logger.warning(f"Re-queued {stale} stale job(s)")
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?)",
+                (now - self.retention,),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?", (now - self.retention,)
+            )
+        finally:
+            conn.close()
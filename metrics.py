@@ -0,0 +1,253 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "ytqa_"
+
+# Seconds; wide enough for a regex match and for a half-hour transcription
+DEFAULT_BUCKETS = (0.001, 0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0, 1800.0)
+
+_trace_id = contextvars.ContextVar("trace_id", default="-")
+
+
+def set_trace_id(trace_id=None):
+    """Start a trace for the current request/job (a new id unless one is given) and return it."""
+    # Ids taken from request headers are capped so a client cannot bloat every log line
+    trace_id = (trace_id or "")[:64] or uuid.uuid4().hex[:16]
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds %(trace_id)s to every record so handlers can include it in their format."""
+
+    def filter(self, record):
+        record.trace_id = _trace_id.get()
+        return True
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """
+    Counters and histograms for one process, exported in Prometheus text format.
+
+    Each process periodically writes its values to <directory>/<pid>.json;
+    render() sums every process's file so /metrics shows the whole
+    deployment whichever gunicorn worker answers the scrape. Files of
+    processes that stopped are kept (counters must not go backwards) until
+    they are older than `retention` seconds.
+    """
+
+    def __init__(self, directory=None, flush_interval=10.0, retention=24 * 3600, buckets=DEFAULT_BUCKETS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._thread = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A forked worker starts from zero; the parent's values are in the parent's file
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._thread = None
+
+    def configure(self, directory, flush_interval=None):
+        self.directory = directory
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+
+    def describe(self, name, kind, text):
+        self._help[PREFIX + name] = (kind, text)
+
+    def inc(self, name, amount=1.0, **labels):
+        key = (PREFIX + name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (PREFIX + name, _labels_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Time a block into the <name>_seconds histogram. The yielded dict holds
+        the labels, so the block can add some (e.g. result) before it ends.
+        """
+        started = time.perf_counter()
+        try:
+            yield labels
+        except BaseException:
+            labels.setdefault("result", "error")
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(f"{name}_seconds", elapsed, **labels)
+            logger.debug(f"span {name} {labels} took {elapsed * 1000:.1f}ms")
+
+    # Cross-process export
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "buckets": list(self.buckets),
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, list(labels), list(hist)] for (name, labels), hist in self._histograms.items()],
+            }
+
+    def _own_file(self):
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = self._own_file()
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics file {path}: {e}")
+
+    def start(self):
+        """Flush this process's values in the background (and at exit) so other workers can export them."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                self.flush()
+
+        self._thread = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _snapshots(self):
+        """This process's live values plus the last flushed values of every other process."""
+        snapshots = [self.snapshot()]
+        if not self.directory or not os.path.isdir(self.directory):
+            return snapshots
+        own = os.path.basename(self._own_file())
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name == own:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.retention:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced or removed by its owner
+        return snapshots
+
+    def render(self):
+        counters, histograms = {}, {}
+        for snap in self._snapshots():
+            for name, labels, value in snap["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0.0) + value
+            if snap["buckets"] != list(self.buckets):
+                continue  # written by a version with different buckets
+            for name, labels, hist in snap["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [0] * len(hist))
+                for i, value in enumerate(hist):
+                    merged[i] += value
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            help_kind, text = self._help.get(name, (kind, name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {help_kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), hist in sorted(histograms.items()):
+            header(name, "histogram")
+            # observe() counts into every bucket >= the value, so counts are already cumulative
+            for bound, count in zip(self.buckets, hist):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {hist[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry, pointed at DATA_DIR/metrics by YouTubeQAApp
+metrics = Metrics()
+
+metrics.describe("extract_video_id_seconds", "histogram", "Time to parse a video id from a URL")
+metrics.describe("transcript_cache_lookup_seconds", "histogram", "Transcript store lookup time by result")
+metrics.describe("answer_cache_lookup_seconds", "histogram", "Answer cache lookup time by result")
+metrics.describe("captions_seconds", "histogram", "Caption track fetch time by result")
+metrics.describe("download_seconds", "histogram", "yt-dlp audio download time by cookie strategy and result")
+metrics.describe("download_attempts_total", "counter", "yt-dlp download attempts by cookie strategy and result")
+metrics.describe("download_fallthroughs_total", "counter",
+                 "Cookie strategies that failed before a later one succeeded, by the successful strategy")
+metrics.describe("transcribe_seconds", "histogram", "Audio transcription time by mode and result")
+metrics.describe("prompt_build_seconds", "histogram", "Context selection and prompt construction time")
+metrics.describe("conversation_summary_seconds", "histogram", "Time to fold older turns into a conversation summary")
+metrics.describe("ttft_seconds", "histogram", "Time from question to first streamed answer chunk")
+metrics.describe("answer_stream_seconds", "histogram", "Total answer streaming time by outcome")
+metrics.describe("cache_requests_total", "counter", "Transcript and answer cache lookups by cache and result")
+metrics.describe("rate_limit_waits_total", "counter", "Questions that waited for the global OpenAI budget")
+metrics.describe("rate_limit_wait_seconds", "histogram", "Time questions waited for the global OpenAI budget")
+metrics.describe("rate_limit_rejections_total", "counter", "Questions rejected by the rate limiter by reason")
+metrics.describe("openai_prompt_tokens_total", "counter", "Prompt tokens reported by OpenAI")
+metrics.describe("openai_cached_prompt_tokens_total", "counter", "Prompt tokens OpenAI served from its prompt cache")
+metrics.describe("openai_completion_tokens_total", "counter", "Completion tokens reported by OpenAI")
+metrics.describe("errors_total", "counter", "Errors by stage")
+metrics.describe("http_requests_total", "counter", "HTTP requests by endpoint and status")
@@ -0,0 +1,268 @@
+"""
+Transcribe and index videos ahead of time, so the first student to ask about
+one doesn't wait for the download and transcription.
+
+    python prewarm.py "https://www.youtube.com/playlist?list=PL..."
+    python prewarm.py https://www.youtube.com/@SomeChannel --concurrency 4
+    python prewarm.py --file module-videos.txt --dry-run
+
+Playlists and channels are expanded with yt-dlp's flat extraction (no
+downloads). Videos already in transcript_cache are skipped; the rest go
+through the same ingestion job queue as /load_video, at most --concurrency at
+a time. Progress is saved to a state file after every video, so an
+interrupted run picks up where it stopped. Run it from the app directory with
+the same environment as the app, so it fills the app's transcript cache;
+with the cache filled, OFFLINE_MODE can serve the whole course.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+import yt_dlp
+
+from youtube_qa_app import YouTubeQAApp
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+# URLs naming a set of videos rather than one (the video id regex would also
+# match the 11 characters after /channel/)
+_COLLECTION_RE = re.compile(r"youtube\.com/(?:playlist\?|@|channel/|c/|user/)|[?&]list=")
+
+# Channel pages nest tabs (videos, shorts, live) as playlists of their own
+_MAX_NESTING = 3
+
+
+def is_collection(url):
+    return bool(_COLLECTION_RE.search(url)) and "v=" not in url
+
+
+def read_url_file(path):
+    """URLs from a text file, one per line; blank lines and # comments are ignored."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _flat_entries(info, depth=0):
+    for entry in info.get("entries") or []:
+        if not entry:
+            continue
+        if entry.get("_type") == "playlist" or entry.get("ie_key") == "YoutubeTab":
+            if depth >= _MAX_NESTING:
+                continue
+            if entry.get("entries") is None:
+                with yt_dlp.YoutubeDL(_flat_opts()) as ydl:
+                    entry = ydl.extract_info(entry["url"], download=False)
+            yield from _flat_entries(entry, depth + 1)
+        elif entry.get("id"):
+            yield entry
+
+
+def _flat_opts():
+    return {**YouTubeQAApp._ydl_common_opts(), "extract_flat": "in_playlist", "skip_download": True}
+
+
+def expand(sources):
+    """Resolve URLs into an ordered, de-duplicated list of {video_id, url, title, duration}."""
+    videos, seen = [], set()
+
+    def add(video_id, url, title=None, duration=None):
+        if video_id and video_id not in seen:
+            seen.add(video_id)
+            videos.append({"video_id": video_id, "url": url, "title": title, "duration": duration})
+
+    for source in sources:
+        if not is_collection(source):
+            video_id = YouTubeQAApp.extract_video_id(source)
+            if video_id:
+                add(video_id, source)
+            else:
+                print(f"Skipping {source}: not a video, playlist or channel URL", file=sys.stderr)
+            continue
+        try:
+            with yt_dlp.YoutubeDL(_flat_opts()) as ydl:
+                info = ydl.extract_info(source, download=False)
+        except Exception as e:
+            print(f"Could not expand {source}: {e}", file=sys.stderr)
+            continue
+        before = len(videos)
+        for entry in _flat_entries(info):
+            add(entry["id"], f"https://www.youtube.com/watch?v={entry['id']}", entry.get("title"),
+                entry.get("duration"))
+        print(f"{source}: {len(videos) - before} new video(s) ({info.get('title') or 'untitled'})")
+    return videos
+
+
+class PrewarmState:
+    """Per-video outcome of earlier runs, written atomically after every video."""
+
+    def __init__(self, path):
+        self.path = path
+        self.videos = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                if data.get("version") == STATE_VERSION:
+                    self.videos = data["videos"]
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable prewarm state {path}: {e}")
+
+    def status(self, video_id):
+        return self.videos.get(video_id, {}).get("status")
+
+    def record(self, video_id, **fields):
+        self.videos[video_id] = dict(fields, finished_at=time.time())
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": STATE_VERSION, "videos": self.videos}, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+def ingest(qa_app, video):
+    """Run one video through the ingestion job queue and index it. Returns its state record."""
+    started = time.monotonic()
+    job_id = qa_app.jobs.submit("ingest", video["video_id"], {"video_url": video["url"]})
+    result = None
+    for item in qa_app.jobs.stream(job_id):
+        if not isinstance(item, tuple):
+            result = item
+    seconds = time.monotonic() - started
+    if result != "done":
+        return {"status": "failed", "error": result, "seconds": seconds, "url": video["url"]}
+    entry = qa_app.store.get(video["video_id"])
+    qa_app.get_index(video["video_id"], entry["transcript"])
+    return {"status": "done", "source": entry.get("source"), "duration": entry.get("duration") or video["duration"],
+            "seconds": seconds, "url": video["url"]}
+
+
+def summarize(results, wall_seconds, cost_per_audio_hour):
+    done = [r for r in results if r["status"] == "done"]
+    asr_hours = sum(r["duration"] or 0 for r in done if r["source"] == "asr") / 3600
+    audio_hours = sum(r["duration"] or 0 for r in done) / 3600
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    sources = {}
+    for r in done:
+        sources[r["source"] or "unknown"] = sources.get(r["source"] or "unknown", 0) + 1
+    return {
+        "videos": len(results),
+        "counts": counts,
+        "sources": sources,
+        "wall_seconds": wall_seconds,
+        "videos_per_minute": len(done) / wall_seconds * 60 if wall_seconds else 0.0,
+        "audio_hours": audio_hours,
+        "audio_hours_per_wall_hour": audio_hours / (wall_seconds / 3600) if wall_seconds else 0.0,
+        "asr_audio_hours": asr_hours,
+        "estimated_transcription_cost": asr_hours * cost_per_audio_hour,
+    }
+
+
+def print_summary(summary):
+    counts = summary["counts"]
+    print(f"\n{summary['videos']} video(s): {counts.get('done', 0)} ingested, {counts.get('cached', 0)} already cached, "
+          f"{counts.get('resumed', 0)} done in an earlier run, {counts.get('failed', 0)} failed")
+    if summary["sources"]:
+        print("ingested from: " + ", ".join(f"{source} {n}" for source, n in sorted(summary["sources"].items())))
+    print(f"{summary['wall_seconds']:.0f}s wall time, {summary['videos_per_minute']:.2f} videos/min, "
+          f"{summary['audio_hours']:.2f} h of audio ({summary['audio_hours_per_wall_hour']:.1f} h per wall hour)")
+    print(f"transcribed {summary['asr_audio_hours']:.2f} h with AssemblyAI, "
+          f"estimated cost ${summary['estimated_transcription_cost']:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe and index videos ahead of time.")
+    parser.add_argument("urls", nargs="*", help="video, playlist or channel URLs")
+    parser.add_argument("--file", "-f", action="append", default=[], help="text file with one URL per line")
+    parser.add_argument("--concurrency", type=int, default=3, help="videos ingested at the same time")
+    parser.add_argument("--state", help="resume file (default DATA_DIR/prewarm-state.json)")
+    parser.add_argument("--skip-failed", action="store_true", help="don't retry videos that failed in earlier runs")
+    parser.add_argument("--limit", type=int, help="only take the first N videos")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be ingested and stop")
+    parser.add_argument("--cost-per-audio-hour", type=float,
+                        default=float(os.getenv("ASSEMBLYAI_COST_PER_HOUR", "0.37")),
+                        help="AssemblyAI price used for the cost estimate (USD)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="show the app's log output")
+    args = parser.parse_args(argv)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    sources = list(args.urls)
+    for path in args.file:
+        sources.extend(read_url_file(path))
+    if not sources:
+        parser.error("give at least one URL or --file")
+    videos = expand(sources)[:args.limit]
+
+    qa_app = YouTubeQAApp()
+    state = PrewarmState(args.state or os.path.join(qa_app.data_dir, "prewarm-state.json"))
+    results, pending = [], []
+    for video in videos:
+        status = state.status(video["video_id"])
+        if qa_app.store.get(video["video_id"]) is not None:
+            results.append({"status": "resumed" if status == "done" else "cached", "url": video["url"]})
+        elif status == "failed" and args.skip_failed:
+            results.append(dict(state.videos[video["video_id"]]))
+        else:
+            pending.append(video)
+    print(f"{len(videos)} video(s), {len(pending)} to ingest")
+    if args.dry_run:
+        for video in pending:
+            print(f"  {video['video_id']}  {video['title'] or video['url']}")
+        return 0
+
+    # Ingest here even if the app runs with OFFLINE_MODE, with one job
+    # worker per concurrent video; app workers sharing DATA_DIR may take some too
+    qa_app.jobs.workers = args.concurrency
+    qa_app.jobs.start()
+
+    todo, done = queue.Queue(), queue.Queue()
+    for video in pending:
+        todo.put(video)
+
+    def worker():
+        # Daemon threads, so an interrupted run exits without waiting for jobs to finish
+        while True:
+            try:
+                video = todo.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                outcome = ingest(qa_app, video)
+            except Exception as e:
+                outcome = {"status": "failed", "error": str(e), "url": video["url"]}
+            done.put((video, outcome))
+
+    started = time.monotonic()
+    for i in range(min(args.concurrency, len(pending))):
+        threading.Thread(target=worker, name=f"prewarm-{i}", daemon=True).start()
+    try:
+        for n in range(1, len(pending) + 1):
+            video, outcome = done.get()
+            state.record(video["video_id"], **outcome)
+            results.append(outcome)
+            detail = (f"{outcome['source']}, {(outcome['duration'] or 0) / 60:.0f} min of audio"
+                      if outcome["status"] == "done" else outcome["error"])
+            print(f"[{n}/{len(pending)}] {video['video_id']} {outcome['status']} "
+                  f"in {outcome.get('seconds', 0):.0f}s ({detail})")
+    except KeyboardInterrupt:
+        # Hand running jobs back to the queue; the next run resumes from the state file
+        qa_app.jobs.release()
+        print("\nInterrupted; run the same command again to resume", file=sys.stderr)
+        print_summary(summarize(results, time.monotonic() - started, args.cost_per_audio_hour))
+        return 130
+
+    print_summary(summarize(results, time.monotonic() - started, args.cost_per_audio_hour))
+    return 1 if any(r["status"] == "failed" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
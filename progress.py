@@ -0,0 +1,67 @@
+import threading
+
+
+class ProgressChannel:
+    """
+    Append-only stream of progress events from one producer thread.
+
+    Subscribers replay every event published so far and then block for new
+    ones, so a reader that attaches late still sees the full history. The
+    producer finishes the stream with close(result); the result is the last
+    item every subscriber receives.
+    """
+
+    def __init__(self):
+        self._events = []
+        self._closed = False
+        self._result = None
+        self._cond = threading.Condition()
+
+    def publish(self, event):
+        with self._cond:
+            if self._closed:
+                return
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def close(self, result):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._result = result
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        with self._cond:
+            return self._closed
+
+    @property
+    def result(self):
+        with self._cond:
+            return self._result
+
+    def subscribe(self, heartbeat=None):
+        """
+        Yield events as they arrive, then the result. If heartbeat is set, yield
+        None whenever that many seconds pass without an event so streaming
+        responses can notice disconnected clients.
+        """
+        position = 0
+        while True:
+            with self._cond:
+                while position >= len(self._events) and not self._closed:
+                    if not self._cond.wait(timeout=heartbeat) and heartbeat is not None:
+                        break
+                pending = self._events[position:]
+                position += len(pending)
+                closed = self._closed and position >= len(self._events)
+                result = self._result
+            if not pending and not closed:
+                yield None
+            for event in pending:
+                yield event
+            if closed:
+                yield result
+                return
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from state_store import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call cannot be admitted within the configured wait bound."""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(f"Rate limit exceeded ({reason}); retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `rate` tokens per second up
+    to `capacity`. Tokens may go negative: a negative balance is a queue of
+    reservations that will be covered by future refills.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until one more token can be taken."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """
+    Per-user and process-wide token buckets in front of the OpenAI API.
+
+    A call that can be admitted now returns immediately. On the event loop
+    (acquire_async), a call that has to wait for the global bucket reserves
+    a token and sleeps for at most max_wait seconds, with at most max_queue
+    callers waiting at once. Anything beyond that, any user over their own
+    rate, and any call from a worker thread (acquire) that would have to
+    wait is rejected straight away with a retry-after hint instead of
+    parking the worker.
+    """
+
+    def __init__(self, global_rate, global_burst, user_rate, user_burst, max_queue, max_wait, max_users=10000):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.user_buckets = LRUCache(max_entries=max_users, ttl=max(60.0, user_burst / user_rate * 2))
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._max_waiting_seen = 0
+        self._admitted = 0
+        self._rejected = {"user": 0, "busy": 0, "queue_full": 0, "wait_too_long": 0}
+        self._recent_waits = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(cls):
+        # Limits are per process: split the deployment-wide budget between workers
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+        global_rpm = float(os.getenv("OPENAI_RATE_LIMIT_RPM", "300")) / workers
+        return cls(
+            global_rate=global_rpm / 60.0,
+            global_burst=max(1.0, float(os.getenv("OPENAI_RATE_LIMIT_BURST", "10")) / workers),
+            user_rate=float(os.getenv("USER_RATE_LIMIT_PER_MINUTE", "6")) / 60.0,
+            user_burst=float(os.getenv("USER_RATE_LIMIT_BURST", "3")),
+            max_queue=int(os.getenv("RATE_LIMIT_MAX_QUEUE", "20")),
+            max_wait=float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "10")),
+        )
+
+    def _reserve(self, user_key, queue=True):
+        """
+        Admit or reject a call; returns how long the admitted caller must wait
+        for its tokens, which is always 0 without queue.
+        """
+        now = time.monotonic()
+        with self._lock:
+            user_bucket = self.user_buckets.setdefault(user_key, lambda: TokenBucket(self.user_rate, self.user_burst))
+            user_wait = user_bucket.wait_time(now)
+            if user_wait > 0:
+                self._rejected["user"] += 1
+                raise RateLimitExceeded(user_wait, "user")
+
+            wait = self.global_bucket.wait_time(now)
+            if wait > 0:
+                if not queue:
+                    self._rejected["busy"] += 1
+                    raise RateLimitExceeded(wait, "busy")
+                if self._waiting >= self.max_queue:
+                    self._rejected["queue_full"] += 1
+                    raise RateLimitExceeded(wait, "queue_full")
+                if wait > self.max_wait:
+                    self._rejected["wait_too_long"] += 1
+                    raise RateLimitExceeded(wait, "wait_too_long")
+                self._waiting += 1
+                self._max_waiting_seen = max(self._max_waiting_seen, self._waiting)
+
+            # Reserve both tokens now so later callers queue behind this one
+            user_bucket.take(now)
+            self.global_bucket.take(now)
+            self._admitted += 1
+            self._recent_waits.append(wait)
+        if wait > 0:
+            logger.info(f"Rate limiter queued call for {wait:.2f}s")
+        return wait
+
+    def _finish_waiting(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def acquire(self, user_key):
+        """
+        Admit a call from a worker thread without waiting, or raise
+        RateLimitExceeded. Sleeping here would hold a gunicorn thread per
+        queued student, so only acquire_async() queues. Returns 0.
+        """
+        return self._reserve(user_key, queue=False)
+
+    async def acquire_async(self, user_key):
+        """acquire() for the event loop: waits without blocking other connections."""
+        wait = self._reserve(user_key)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._finish_waiting()
+        return wait
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            bucket = self.global_bucket
+            bucket._refill(time.monotonic())
+            return {
+                "queue_depth": self._waiting,
+                "max_queue_depth_seen": self._max_waiting_seen,
+                "admitted": self._admitted,
+                "rejected": dict(self._rejected),
+                "wait_seconds_p50": _percentile(waits, 50),
+                "wait_seconds_p95": _percentile(waits, 95),
+                "wait_seconds_max": waits[-1] if waits else 0.0,
+                "global_tokens_available": round(bucket.tokens, 3),
+                "config": {
+                    "global_rate_per_second": bucket.rate,
+                    "global_burst": bucket.capacity,
+                    "user_rate_per_second": self.user_rate,
+                    "user_burst": self.user_burst,
+                    "max_queue": self.max_queue,
+                    "max_wait_seconds": self.max_wait,
+                },
+            }
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
@@ -0,0 +1,267 @@
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+ENCODING_NAME = "cl100k_base"
+
+_TERM_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\S+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from has have how i if in is it its of on or so "
+    "that the their then there these they this to was we what when where which who why will with "
+    "you your".split()
+)
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            # Imported here so importing the app doesn't pay for tiktoken before the first count
+            import tiktoken
+            _encoding = tiktoken.get_encoding(ENCODING_NAME)
+        except Exception as e:
+            # tiktoken downloads its BPE tables on first use; without network
+            # we fall back to the usual ~4 characters per token estimate.
+            logger.warning(f"tiktoken encoding unavailable, estimating token counts: {e}")
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4) if text else 0
+
+
+def encoding_label():
+    return ENCODING_NAME if _get_encoding() else "estimate"
+
+
+def tokenize_terms(text):
+    """Lower-cased lexical terms used by the BM25 index, minus stop words."""
+    return [t for t in _TERM_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _sentence_spans(text):
+    start = 0
+    for separator in _SENTENCE_RE.finditer(text):
+        yield start, separator.start()
+        start = separator.end()
+    yield start, len(text)
+
+
+def _split_units(text, max_tokens):
+    """
+    Split text into (unit, start, end) sentences with their character span in
+    text, breaking any sentence longer than max_tokens on word boundaries.
+    """
+    for start, end in _sentence_spans(text):
+        sentence = text[start:end].strip()
+        if not sentence:
+            continue
+        start = text.index(sentence, start)
+        if count_tokens(sentence) <= max_tokens:
+            yield sentence, start, start + len(sentence)
+            continue
+        current, current_tokens = [], 0
+        for word in _WORD_RE.finditer(sentence):
+            current.append(word)
+            current_tokens += count_tokens(" " + word.group())
+            if current_tokens >= max_tokens:
+                yield " ".join(w.group() for w in current), start + current[0].start(), start + current[-1].end()
+                current, current_tokens = [], 0
+        if current:
+            yield " ".join(w.group() for w in current), start + current[0].start(), start + current[-1].end()
+
+
+def chunk_transcript(text, chunk_tokens=300, overlap_tokens=50):
+    """
+    Pack the transcript into windows of at most chunk_tokens tokens. Consecutive
+    windows share roughly overlap_tokens tokens of trailing sentences so an
+    answer that straddles a boundary is still retrievable from one chunk.
+    Returns (chunks, spans), spans being each chunk's [start, end) character
+    offsets in text, which map chunks back to transcript timestamps.
+    """
+    units = [(u, count_tokens(u), start, end) for u, start, end in _split_units(text, chunk_tokens)]
+    chunks, spans, window, window_tokens = [], [], [], 0
+
+    def close(window):
+        chunks.append(" ".join(u[0] for u in window))
+        spans.append([window[0][2], window[-1][3]])
+
+    for unit in units:
+        tokens = unit[1]
+        if window and window_tokens + tokens > chunk_tokens:
+            close(window)
+            # Carry the tail of the previous window forward as overlap
+            carried, carried_tokens = [], 0
+            for prev in reversed(window):
+                if carried_tokens + prev[1] > overlap_tokens:
+                    break
+                carried.insert(0, prev)
+                carried_tokens += prev[1]
+            # Keep the window within chunk_tokens: the overlap gives way to the new unit
+            while carried and carried_tokens + tokens > chunk_tokens:
+                carried_tokens -= carried.pop(0)[1]
+            window, window_tokens = carried, carried_tokens
+        window.append(unit)
+        window_tokens += tokens
+    if window:
+        close(window)
+    return chunks, spans
+
+
+class BM25Index:
+    """Okapi BM25 over transcript chunks, small enough to serialise as JSON."""
+
+    def __init__(self, chunks, chunk_token_counts=None, k1=1.5, b=0.75, params=None, spans=None):
+        self.chunks = chunks
+        self.spans = spans or []
+        self.chunk_token_counts = chunk_token_counts or [count_tokens(c) for c in chunks]
+        self.k1 = k1
+        self.b = b
+        self.params = params or {}
+        self.term_freqs = [Counter(tokenize_terms(c)) for c in chunks]
+        self.doc_lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if chunks else 0.0
+        doc_freqs = Counter()
+        for tf in self.term_freqs:
+            doc_freqs.update(tf.keys())
+        n = len(chunks)
+        self.idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freqs.items()}
+
+    @property
+    def total_tokens(self):
+        return sum(self.chunk_token_counts)
+
+    def score(self, query):
+        terms = tokenize_terms(query)
+        scores = [0.0] * len(self.chunks)
+        for i, tf in enumerate(self.term_freqs):
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / (self.avg_doc_length or 1))
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    scores[i] += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+        return scores
+
+    def search(self, query, top_k):
+        scores = self.score(query)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return [(i, scores[i]) for i in ranked[:top_k]]
+
+    def select_chunks(self, ranked, token_budget):
+        """
+        Ids of the best-scoring chunks of `ranked` (from search()) that fit in
+        token_budget, in transcript order. Returns None when the whole
+        transcript already fits, so callers can send it verbatim.
+        """
+        if self.total_tokens <= token_budget:
+            return None
+        selected, used = [], 0
+        for i, score in ranked:
+            if score <= 0:
+                break
+            if used + self.chunk_token_counts[i] > token_budget:
+                continue
+            selected.append(i)
+            used += self.chunk_token_counts[i]
+        if not selected:
+            # Nothing matched lexically; fall back to the opening of the video
+            for i, tokens in enumerate(self.chunk_token_counts):
+                if used + tokens > token_budget:
+                    break
+                selected.append(i)
+                used += tokens
+        return sorted(selected)
+
+    def outline(self, token_budget, min_entry_tokens=40):
+        """
+        (chunk_id, text) pairs sampling the whole transcript: the opening words
+        of evenly spaced chunks, sharing token_budget between them.
+        """
+        count = min(len(self.chunks), token_budget // min_entry_tokens)
+        if count <= 0:
+            return []
+        entry_tokens = token_budget // count
+        last = len(self.chunks) - 1
+        ids = sorted({round(n * last / (count - 1)) for n in range(count)}) if count > 1 else [0]
+        entries = []
+        for i in ids:
+            words = self.chunks[i].split()
+            kept = []
+            for word in words:
+                if count_tokens(" ".join(kept + [word])) > entry_tokens:
+                    break
+                kept.append(word)
+            entries.append((i, " ".join(kept) + (" ..." if len(kept) < len(words) else "")))
+        return entries
+
+    def join(self, chunk_ids):
+        return "\n\n[...]\n\n".join(self.chunks[i] for i in chunk_ids)
+
+    def to_dict(self):
+        return {
+            "version": INDEX_VERSION,
+            "params": self.params,
+            "k1": self.k1,
+            "b": self.b,
+            "chunks": self.chunks,
+            "chunk_token_counts": self.chunk_token_counts,
+            "spans": self.spans,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["chunks"], data["chunk_token_counts"], k1=data["k1"], b=data["b"], params=data["params"],
+                   spans=data.get("spans"))
+
+    @classmethod
+    def build(cls, transcript, chunk_tokens, overlap_tokens):
+        chunks, spans = chunk_transcript(transcript, chunk_tokens, overlap_tokens)
+        params = index_params(chunk_tokens, overlap_tokens)
+        return cls(chunks, params=params, spans=spans)
+
+
+def index_params(chunk_tokens, overlap_tokens):
+    return {"chunk_tokens": chunk_tokens, "overlap_tokens": overlap_tokens, "encoding": encoding_label()}
+
+
+def save_index(index, path):
+    # Write to a temp file and rename so a reader never sees a half-written index
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(index.to_dict(), f)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_index(path, expected_params):
+    """Load a persisted index, or return None if it is missing, corrupt or built with other parameters."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable retrieval index {path}: {e}")
+        return None
+    if data.get("version") != INDEX_VERSION or data.get("params") != expected_params:
+        return None
+    return BM25Index.from_dict(data)
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from progress import ProgressChannel
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process coalescing only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent runs of the same job so only one executes.
+
+    Within a process, callers for a key share one ProgressChannel. Across
+    processes (gunicorn workers) the running process holds an flock on
+    <lock_dir>/<key>.lock and appends its progress events to
+    <lock_dir>/<key>.progress as JSON lines; other processes tail that file
+    into their own channel until the lock is released.
+    """
+
+    def __init__(self, lock_dir, poll_interval=1.0):
+        self.lock_dir = lock_dir
+        self.poll_interval = poll_interval
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, work, check):
+        """
+        Return (channel, is_leader) for key, starting the flight if none is running.
+
+        work(publish) does the job and returns its result string; check()
+        returns a result if the job's output already exists (e.g. another
+        process finished it), else None.
+        """
+        with self._lock:
+            channel = self._flights.get(key)
+            if channel is not None:
+                return channel, False
+            channel = ProgressChannel()
+            self._flights[key] = channel
+        threading.Thread(
+            target=self._fly, args=(key, channel, work, check), name=f"flight-{key}", daemon=True
+        ).start()
+        return channel, True
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._flights
+
+    def locked(self, key):
+        """Whether a flight for key is running in this or another process."""
+        if self.in_flight(key):
+            return True
+        lock_path, _ = self._paths(key)
+        if fcntl is None or not os.path.exists(lock_path):
+            return False
+        with open(lock_path, "a") as lock_file:
+            if self._try_lock(lock_file):
+                self._unlock(lock_file)
+                return False
+            return True
+
+    def _paths(self, key):
+        base = os.path.join(self.lock_dir, key)
+        return base + ".lock", base + ".progress"
+
+    def _fly(self, key, channel, work, check):
+        lock_path, progress_path = self._paths(key)
+        try:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            while True:
+                with open(lock_path, "a") as lock_file:
+                    if self._try_lock(lock_file):
+                        try:
+                            result = check() or self._lead(work, channel, progress_path)
+                        finally:
+                            self._unlock(lock_file)
+                        channel.close(result)
+                        return
+                    logger.info(f"Another worker is already processing {key}; following its progress")
+                    result = self._follow(lock_file, channel, progress_path, check)
+                    if result is not None:
+                        channel.close(result)
+                        return
+                    # The other worker died without leaving a result: take over
+                    logger.warning(f"Worker processing {key} exited without a result; retrying here")
+        except Exception as e:
+            logger.error(f"Single-flight run for {key} failed: {e}")
+            channel.close(f"Error: {e}")
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _lead(self, work, channel, progress_path):
+        with open(progress_path, "w") as log:
+            def publish(event):
+                channel.publish(event)
+                log.write(json.dumps({"event": event}) + "\n")
+                log.flush()
+
+            result = work(publish)
+            log.write(json.dumps({"result": result}) + "\n")
+        return result
+
+    def _follow(self, lock_file, channel, progress_path, check):
+        offset = 0
+        while True:
+            offset = self._relay(progress_path, offset, channel)
+            if self._try_lock(lock_file):
+                self._unlock(lock_file)
+                return check() or self._last_result(progress_path)
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _relay(progress_path, offset, channel):
+        """Publish events appended to progress_path since offset; returns the new offset."""
+        try:
+            with open(progress_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < offset:
+                    offset = 0  # a new run truncated the file
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # partially written; pick it up next time
+                    offset += len(line)
+                    record = json.loads(line)
+                    if "event" in record:
+                        event = record["event"]
+                        channel.publish(tuple(event) if isinstance(event, list) else event)
+        except FileNotFoundError:
+            pass
+        return offset
+
+    @staticmethod
+    def _last_result(progress_path):
+        try:
+            with open(progress_path, "r") as f:
+                records = [json.loads(line) for line in f if line.endswith("\n")]
+        except (OSError, ValueError):
+            return None
+        for record in reversed(records):
+            if "result" in record:
+                return record["result"]
+        return None
+
+    @staticmethod
+    def _try_lock(lock_file):
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    @staticmethod
+    def _unlock(lock_file):
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from conversation_memory import ConversationHistory
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe mapping with a maximum size and an optional time-to-live.
+    The least recently used entry is evicted once max_entries is reached,
+    and entries older than ttl seconds (since last access) are dropped lazily.
+    """
+
+    def __init__(self, max_entries=128, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, stamp, now):
+        return self.ttl is not None and now - stamp > self.ttl
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, stamp = entry
+            if self._expired(stamp, now):
+                del self._data[key]
+                return default
+            self._data[key] = (value, now)
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now)
+            self._data.move_to_end(key)
+            self._evict(now)
+
+    def setdefault(self, key, factory):
+        """Return the live value for key, creating it with factory() if absent or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                value = entry[0]
+            else:
+                value = factory()
+            self._data[key] = (value, now)
+            self._data.move_to_end(key)
+            self._evict(now)
+            return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def _evict(self, now):
+        # Oldest entries sit at the front, so expired ones are always there first
+        while self._data:
+            key, (_, stamp) = next(iter(self._data.items()))
+            if len(self._data) > self.max_entries or self._expired(stamp, now):
+                self._data.popitem(last=False)
+            else:
+                break
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class ConversationState:
+    """Everything that belongs to one browser session rather than to the app."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.video_url = ""
+        self.video_id = None
+        self.current_question = ""
+        self.current_answer = ""
+        self.current_feedback = None
+        self.interaction_id = None
+        self.history = ConversationHistory()
+        self.user_info = {}
+        self.lock = threading.Lock()
+
+
+class SessionStore:
+    """
+    Bounded per-session state keyed by the id kept in the Flask session cookie.
+    Transcripts are deliberately not stored here: sessions only remember the
+    video_id and look the transcript up in the shared, video-keyed cache.
+    """
+
+    def __init__(self, max_sessions=None, ttl=None):
+        max_sessions = max_sessions or int(os.getenv("SESSION_MAX_ENTRIES", "2000"))
+        ttl = ttl or float(os.getenv("SESSION_TTL_SECONDS", str(6 * 60 * 60)))
+        self._sessions = LRUCache(max_entries=max_sessions, ttl=ttl)
+
+    def get(self, session_id):
+        return self._sessions.setdefault(session_id, lambda: ConversationState(session_id))
+
+    def discard(self, session_id):
+        self._sessions.pop(session_id)
+
+    def __len__(self):
+        return len(self._sessions)
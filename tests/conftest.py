@@ -0,0 +1,62 @@
+"""
+Tests run the app against a scratch working directory and DATA_DIR, with
+the checked-in fixture transcript copied in, so they never touch the
+repo's transcript_cache/ or audio_downloads/ and need no network.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_VIDEO_ID = "2gv6mToyztM"
+
+_WORKDIR = tempfile.mkdtemp(prefix="ytqa-tests-")
+os.makedirs(os.path.join(_WORKDIR, "transcript_cache"))
+shutil.copyfile(os.path.join(REPO_ROOT, "transcript_cache", f"{FIXTURE_VIDEO_ID}.json"),
+                os.path.join(_WORKDIR, "transcript_cache", f"{FIXTURE_VIDEO_ID}.json"))
+os.chdir(_WORKDIR)
+os.environ.update(
+    OPENAI_API_KEY="sk-test", ASSEMBLYAI_API_KEY="test", AUTH_USERNAME="test", AUTH_PASSWORD="test",
+    SECRET_KEY="test", OFFLINE_MODE="1", DATA_DIR=os.path.join(_WORKDIR, "data"),
+    USER_RATE_LIMIT_BURST="1000", USER_RATE_LIMIT_PER_MINUTE="100000", OPENAI_RATE_LIMIT_BURST="1000",
+    ANSWER_CACHE_REPLAY_DELAY="0",
+)
+sys.path.insert(0, REPO_ROOT)
+
+
+def parse_sse(body):
+    """(event, data) pairs of an event stream, with data lines joined the way EventSource joins them."""
+    events, event, data = [], None, []
+    for line in body.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        if not line:
+            if data:
+                events.append((event or "message", "\n".join(data)))
+            event, data = None, []
+        elif line.startswith("event:"):
+            event = line[6:].lstrip(" ")
+        elif line.startswith("data:"):
+            data.append(line[6:] if line.startswith("data: ") else line[5:])
+    return events
+
+
+@pytest.fixture(scope="session")
+def flask_app():
+    from app import app
+    return app
+
+
+@pytest.fixture(scope="session")
+def qa_app(flask_app):
+    from app import youtube_qa
+    return youtube_qa
+
+
+@pytest.fixture
+def client(flask_app):
+    client = flask_app.test_client()
+    client.post("/login", data={"username": "test", "password": "test"})
+    return client
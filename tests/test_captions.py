@@ -0,0 +1,41 @@
+import os
+
+from conftest import FIXTURES
+
+from captions import parse_captions, parse_srv3, parse_vtt, segments_to_text
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_manual_vtt_keeps_repeated_speech():
+    segments = parse_vtt(read_fixture("captions_manual.vtt"))
+    assert segments == [
+        (0.0, 2.5, "Welcome to the library."),
+        (2.5, 4.0, "Go on."),
+        (4.0, 5.5, "Go on."),
+        (5.5, 8.0, "Book a room & collect your books at the desk."),
+    ]
+
+
+def test_auto_vtt_drops_rolling_lines():
+    segments = parse_captions(read_fixture("captions_auto.vtt"), "vtt", auto=True)
+    assert segments == [
+        (0.0, 2.0, "welcome to the library"),
+        (2.01, 4.0, "you can book a room"),
+        (4.0, 6.0, "online today"),
+    ]
+    assert segments_to_text(segments) == "welcome to the library you can book a room online today"
+
+
+def test_manual_tracks_are_not_deduplicated_through_parse_captions():
+    assert len(parse_captions(read_fixture("captions_manual.vtt"), "vtt")) == 4
+
+
+def test_srv3_skips_line_break_paragraphs():
+    assert parse_srv3(read_fixture("captions.srv3")) == [
+        (0.0, 2.0, "welcome to the library"),
+        (2.01, 4.0, "you can book a & room"),
+    ]
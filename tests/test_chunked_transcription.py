@@ -0,0 +1,80 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from chunked_transcription import ChunkedTranscriber, plan_segments, stitch, stitch_pieces
+
+WORD_MS = 500  # the stub audio says one word every half second
+
+
+class StubTranscriber:
+    """Transcribes the windows written by StubCutter: the words spoken in them, the first one clipped."""
+
+    def __init__(self, fail_starts=()):
+        self.fail_starts = set(fail_starts)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def transcribe(self, path):
+        with open(path) as f:
+            start, end = map(int, f.read().split())
+        with self.lock:
+            self.calls.append(start)
+        if start in self.fail_starts:
+            return SimpleNamespace(status="error", text=None, error="stub failure")
+        words = [f"word{n}" for n in range(-(-start // WORD_MS), -(-end // WORD_MS))]
+        if start and words:
+            words[0] = words[0][2:]  # cut mid-word at the segment start
+        return SimpleNamespace(status="completed", text=" ".join(words), error=None)
+
+
+class StubCutter(ChunkedTranscriber):
+    def cut(self, audio_file, start_ms, end_ms, path):
+        with open(path, "w") as f:
+            f.write(f"{start_ms} {end_ms}")
+
+
+def spoken(duration_ms):
+    return " ".join(f"word{n}" for n in range(-(-duration_ms // WORD_MS)))
+
+
+def test_plan_segments():
+    assert plan_segments(5000, 10000, 1000) == [(0, 5000)]
+    assert plan_segments(25000, 10000, 2000) == [(0, 10000), (8000, 18000), (16000, 25000)]
+    windows = plan_segments(3_600_000, 600_000, 10_000)
+    assert windows[0][0] == 0 and windows[-1][1] == 3_600_000
+    assert all(b[0] == a[1] - 10_000 for a, b in zip(windows, windows[1:]))
+
+
+def test_stitch_removes_clipped_overlap_words():
+    assert stitch(["we went into the forest", "nto the forest where it was dark"]) == \
+        "we went into the forest where it was dark"
+    assert stitch(["we went into the fore", "into the forest where it was dark"]) == \
+        "we went into the forest where it was dark"
+    assert stitch(["one two three", "four five six"]) == "one two three four five six"
+    assert stitch_pieces(["a b c d e", "c d e f g", "e f g h"]) == ["a b c d e", "f g", "h"]
+
+
+def test_transcribe_stitches_segments_and_resumes_from_cache(tmp_path):
+    cache_dir = str(tmp_path / "segments")
+    stub = StubTranscriber(fail_starts={16000})
+    chunked = StubCutter(stub, cache_dir, segment_seconds=10, overlap_seconds=2, max_workers=2)
+    with pytest.raises(RuntimeError, match="1 of 3 segments failed"):
+        chunked.transcribe("lecture.m4a", "video", duration=25)
+    assert sorted(os.listdir(os.path.join(cache_dir, "video"))) == [
+        "seg-0000000000-0000010000.txt", "seg-0000008000-0000018000.txt"]
+
+    stub.fail_starts.clear()
+    stub.calls.clear()
+    events = []
+    segments = chunked.transcribe("lecture.m4a", "video", events.append, duration=25)
+    assert stub.calls == [16000]  # only the missing segment is sent again
+    assert segments.text == spoken(25000)
+    assert segments.starts.tolist() == [0, 10000, 18000]
+    assert segments.ends.tolist() == [10000, 18000, 25000]
+    assert events[-1] == ("transcribe", 100)
+
+    chunked.discard("video")
+    assert not os.path.exists(os.path.join(cache_dir, "video"))
@@ -0,0 +1,110 @@
+import pytest
+from conftest import FIXTURE_VIDEO_ID
+from test_sse import answer_text, completion_chunks
+
+from conversation_memory import ConversationMemory, looks_like_follow_up
+
+VIDEO_URL = f"https://www.youtube.com/watch?v={FIXTURE_VIDEO_ID}"
+HISTORY = [{"role": "user", "content": "What is the enhanced support room?"},
+           {"role": "assistant", "content": "A quiet space staffed by the library team."}]
+
+
+@pytest.mark.parametrize("question", [
+    "What is this video about?",
+    "Where can students book a study room?",
+    "What does the speaker say about opening hours?",
+    "Which services does the library offer for postgraduates?",
+    "Who is presenting?",  # short, but complete on its own
+    "Opening hours?",
+    "Are there rooms that students can book?",
+    "Is it possible to book a room online?",
+    "How long does it take to get a library card?",
+])
+def test_standalone_questions(question):
+    assert not looks_like_follow_up(question)
+
+
+@pytest.mark.parametrize("question", [
+    "Why?",
+    "Tell me more",
+    "Can you elaborate on that?",
+    "How do I book it?",
+    "What about weekends?",
+    "And for postgraduates, what changes?",
+    "Is there another way to get support?",
+    "What did you mean by quiet space earlier?",
+    "How so?",
+    "Why is that?",
+    "Like what?",
+    "Give an example",
+])
+def test_follow_up_questions(question):
+    assert looks_like_follow_up(question)
+
+
+@pytest.mark.parametrize("question", [
+    "What do they offer at weekends?",
+    "Is it open on Sundays?",
+    "Which of these services are free?",
+])
+def test_pronouns_count_as_follow_ups(question):
+    # Deliberately conservative: a pronoun might point at the previous answer even when the
+    # question reads as complete, and a wrong cache hit costs more than a missed one
+    assert looks_like_follow_up(question)
+
+
+def test_depends_on_history():
+    memory = ConversationMemory(summarize=None)
+    assert not memory.depends_on_history([], "Tell me more")
+    assert not memory.depends_on_history(HISTORY, "Where can students book a study room?")
+    assert memory.depends_on_history(HISTORY, "Tell me more")
+    memory.cache_standalone = False
+    assert memory.depends_on_history(HISTORY, "Where can students book a study room?")
+
+
+def ask(client, question):
+    query = {"youtube_url": VIDEO_URL, "question": question}
+    return answer_text(client.get("/ask_stream", query_string=query).get_data(as_text=True))
+
+
+def test_standalone_questions_use_the_answer_cache_mid_conversation(client, qa_app, monkeypatch):
+    calls = []
+
+    def fake_response(messages):
+        calls.append(messages)
+        return completion_chunks(f"Answer {len(calls)}.")
+
+    monkeypatch.setattr(qa_app, "get_chatgpt_response", fake_response)
+    cached = "Book a room through the library portal."
+    question = "Where can students book a quiet study room?"
+    qa_app.answer_cache.put(FIXTURE_VIDEO_ID, question, qa_app.answer_cache_version(), cached)
+    client.post("/load_video", json={"youtube_url": VIDEO_URL}).get_data()
+
+    assert ask(client, "What services does the library offer students?") == "Answer 1."
+    assert ask(client, question) == cached  # second turn, standalone: from the cache
+    assert ask(client, "Tell me more") == "Answer 2."  # follow-up: sent with the conversation
+    assert len(calls[1]) > len(calls[0])
+    assert ask(client, "Tell me more") == "Answer 3."  # and not stored
+
+    # The standalone answer generated mid-conversation was stored for other sessions
+    assert qa_app.answer_cache.get(FIXTURE_VIDEO_ID, "What services does the library offer students?",
+                                   qa_app.answer_cache_version())[0] == "Answer 1."
+
+
+def test_standalone_questions_are_answered_without_the_conversation(client, qa_app, monkeypatch):
+    calls = []
+
+    def fake_response(messages):
+        calls.append(messages)
+        return completion_chunks(f"Answer {len(calls)}.")
+
+    monkeypatch.setattr(qa_app, "get_chatgpt_response", fake_response)
+    client.post("/load_video", json={"youtube_url": VIDEO_URL}).get_data()
+    ask(client, "I am a first-year law student. What does the library offer me?")
+    question = "Which floors of the library are open at night?"
+    assert ask(client, question) == "Answer 2."
+
+    contents = " ".join(m["content"] for m in calls[1])
+    assert "law student" not in contents
+    assert not any(m["role"] == "assistant" for m in calls[1])
+    assert qa_app.answer_cache.get(FIXTURE_VIDEO_ID, question, qa_app.answer_cache_version())[0] == "Answer 2."
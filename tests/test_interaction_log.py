@@ -0,0 +1,123 @@
+import csv
+import os
+import sqlite3
+import time
+
+import pytest
+
+from interaction_log import InteractionLog
+from youtube_qa_app import YouTubeQAApp
+
+
+def test_legacy_csv_import_fills_in_video_ids(tmp_path):
+    csv_path = tmp_path / "qa_feedback_log.csv"
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "participant_id", "work_status", "gender", "video_url", "question", "answer",
+                         "feedback"])
+        writer.writerow(["2024-03-01 10:00:00", "p1", "student", "N/A", "https://youtu.be/2gv6mToyztM", "Q1", "A1",
+                         "positive"])
+        writer.writerow(["2024-03-01 10:05:00", "p2", "student", "N/A", "", "Q2", "A2", ""])
+    log = InteractionLog(str(tmp_path / "interactions.sqlite3"))
+    try:
+        assert log.import_csv(str(csv_path), YouTubeQAApp.extract_video_id) == 2
+        assert log.import_csv(str(csv_path), YouTubeQAApp.extract_video_id) == 0  # only once
+        rows = list(log.iter_rows())
+        assert [r["video_id"] for r in rows] == ["2gv6mToyztM", None]
+        assert [r["question"] for r in log.iter_rows(video_id="2gv6mToyztM")] == ["Q1"]
+    finally:
+        log.close()
+
+
+def test_rows_imported_without_video_ids_are_backfilled(tmp_path):
+    csv_path = tmp_path / "qa_feedback_log.csv"
+    with open(csv_path, "w", newline="") as f:
+        csv.writer(f).writerows([["timestamp", "video_url", "question"],
+                                 ["2024-03-01 10:00:00", "https://www.youtube.com/watch?v=2gv6mToyztM", "Q1"]])
+    log = InteractionLog(str(tmp_path / "interactions.sqlite3"))
+    try:
+        assert log.import_csv(str(csv_path)) == 1  # as imported before video ids were derived
+        assert [r["video_id"] for r in log.iter_rows()] == [None]
+        log.import_csv(str(csv_path), YouTubeQAApp.extract_video_id)
+        assert [r["video_id"] for r in log.iter_rows()] == ["2gv6mToyztM"]
+        assert log.analytics()["videos"][0]["video_id"] == "2gv6mToyztM"
+    finally:
+        log.close()
+
+
+def test_reset_keeps_only_the_newest_archives(tmp_path):
+    csv_path = tmp_path / "qa_feedback_log.csv"
+    with open(csv_path, "w", newline="") as f:
+        csv.writer(f).writerows([["timestamp", "question"], ["2024-03-01 10:00:00", "Q1"]])
+    log = InteractionLog(str(tmp_path / "interactions.sqlite3"), max_archives=2)
+    try:
+        paths = []
+        for _ in range(3):
+            log.import_csv(str(csv_path))
+            paths.append(log.archive_and_reset())
+            assert list(log.iter_rows()) == []
+        assert log.archives() == paths[1:]
+        assert sorted(p.name for p in tmp_path.glob("interactions-*")) == [os.path.basename(p) for p in paths[1:]]
+    finally:
+        log.close()
+
+
+def test_reset_without_archives(tmp_path):
+    log = InteractionLog(str(tmp_path / "interactions.sqlite3"), max_archives=0)
+    try:
+        assert log.archive_and_reset() is None
+        assert log.archives() == []
+    finally:
+        log.close()
+
+
+def test_export_timestamps_are_utc(client, qa_app, monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        monkeypatch.setattr(qa_app.interactions, "iter_rows", lambda **filters: iter([{"created_at": 0.0}]))
+        body = client.get("/admin/export?format=csv").get_data(as_text=True)
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
+    assert body.splitlines()[1].startswith("1970-01-01 00:00:00,")
+
+
+def test_reset_copies_the_log_while_holding_the_write_lock(tmp_path, monkeypatch):
+    csv_path = tmp_path / "qa_feedback_log.csv"
+    with open(csv_path, "w", newline="") as f:
+        csv.writer(f).writerows([["timestamp", "question"], ["2024-03-01 10:00:00", "Q1"]])
+    db_path = str(tmp_path / "interactions.sqlite3")
+    log = InteractionLog(db_path)
+    backup = log._backup
+
+    def backup_while_a_writer_commits(archive_path):
+        writer = sqlite3.connect(db_path, timeout=0.1)
+        try:
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                writer.execute("INSERT INTO meta (key, value) VALUES ('late', 'row')")
+        finally:
+            writer.close()
+        backup(archive_path)
+
+    monkeypatch.setattr(log, "_backup", backup_while_a_writer_commits)
+    try:
+        log.import_csv(str(csv_path))
+        archive = sqlite3.connect(log.archive_and_reset())
+        try:
+            assert archive.execute("SELECT question FROM interactions").fetchall() == [("Q1",)]
+        finally:
+            archive.close()
+    finally:
+        log.close()
+
+
+def test_reset_requires_the_admin_token(client, qa_app, monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.post("/admin/reset_csv").status_code == 403
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(qa_app.interactions, "archive_and_reset", lambda: None)
+    assert client.post("/admin/reset_csv").status_code == 401
+    assert client.post("/admin/reset_csv", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    r = client.post("/admin/reset_csv", headers={"Authorization": "Bearer s3cret"})
+    assert r.status_code == 200 and r.get_json() == {"message": "Interaction log reset"}
@@ -0,0 +1,60 @@
+from conftest import FIXTURE_VIDEO_ID
+
+from jobs import JobQueue
+
+VIDEO_URL = f"https://www.youtube.com/watch?v={FIXTURE_VIDEO_ID}"
+
+
+def test_cached_video_job_is_complete_without_workers(client, qa_app):
+    assert qa_app.offline_mode and not qa_app.jobs._threads  # nothing would ever run a queued job
+    r = client.post("/jobs", json={"youtube_url": VIDEO_URL})
+    assert r.status_code == 200
+    job = r.get_json()
+    assert job["status"] == "succeeded" and job["result"] == "done"
+    assert FIXTURE_VIDEO_ID not in qa_app.jobs.active_keys("ingest")
+
+    assert client.get(f"/jobs/{job['id']}").get_json()["status"] == "succeeded"
+    body = client.get(f"/jobs/{job['id']}/stream").get_data(as_text=True)
+    assert body == "download:100\ntranscribe:100\ndone\n"
+
+
+def test_uncached_video_is_rejected_offline(client, qa_app):
+    r = client.post("/jobs", json={"youtube_url": "https://www.youtube.com/watch?v=notcached01"})
+    assert r.status_code == 400
+    assert "Offline mode" in r.get_json()["error"]
+    assert qa_app.jobs.active_keys("ingest") == set()
+
+
+def test_cached_video_jobs_are_not_duplicated(client, qa_app):
+    first = client.post("/jobs", json={"youtube_url": VIDEO_URL}).get_json()
+    second = client.post("/jobs", json={"youtube_url": VIDEO_URL}).get_json()
+    assert second["id"] == first["id"]
+    conn = qa_app.jobs._connect()
+    try:
+        count = conn.execute("SELECT COUNT(*) FROM jobs WHERE key = ?", (FIXTURE_VIDEO_ID,)).fetchone()[0]
+        events = conn.execute("SELECT COUNT(*) FROM job_events WHERE job_id = ?", (first["id"],)).fetchone()[0]
+    finally:
+        conn.close()
+    assert count == 1 and events == 2
+
+
+def test_stale_job_fails_after_max_attempts(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), handlers={}, max_attempts=2, stale_after=60)
+    job_id = queue.submit("ingest", "abc", {})
+
+    def worker_dies():
+        assert queue._claim()["id"] == job_id
+        conn = queue._connect()
+        try:
+            conn.execute("UPDATE jobs SET updated_at = updated_at - 120 WHERE id = ?", (job_id,))
+        finally:
+            conn.close()
+        queue._maintain()
+
+    worker_dies()
+    assert queue.get(job_id)["status"] == "queued"  # one attempt left
+    worker_dies()
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2
+    assert queue._claim() is None
+    assert list(queue.stream(job_id)) == [("status", "failed: job worker stopped responding"), job["error"]]
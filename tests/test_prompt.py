@@ -0,0 +1,36 @@
+from conftest import FIXTURE_VIDEO_ID
+
+from retrieval import BM25Index, count_tokens
+
+
+def long_transcript():
+    return " ".join(f"Part {n} covers topic number {n} in some detail. It ends here." for n in range(200))
+
+
+def test_outline_samples_the_whole_transcript_within_budget():
+    index = BM25Index.build(long_transcript(), chunk_tokens=60, overlap_tokens=10)
+    entries = index.outline(400)
+    ids = [i for i, _ in entries]
+    assert ids[0] == 0 and ids[-1] == len(index.chunks) - 1
+    assert ids == sorted(set(ids))
+    assert sum(count_tokens(text) for _, text in entries) <= 400 + len(entries)  # " ..." markers
+    assert BM25Index.build("", 60, 10).outline(400) == []
+
+
+def test_excerpt_prompts_share_an_outline_prefix(qa_app, monkeypatch):
+    monkeypatch.setattr(qa_app, "context_token_budget", 150)
+    monkeypatch.setattr(qa_app, "outline_tokens", 300)
+    qa_app.outlines.pop(FIXTURE_VIDEO_ID)
+    transcript = qa_app.get_transcript(FIXTURE_VIDEO_ID)
+    first, _ = qa_app.build_prompt(FIXTURE_VIDEO_ID, transcript, "How do I book a room?")
+    second, _ = qa_app.build_prompt(FIXTURE_VIDEO_ID, transcript, "What equipment is available?")
+    assert first[:2] == second[:2]
+    assert first[1]["content"].startswith("Outline of the YouTube video")
+    assert first[2]["content"].startswith("Here are the most relevant excerpts")
+    qa_app.outlines.pop(FIXTURE_VIDEO_ID)
+
+
+def test_whole_transcript_prompts_have_no_outline(qa_app):
+    messages = qa_app.build_messages("Question?", "Transcript.", is_excerpt=False, outline="Outline")
+    assert [m["content"] for m in messages] == [messages[0]["content"], "Here's the transcript from a YouTube video:"
+                                                "\n\nTranscript.", "Question?"]
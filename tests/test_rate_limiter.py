@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, RateLimitExceeded
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A frozen time.monotonic for the limiter; sleeping in it fails the test."""
+    clock = SimpleNamespace(now=1000.0)
+
+    def sleep(seconds):
+        raise AssertionError(f"slept {seconds}s")
+
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=lambda: clock.now, sleep=sleep))
+    return clock
+
+
+def limiter(**overrides):
+    config = dict(global_rate=1.0, global_burst=1, user_rate=1 / 60, user_burst=1000, max_queue=2, max_wait=2.5)
+    return RateLimiter(**{**config, **overrides})
+
+
+def rejection(call):
+    with pytest.raises(RateLimitExceeded) as info:
+        call()
+    return info.value.reason, info.value.retry_after
+
+
+def test_user_over_their_rate_is_rejected(clock):
+    limits = limiter(global_rate=100, global_burst=100, user_burst=2)
+    assert limits.acquire("alice") == 0
+    assert limits.acquire("alice") == 0
+    assert rejection(lambda: limits.acquire("alice")) == ("user", pytest.approx(60))
+    clock.now += 45
+    assert rejection(lambda: limits.acquire("alice")) == ("user", pytest.approx(15))
+    assert limits.acquire("bob") == 0  # other users are unaffected
+    clock.now += 15
+    assert limits.acquire("alice") == 0
+    assert limits.stats()["rejected"]["user"] == 2
+
+
+def test_sync_callers_are_rejected_instead_of_waiting(clock):
+    limits = limiter()
+    assert limits.acquire("alice") == 0
+    assert rejection(lambda: limits.acquire("bob")) == ("busy", pytest.approx(1.0))
+    clock.now += 0.25
+    assert rejection(lambda: limits.acquire("bob")) == ("busy", pytest.approx(0.75))
+    stats = limits.stats()
+    assert stats["queue_depth"] == 0 and stats["rejected"]["busy"] == 2
+
+
+def test_global_queue_is_bounded(clock):
+    limits = limiter()
+    assert limits._reserve("a") == 0
+    assert limits._reserve("b") == pytest.approx(1.0)  # each queued caller waits behind the previous one
+    assert limits._reserve("c") == pytest.approx(2.0)
+    assert rejection(lambda: limits._reserve("d")) == ("queue_full", pytest.approx(3.0))
+    assert limits.stats()["queue_depth"] == 2
+
+
+def test_global_wait_is_bounded(clock):
+    limits = limiter(max_queue=10)
+    for expected in (0, 1.0, 2.0):
+        assert limits._reserve("a") == pytest.approx(expected)
+    assert rejection(lambda: limits._reserve("d")) == ("wait_too_long", pytest.approx(3.0))
+    assert limits.stats()["rejected"] == {"user": 0, "busy": 0, "queue_full": 0, "wait_too_long": 1}
+
+
+def test_async_callers_queue_for_the_global_bucket():
+    limits = limiter(global_rate=20.0)
+
+    async def ask_twice():
+        return await asyncio.gather(limits.acquire_async("alice"), limits.acquire_async("bob"))
+
+    waits = asyncio.run(ask_twice())
+    assert sorted(waits) == [0, pytest.approx(0.05, abs=0.01)]
+    stats = limits.stats()
+    assert stats["queue_depth"] == 0 and stats["max_queue_depth_seen"] == 1
@@ -0,0 +1,69 @@
+import random
+import re
+
+from retrieval import BM25Index, chunk_transcript, count_tokens, index_params, load_index, save_index
+
+
+def sentence_tokens(chunk):
+    return sum(count_tokens(s) for s in re.split(r"(?<=[.!?]) ", chunk))
+
+
+def varied_transcript(seed=7, sentences=120):
+    rng = random.Random(seed)
+    return " ".join(" ".join(f"word{rng.randrange(500)}" for _ in range(rng.randrange(3, 30))) + "."
+                    for _ in range(sentences))
+
+
+def test_chunks_stay_within_budget_with_overlap():
+    text = varied_transcript()
+    chunks, spans = chunk_transcript(text, chunk_tokens=100, overlap_tokens=50)
+    assert len(chunks) > 10
+    assert all(sentence_tokens(chunk) <= 100 for chunk in chunks)
+    # Spans point back at the chunk's text, and consecutive chunks overlap
+    assert all(text[start:end] == chunk for chunk, (start, end) in zip(chunks, spans))
+    overlapping = sum(spans[i + 1][0] < spans[i][1] for i in range(len(spans) - 1))
+    assert overlapping > len(spans) // 2
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+
+
+def test_long_sentences_are_split_on_words():
+    text = " ".join(f"word{n}" for n in range(400)) + "."
+    chunks, _ = chunk_transcript(text, chunk_tokens=50, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert " ".join(chunks) == text
+
+
+def test_bm25_ranks_matching_chunks_first():
+    index = BM25Index(["The library opens at nine.", "Rooms can be booked online through the portal.",
+                       "The portal shows free rooms and rooms for groups."])
+    ranked = index.search("Which rooms can be booked online?", top_k=3)
+    assert [i for i, _ in ranked] == [1, 2, 0]
+    assert ranked[2][1] == 0.0
+    assert index.search("the of and", top_k=3)[0][1] == 0.0  # stop words carry no weight
+
+
+def test_select_chunks_keeps_to_the_token_budget():
+    chunks = [f"Section {n} is about topic{n} and nothing else at all." for n in range(20)]
+    index = BM25Index(chunks)
+    per_chunk = index.chunk_token_counts[0]
+    assert index.select_chunks(index.search("topic3", 5), index.total_tokens) is None  # everything fits
+    selected = index.select_chunks(index.search("topic3 topic12 topic7", 5), per_chunk * 2)
+    assert selected == [3, 12] or selected == [3, 7] or selected == [7, 12]
+    assert sum(index.chunk_token_counts[i] for i in selected) <= per_chunk * 2
+    # Nothing matches: the opening of the video
+    assert index.select_chunks(index.search("unrelated", 5), per_chunk * 3) == [0, 1, 2]
+
+
+def test_index_persists_and_reloads(tmp_path):
+    text = varied_transcript(sentences=40)
+    index = BM25Index.build(text, chunk_tokens=80, overlap_tokens=20)
+    path = str(tmp_path / "video.index.json")
+    save_index(index, path)
+
+    loaded = load_index(path, index_params(80, 20))
+    assert loaded.chunks == index.chunks and loaded.spans == index.spans
+    assert loaded.search("word42 word7", 5) == index.search("word42 word7", 5)
+    assert load_index(path, index_params(100, 20)) is None  # built with other parameters
+    assert load_index(str(tmp_path / "missing.json"), index_params(80, 20)) is None
+    (tmp_path / "corrupt.json").write_text("{not json")
+    assert load_index(str(tmp_path / "corrupt.json"), index_params(80, 20)) is None
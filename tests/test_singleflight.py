@@ -0,0 +1,68 @@
+import threading
+
+from singleflight import SingleFlight
+
+
+def counting_work(started, release, calls):
+    def work(publish):
+        calls.append(threading.current_thread().name)
+        publish(("download", 50))
+        started.set()
+        release.wait(5)
+        publish(("download", 100))
+        return "done"
+    return work
+
+
+def collect(channel, out):
+    out.extend(channel.subscribe())
+
+
+def test_concurrent_callers_share_one_run(tmp_path):
+    flights = SingleFlight(str(tmp_path / "locks"), poll_interval=0.01)
+    started, release, calls = threading.Event(), threading.Event(), []
+    work = counting_work(started, release, calls)
+
+    leader, is_leader = flights.run("video1", work, check=lambda: None)
+    assert is_leader
+    assert started.wait(5)
+    waiter, waiter_is_leader = flights.run("video1", work, check=lambda: None)
+    assert waiter is leader and not waiter_is_leader
+    assert flights.in_flight("video1") and flights.locked("video1")
+
+    results = [[], []]
+    readers = [threading.Thread(target=collect, args=(channel, out)) for channel, out in zip((leader, waiter), results)]
+    for reader in readers:
+        reader.start()
+    release.set()
+    for reader in readers:
+        reader.join(5)
+
+    assert len(calls) == 1
+    assert results[0] == results[1] == [("download", 50), ("download", 100), "done"]
+    assert not flights.locked("video1")
+
+
+def test_other_workers_follow_the_running_flight(tmp_path):
+    # Two instances on one lock directory stand in for two gunicorn workers
+    lock_dir = str(tmp_path / "locks")
+    first, second = SingleFlight(lock_dir, poll_interval=0.01), SingleFlight(lock_dir, poll_interval=0.01)
+    started, release, calls = threading.Event(), threading.Event(), []
+    work = counting_work(started, release, calls)
+    done = []
+
+    leader, _ = first.run("video1", work, check=lambda: "done" if done else None)
+    assert started.wait(5)
+    assert second.locked("video1")
+    follower, _ = second.run("video1", work, check=lambda: "done" if done else None)
+
+    out = []
+    reader = threading.Thread(target=collect, args=(follower, out))
+    reader.start()
+    done.append(True)
+    release.set()
+    reader.join(5)
+    list(leader.subscribe())
+
+    assert len(calls) == 1
+    assert out[0] == ("download", 50) and out[-1] == "done"
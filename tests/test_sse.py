@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from conftest import FIXTURE_VIDEO_ID, parse_sse
+
+from app import sse_data
+
+VIDEO_URL = f"https://www.youtube.com/watch?v={FIXTURE_VIDEO_ID}"
+ANSWER = ("An enhanced support room is:\n\n1. A quiet space for students.\n2. Staffed by the library team.\n\n"
+          "Book via the portal.")
+
+
+def answer_text(body):
+    return "".join(data for event, data in parse_sse(body) if event == "message" and data != "[DONE]")
+
+
+def test_sse_data_keeps_newlines():
+    for chunk in (ANSWER, "\n", "trailing\n\n", "  leading spaces"):
+        assert parse_sse(sse_data(chunk)) == [("message", chunk)]
+    assert parse_sse(sse_data("line\r\nbreak")) == [("message", "line\nbreak")]
+
+
+@pytest.mark.parametrize("delay", [0, 0.001])  # whole answer in one chunk, or replayed a few words at a time
+def test_cached_multi_paragraph_answer_reaches_the_browser_intact(client, qa_app, monkeypatch, delay):
+    question = "What is the enhanced support room?"
+    qa_app.answer_cache.put(FIXTURE_VIDEO_ID, question, qa_app.answer_cache_version(), ANSWER)
+    monkeypatch.setattr(qa_app, "answer_replay_delay", delay)
+    client.post("/load_video", json={"youtube_url": VIDEO_URL}).get_data()
+    body = client.get("/ask_stream", query_string={"youtube_url": VIDEO_URL, "question": question}).get_data(
+        as_text=True)
+    assert answer_text(body) == ANSWER
+    assert body.endswith("data: [DONE]\n\n")
+
+
+def completion_chunks(text, size=7):
+    """Streamed chat completion chunks as the OpenAI client yields them, ending with the usage chunk."""
+    for i in range(0, len(text), size):
+        yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + size]))])
+    yield SimpleNamespace(usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None),
+                          choices=[])
+
+
+def test_streamed_multi_paragraph_answer_reaches_the_browser_intact(client, qa_app, monkeypatch):
+    monkeypatch.setattr(qa_app, "get_chatgpt_response", lambda messages: completion_chunks(ANSWER))
+    client.post("/load_video", json={"youtube_url": VIDEO_URL}).get_data()
+    query = {"youtube_url": VIDEO_URL, "question": "Describe the room", "no_cache": "1"}
+    body = client.get("/ask_stream", query_string=query).get_data(as_text=True)
+    assert answer_text(body) == ANSWER
+
+
+def test_asgi_stream_keeps_newlines(qa_app, monkeypatch):
+    from asgi import application
+
+    class FakeStream:
+        def __init__(self):
+            self.chunks = completion_chunks(ANSWER)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self.chunks)
+            except StopIteration:
+                raise StopAsyncIteration
+
+        async def close(self):
+            pass
+
+    async def fake_response(messages):
+        return FakeStream()
+
+    monkeypatch.setattr(qa_app, "get_chatgpt_response_async", fake_response)
+
+    async def ask():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            await http.post("/login", data={"username": "test", "password": "test"})
+            await http.post("/load_video", json={"youtube_url": VIDEO_URL})
+            query = {"youtube_url": VIDEO_URL, "question": "Describe the room", "no_cache": "1"}
+            return (await http.get("/ask_stream", params=query)).text
+
+    assert answer_text(asyncio.run(ask())) == ANSWER
@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+from conftest import REPO_ROOT
+
+PROBE = """
+import os, sys
+import app
+print('probe:', int('tiktoken' in sys.modules), ','.join(sorted(os.listdir('.'))))
+app.youtube_qa.start()
+print('probe:', ','.join(sorted(os.listdir('data'))))
+"""
+
+
+def test_importing_the_app_touches_no_files(tmp_path):
+    env = {**os.environ, "DATA_DIR": str(tmp_path / "data"), "PYTHONPATH": REPO_ROOT}
+    stdout = subprocess.run([sys.executable, "-c", PROBE], cwd=tmp_path, env=env, capture_output=True, text=True,
+                            check=True).stdout
+    out = [line[len("probe: "):] for line in stdout.splitlines() if line.startswith("probe: ")]
+    assert out[0] == "0 "  # no tiktoken, no directories or databases until start()
+    assert {"interactions.sqlite3", "jobs.sqlite3"} <= set(out[1].split(","))
+    assert (tmp_path / "transcript_cache" / "index.sqlite3").exists()
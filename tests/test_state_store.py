@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+from conftest import FIXTURE_VIDEO_ID
+from test_sse import answer_text, completion_chunks
+
+import state_store
+from state_store import LRUCache, SessionStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(state_store, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_lru_evicts_the_least_recently_used(clock):
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert "b" not in cache and cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_entries_expire_after_ttl_since_last_access(clock):
+    cache = LRUCache(max_entries=10, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    clock.now += 50
+    assert cache.get("a") == 1  # refreshed
+    clock.now += 50
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.setdefault("b", lambda: "new") == "new"
+    clock.now += 61
+    cache.set("c", 3)  # expired entries are dropped on write
+    assert len(cache) == 1
+
+
+def test_sessions_are_isolated_bounded_and_expire(clock):
+    sessions = SessionStore(max_sessions=2, ttl=60)
+    alice, bob = sessions.get("alice"), sessions.get("bob")
+    alice.video_id = "video1"
+    assert sessions.get("alice") is alice and bob is not alice and bob.video_id is None
+    sessions.get("carol")  # evicts bob, the least recently used
+    assert sessions.get("bob") is not bob
+    clock.now += 61
+    assert sessions.get("alice").video_id is None  # expired: a fresh state
+    assert len(sessions) == 1  # the other expired sessions are dropped too
+    sessions.discard("alice")
+    assert len(sessions) == 0
+
+
+def test_browser_sessions_do_not_share_state(flask_app, qa_app, monkeypatch):
+    monkeypatch.setattr(qa_app, "get_chatgpt_response", lambda messages: completion_chunks("Alice's answer."))
+    alice, bob = flask_app.test_client(), flask_app.test_client()
+    for client in (alice, bob):
+        client.post("/login", data={"username": "test", "password": "test"})
+    alice.post("/load_video", json={"youtube_url": f"https://youtu.be/{FIXTURE_VIDEO_ID}"}).get_data()
+
+    # No URL sent with the question: each session answers from its own loaded video
+    query = {"question": "What is the enhanced support room?", "no_cache": "1"}
+    assert answer_text(alice.get("/ask_stream", query_string=query).get_data(as_text=True)) == "Alice's answer."
+    assert answer_text(bob.get("/ask_stream", query_string=query).get_data(as_text=True)) == (
+        "Please load a video first before asking questions.")
+    assert bob.post("/feedback", json={"feedback": "positive"}).get_json() == {
+        "error": "No question has been asked yet"}
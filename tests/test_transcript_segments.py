@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+from conftest import FIXTURE_VIDEO_ID
+
+from transcript_segments import Segments, format_timestamp
+
+
+def words(*timed):
+    return [SimpleNamespace(text=text, start=start, end=end) for text, start, end in timed]
+
+
+def test_from_words_groups_sentences():
+    segments = Segments.from_words(words(("Welcome", 0, 400), ("everyone.", 400, 900), ("Today", 1200, 1500),
+                                         ("we", 1500, 1600), ("cover", 1600, 2000), ("rooms.", 2000, 2500),
+                                         ("Questions", 3000, 3600)))
+    assert segments.texts == ["Welcome everyone.", "Today we cover rooms.", "Questions"]
+    assert list(segments.starts) == [0, 1200, 3000]
+    assert list(segments.ends) == [900, 2500, 3600]
+    assert segments.text == "Welcome everyone. Today we cover rooms. Questions"
+
+
+def test_from_words_splits_long_sentences():
+    segments = Segments.from_words(words(*((f"w{n}", n * 1000, n * 1000 + 900) for n in range(25))), max_seconds=10)
+    assert [len(text.split()) for text in segments.texts] == [10, 10, 5]
+    assert all(end - start <= 10000 for start, end in zip(segments.starts, segments.ends))
+
+
+def test_character_offsets_map_to_times():
+    segments = Segments([0, 5000], [4000, 10000], ["Hello there.", "The library opens at 9."])
+    assert [segments.segment_at_char(o) for o in (0, 11, 12, 13, 30)] == [0, 0, 0, 1, 1]
+    assert segments.time_at_char(0) == 0.0
+    assert segments.time_at_char(13) == 5.0
+    assert segments.time_at_char(13 + 23) == 10.0
+    assert 5.0 < segments.time_at_char(20) < 10.0  # interpolated within the segment
+
+
+def test_entries_round_trip_and_text_only_entries_load():
+    segments = Segments([0, 5000], [4000, 10000], ["Hello there.", "Bye."])
+    loaded = Segments.from_entry({"transcript": segments.text, "segments": segments.to_dict()})
+    assert loaded.timed and loaded.texts == segments.texts and list(loaded.ends) == [4000, 10000]
+
+    legacy = Segments.from_entry({"video_id": "old", "transcript": "Cached before timestamps."})
+    assert not legacy.timed and legacy.text == "Cached before timestamps."
+    assert legacy.time_at_char(10) == 0.0
+
+
+def test_format_timestamp():
+    assert [format_timestamp(s) for s in (0, 65.9, 3600, 3725)] == ["0:00", "1:05", "1:00:00", "1:02:05"]
+
+
+def test_legacy_cached_transcript_loads_without_citations(qa_app):
+    # The checked-in fixture predates timestamps: {"video_id", "transcript"} only
+    transcript = qa_app.get_transcript(FIXTURE_VIDEO_ID)
+    assert transcript
+    assert not qa_app.get_segments(FIXTURE_VIDEO_ID, transcript).timed
+    assert qa_app.find_citations(FIXTURE_VIDEO_ID, transcript, "What is the enhanced support room?") == []
+
+
+def test_find_citations_points_at_the_matching_segment(qa_app):
+    video_id = "citations01"
+    segments = Segments([0, 62000, 125000], [60000, 120000, 180000],
+                        ["Welcome to the library induction.", "Group study rooms are booked through the portal.",
+                         "Printing costs five pence a page."])
+    qa_app._store_transcript(video_id, segments, "captions:manual")
+    citations = qa_app.find_citations(video_id, segments.text, "How do I book a group study room?")
+    assert citations[0] == {"start": 62.0, "end": 120.0, "url": f"https://www.youtube.com/watch?v={video_id}&t=62s",
+                            "text": "Group study rooms are booked through the portal."}
+    assert citations[0] not in qa_app.find_citations(video_id, segments.text, "printing costs")
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+
+from jobs import JobQueue
+import transcript_store
+from singleflight import SingleFlight
+from transcript_store import TranscriptStore
+
+DAY = 24 * 3600
+
+
+def make_store(tmp_path, **limits):
+    return TranscriptStore(str(tmp_path / "transcript_cache"), str(tmp_path / "audio_downloads"), **limits)
+
+
+def write(path, data="x", age=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(data)
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_eviction_keeps_checked_in_fixtures(tmp_path):
+    store = make_store(tmp_path, max_bytes=1, audio_max_age=3600)
+    seed = write(os.path.join(store.root, "seedvideo01.json"), json.dumps({"transcript": "shipped " * 100}))
+    seed_audio = write(os.path.join(store.audio_dir, "seedvideo01.m4a"), age=DAY)
+    old_audio = write(os.path.join(store.audio_dir, "othervideo1.m4a"), age=DAY)
+    assert store.get("seedvideo01")["transcript"].startswith("shipped")
+    store.put("othervideo1", "downloaded " * 100, "asr")  # put() evicts: over max_bytes
+
+    assert [e["video_id"] for e in store.entries()] == ["seedvideo01"]
+    assert os.path.exists(seed) and os.path.exists(seed_audio)
+    assert not os.path.exists(old_audio)
+
+
+def test_delete_keeps_checked_in_transcript_unless_forced(tmp_path):
+    store = make_store(tmp_path)
+    seed = write(os.path.join(store.root, "seedvideo01.json"), json.dumps({"transcript": "shipped"}))
+    store.get("seedvideo01")
+    store.delete("seedvideo01")
+    assert os.path.exists(seed)
+    assert store.get("seedvideo01")["transcript"] == "shipped"
+    store.delete("seedvideo01", force=True)
+    assert not os.path.exists(seed)
+
+
+def test_eviction_covers_segment_caches_and_skips_videos_in_use(tmp_path):
+    busy, asked = {"busyvideo01"}, []
+
+    def in_use(video_ids):
+        asked.append(set(video_ids))
+        return busy & video_ids
+
+    store = make_store(tmp_path, audio_max_age=3600, pinned=["pinnedvideo"], in_use=in_use)
+    stale = write(os.path.join(store.segments_dir, "stalevideo1", "seg-0000000000-0000600000.txt"), age=DAY)
+    fresh = write(os.path.join(store.segments_dir, "freshvideo1", "seg-0000000000-0000600000.txt"))
+    busy_segment = write(os.path.join(store.segments_dir, "busyvideo01", "seg-0000000000-0000600000.txt"), age=DAY)
+    busy_audio = write(os.path.join(store.audio_dir, "busyvideo01.m4a"), age=DAY)
+    pinned_audio = write(os.path.join(store.audio_dir, "pinnedvideo.m4a"), age=DAY)
+
+    assert store.evict(dry_run=True)["audio"] == [os.path.dirname(stale)]
+    # Asked once, about the two videos due for removal; the pinned and fresh ones are never checked
+    assert asked == [{"stalevideo1", "busyvideo01"}]
+    store.evict()
+    assert not os.path.exists(os.path.dirname(stale))
+    assert all(os.path.exists(p) for p in (fresh, busy_segment, busy_audio, pinned_audio))
+
+    busy.clear()
+    store.evict()
+    assert not os.path.exists(busy_audio) and not os.path.exists(busy_segment)
+    assert os.path.exists(pinned_audio)
+
+
+def test_single_flight_lock_is_visible_to_other_instances(tmp_path):
+    holder, other = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    assert not other.locked("video")
+    with open(os.path.join(str(tmp_path), "video.lock"), "a") as lock_file:
+        assert holder._try_lock(lock_file)
+        assert other.locked("video")
+        holder._unlock(lock_file)
+    assert not other.locked("video")
+
+
+def test_active_ingest_jobs(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.sqlite3"), handlers={})
+    assert jobs.active_keys("ingest") == set()
+    jobs.submit("ingest", "queuedvideo", {"video_url": "https://youtu.be/queuedvideo"})
+    assert jobs.active_keys("ingest") == {"queuedvideo"}
+    assert jobs.active_keys("other") == set()
+
+
+def test_eviction_removes_others_in_place_of_busy_videos(tmp_path):
+    store = make_store(tmp_path, max_bytes=1, in_use=lambda video_ids: {"busyvideo01"} & video_ids)
+    for video_id in ("busyvideo01", "idlevideo01", "newvideo001"):
+        store.put(video_id, f"{video_id} " * 100, "asr")
+    assert [e["video_id"] for e in store.entries()] == ["busyvideo01"]
+
+
+def test_access_times_kept_in_memory_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcript_store, "_TOUCHED_ENTRIES", 3)
+    store = make_store(tmp_path, hot_entries=1)
+    for n in range(6):
+        store.put(f"video{n:07d}", f"text {n}", "asr")
+        assert store.get(f"video{n:07d}")["transcript"] == f"text {n}"
+    assert len(store._touched) == 3
+    store.delete("video0000005")
+    assert len(store._touched) == 2
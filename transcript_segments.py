@@ -0,0 +1,114 @@
+import bisect
+import re
+from array import array
+
+_SPACE_RE = re.compile(r"\s+")
+_SENTENCE_END = (".", "?", "!")
+
+
+def format_timestamp(seconds):
+    """m:ss, or h:mm:ss from an hour on, as YouTube shows positions."""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class Segments:
+    """
+    A transcript as parallel arrays: start and end times in milliseconds and
+    the text spoken in between, instead of a list of per-word dicts.
+
+    The transcript text is the segment texts joined by single spaces, so a
+    character offset into it (e.g. the start of a retrieval chunk) maps to a
+    segment, and from there to a time, by binary search. Transcripts cached
+    before timestamps were kept load as one untimed segment.
+    """
+
+    def __init__(self, starts, ends, texts, timed=True):
+        self.starts = array("q", starts)
+        self.ends = array("q", ends)
+        self.texts = list(texts)
+        self.timed = timed
+        self.offsets = array("q")
+        position = 0
+        for text in self.texts:
+            self.offsets.append(position)
+            position += len(text) + 1
+
+    def __len__(self):
+        return len(self.texts)
+
+    @property
+    def text(self):
+        return " ".join(self.texts)
+
+    @classmethod
+    def untimed(cls, text):
+        return cls([0], [0], [text], timed=False)
+
+    @classmethod
+    def from_triples(cls, triples):
+        """From (start_seconds, end_seconds, text) tuples, as the caption parsers return them."""
+        starts, ends, texts = [], [], []
+        for start, end, text in triples:
+            text = _SPACE_RE.sub(" ", text).strip()
+            if text:
+                starts.append(round(start * 1000))
+                ends.append(round(end * 1000))
+                texts.append(text)
+        return cls(starts, ends, texts)
+
+    @classmethod
+    def from_words(cls, words, max_seconds=30.0):
+        """
+        Group word timings (objects with text, and start/end in milliseconds,
+        like AssemblyAI's) into sentences, split further so no segment is
+        longer than max_seconds.
+        """
+        starts, ends, texts = [], [], []
+        current, current_end = [], 0
+        for word in words:
+            if current and word.end - starts[-1] > max_seconds * 1000:
+                ends.append(current_end)
+                texts.append(" ".join(current))
+                current = []
+            if not current:
+                starts.append(word.start)
+            current.append(word.text)
+            current_end = word.end
+            if word.text.endswith(_SENTENCE_END):
+                ends.append(current_end)
+                texts.append(" ".join(current))
+                current = []
+        if current:
+            ends.append(current_end)
+            texts.append(" ".join(current))
+        return cls(starts, ends, texts)
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Segments of a TranscriptStore entry; text-only entries become one untimed segment."""
+        data = entry.get("segments")
+        if not data:
+            return cls.untimed(entry["transcript"])
+        return cls(data["starts"], data["ends"], data["texts"])
+
+    def to_dict(self):
+        return {"starts": self.starts.tolist(), "ends": self.ends.tolist(), "texts": self.texts}
+
+    # Lookups
+
+    def segment_at_char(self, offset):
+        """Index of the segment containing character `offset` of the transcript text."""
+        return max(0, bisect.bisect_right(self.offsets, offset) - 1)
+
+    def time_at_char(self, offset):
+        """
+        Seconds into the video at character `offset`, interpolated within its
+        segment so long segments (e.g. one per chunk of audio) still give a
+        usable position.
+        """
+        i = self.segment_at_char(offset)
+        length = len(self.texts[i]) or 1
+        fraction = min(1.0, max(0.0, (offset - self.offsets[i]) / length))
+        return (self.starts[i] + (self.ends[i] - self.starts[i]) * fraction) / 1000
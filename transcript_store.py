@@ -0,0 +1,451 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from state_store import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    video_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    source TEXT,
+    duration REAL,
+    token_count INTEGER,
+    size_bytes INTEGER NOT NULL,
+    sha256 TEXT,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_last_access ON transcripts (last_access);
+"""
+
+# Only persist last_access when it moved by more than this, to keep reads write-free
+_ACCESS_RESOLUTION = 300
+_TOUCHED_ENTRIES = 10000
+
+
+def _atomic_write(path, data):
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class TranscriptStore:
+    """
+    Transcript storage: gzip-compressed JSON payloads written atomically,
+    a SQLite metadata index (source, duration, token count, size, checksum,
+    last access), an in-process LRU of hot entries, and size/age based
+    eviction of both transcripts and downloaded audio.
+
+    Plain <video_id>.json files from the previous cache format are still
+    read, and are registered in the index the first time they are used.
+    They are also how pre-cached transcripts ship with the app, so they and
+    their audio are pinned: eviction skips them and delete() keeps the file
+    unless forced. So are the videos in `pinned`, and those `in_use` reports
+    busy: a callable that takes a set of video ids and returns the ones in
+    use (e.g. with a queued or running ingest job). Eviction only asks
+    about the videos it is about to remove, once per pass.
+    """
+
+    def __init__(self, root, audio_dir, hot_entries=32, max_bytes=0, max_age=0, audio_max_bytes=0,
+                 audio_max_age=0, pinned=(), in_use=None):
+        self.root = root
+        self.audio_dir = audio_dir
+        self.segments_dir = os.path.join(root, "segments")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.audio_max_bytes = audio_max_bytes
+        self.audio_max_age = audio_max_age
+        self.pinned = set(pinned)
+        self.in_use = in_use or (lambda video_ids: set())
+        self.hot = LRUCache(max_entries=hot_entries)
+        self.db_path = os.path.join(root, "index.sqlite3")
+        self._evict_lock = threading.Lock()
+        # When each video's last_access was last written, to skip redundant updates
+        self._touched = LRUCache(max_entries=max(hot_entries, _TOUCHED_ENTRIES))
+        self._setup_lock = threading.Lock()
+        self._ready = False
+
+    @classmethod
+    def from_env(cls, root="transcript_cache", audio_dir="audio_downloads"):
+        mb, day = 1024 * 1024, 24 * 3600
+        return cls(
+            root,
+            audio_dir,
+            hot_entries=int(os.getenv("TRANSCRIPT_MEMORY_ENTRIES", "32")),
+            max_bytes=int(float(os.getenv("TRANSCRIPT_STORE_MAX_MB", "300")) * mb),
+            max_age=float(os.getenv("TRANSCRIPT_STORE_MAX_AGE_DAYS", "0")) * day,
+            audio_max_bytes=int(float(os.getenv("AUDIO_MAX_MB", "200")) * mb),
+            audio_max_age=float(os.getenv("AUDIO_MAX_AGE_HOURS", "24")) * 3600,
+            pinned=[v.strip() for v in os.getenv("TRANSCRIPT_STORE_PINNED", "").split(",") if v.strip()],
+        )
+
+    def setup(self):
+        """Create the directories and the index schema; done on first use, or up front by the app's start()."""
+        if self._ready:
+            return
+        with self._setup_lock:
+            if self._ready:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            os.makedirs(self.audio_dir, exist_ok=True)
+            conn = self._open()
+            try:
+                conn.executescript(_SCHEMA)
+            finally:
+                conn.close()
+            self._ready = True
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _connect(self):
+        self.setup()
+        return self._open()
+
+    def _path(self, filename):
+        return os.path.join(self.root, filename)
+
+    def _seed_path(self, video_id):
+        return self._path(f"{video_id}.json")
+
+    def is_pinned(self, video_id):
+        """Whether video_id's transcript and audio are exempt from eviction (shipped with the app, or configured)."""
+        return video_id in self.pinned or os.path.exists(self._seed_path(video_id))
+
+    # Reads
+
+    def get(self, video_id):
+        """Return the cached entry dict for video_id (with at least 'transcript' and 'source'), or None."""
+        entry = self.hot.get(video_id)
+        if entry is not None:
+            self._touch(video_id)
+            return entry
+        entry = self._load(video_id)
+        if entry is not None:
+            self.hot.set(video_id, entry)
+        return entry
+
+    def _load(self, video_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM transcripts WHERE video_id = ?", (video_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is not None:
+            entry = self._read_payload(row)
+            if entry is not None:
+                self._touch(video_id, force=True)
+                return entry
+        return self._load_legacy(video_id)
+
+    def _read_payload(self, row):
+        path = self._path(row["filename"])
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if row["sha256"] and hashlib.sha256(data).hexdigest() != row["sha256"]:
+                raise ValueError("checksum mismatch")
+            if row["filename"].endswith(".gz"):
+                data = gzip.decompress(data)
+            entry = json.loads(data)
+            entry["transcript"]
+        except FileNotFoundError:
+            logger.warning(f"Transcript file for {row['video_id']} is missing; dropping index entry")
+            self.delete(row["video_id"])
+            return None
+        except (OSError, ValueError, KeyError, EOFError) as e:
+            logger.error(f"Corrupt transcript for {row['video_id']} ({e}); discarding it")
+            self.delete(row["video_id"])
+            return None
+        return entry
+
+    def _load_legacy(self, video_id):
+        filename = f"{video_id}.json"
+        path = self._path(filename)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            entry = json.loads(data)
+            transcript = entry["transcript"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Unreadable legacy cache file {path}: {e}")
+            return None
+        entry.setdefault("source", "asr")
+        self._index(video_id, filename, entry["source"], entry.get("duration"), _count_tokens(transcript),
+                    len(data), None)
+        return entry
+
+    def _touch(self, video_id, force=False):
+        now = time.time()
+        if not force and now - self._touched.get(video_id, 0) < _ACCESS_RESOLUTION:
+            return
+        self._touched.set(video_id, now)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE transcripts SET last_access = ? WHERE video_id = ? AND last_access < ?",
+                (now, video_id, now if force else now - _ACCESS_RESOLUTION),
+            )
+        finally:
+            conn.close()
+
+    # Writes
+
+    def put(self, video_id, transcript, source, duration=None, extra=None):
+        entry = {"video_id": video_id, "transcript": transcript, "source": source, "duration": duration}
+        entry.update(extra or {})
+        self.setup()
+        payload = gzip.compress(json.dumps(entry).encode("utf-8"), compresslevel=6)
+        filename = f"{video_id}.json.gz"
+        _atomic_write(self._path(filename), payload)
+        self._index(video_id, filename, source, duration, _count_tokens(transcript), len(payload),
+                    hashlib.sha256(payload).hexdigest())
+        self.hot.set(video_id, entry)
+        self.evict()
+        return entry
+
+    def _index(self, video_id, filename, source, duration, token_count, size_bytes, sha256):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO transcripts (video_id, filename, source, duration, token_count, size_bytes, sha256, "
+                "created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(video_id) DO UPDATE SET filename = excluded.filename, source = excluded.source, "
+                "duration = excluded.duration, token_count = excluded.token_count, "
+                "size_bytes = excluded.size_bytes, sha256 = excluded.sha256, last_access = excluded.last_access",
+                (video_id, filename, source, duration, token_count, size_bytes, sha256, now, now),
+            )
+        finally:
+            conn.close()
+
+    def delete(self, video_id, force=False):
+        """
+        Remove a transcript with its derived files (retrieval index, compressed
+        payload) and index row. A plain <video_id>.json shipped with the app is
+        kept, and read again on next use, unless force is set.
+        """
+        self.hot.pop(video_id)
+        self._touched.pop(video_id)
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT filename FROM transcripts WHERE video_id = ?", (video_id,)).fetchone()
+            conn.execute("DELETE FROM transcripts WHERE video_id = ?", (video_id,))
+        finally:
+            conn.close()
+        filenames = {f"{video_id}.json.gz", f"{video_id}.index.json"}
+        if row is not None:
+            filenames.add(row["filename"])
+        if not force:
+            filenames.discard(f"{video_id}.json")
+        freed = 0
+        for filename in filenames:
+            path = self._path(filename)
+            if os.path.exists(path):
+                freed += os.path.getsize(path)
+                os.unlink(path)
+        return freed
+
+    # Eviction
+
+    def entries(self):
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute("SELECT * FROM transcripts ORDER BY last_access DESC")]
+        finally:
+            conn.close()
+
+    def audio_files(self):
+        """Downloaded audio and leftover chunked-transcription segment caches, newest first."""
+        files = []
+        for name in os.listdir(self.audio_dir):
+            path = os.path.join(self.audio_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                files.append({"path": path, "video_id": name.split(".", 1)[0], "size_bytes": stat.st_size,
+                              "mtime": stat.st_mtime})
+        if os.path.isdir(self.segments_dir):
+            for name in os.listdir(self.segments_dir):
+                path = os.path.join(self.segments_dir, name)
+                if os.path.isdir(path):
+                    stats = [os.stat(os.path.join(path, f)) for f in os.listdir(path)]
+                    files.append({"path": path, "video_id": name, "size_bytes": sum(st.st_size for st in stats),
+                                  "mtime": max([st.st_mtime for st in stats] or [os.stat(path).st_mtime])})
+        return sorted(files, key=lambda f: f["mtime"], reverse=True)
+
+    def evict(self, dry_run=False):
+        """
+        Apply the age and size limits (0 disables a limit). Least recently
+        used transcripts and oldest audio files go first; pinned videos and
+        those being ingested are skipped and not counted against the limits.
+        Returns a summary of what was (or, with dry_run, would be) removed.
+        """
+        now = time.time()
+        removed = {"transcripts": [], "audio": [], "bytes": 0}
+        busy = _BusyCheck(self.in_use)
+        with self._evict_lock:
+            entries = [e for e in self.entries() if not self.is_pinned(e["video_id"])]
+            for entry in busy.exclude(entries, lambda items: _over_limits(
+                    items, lambda e: e["last_access"], self.max_bytes, self.max_age, now)):
+                removed["transcripts"].append(entry["video_id"])
+                removed["bytes"] += entry["size_bytes"]
+                if not dry_run:
+                    self.delete(entry["video_id"])
+
+            files = [f for f in self.audio_files() if not self.is_pinned(f["video_id"])]
+            for f in busy.exclude(files, lambda items: _over_limits(
+                    items, lambda f: f["mtime"], self.audio_max_bytes, self.audio_max_age, now)):
+                removed["audio"].append(f["path"])
+                removed["bytes"] += f["size_bytes"]
+                if not dry_run:
+                    if os.path.isdir(f["path"]):
+                        shutil.rmtree(f["path"], ignore_errors=True)
+                        continue
+                    try:
+                        os.unlink(f["path"])
+                    except FileNotFoundError:
+                        pass
+        if removed["transcripts"] or removed["audio"]:
+            logger.info(
+                f"{'Would evict' if dry_run else 'Evicted'} {len(removed['transcripts'])} transcript(s) and "
+                f"{len(removed['audio'])} audio file(s), {removed['bytes']} bytes"
+            )
+        return removed
+
+    def stats(self):
+        entries = self.entries()
+        files = self.audio_files()
+        return {
+            "transcripts": len(entries),
+            "transcript_bytes": sum(e["size_bytes"] for e in entries),
+            "transcript_tokens": sum(e["token_count"] or 0 for e in entries),
+            "sources": {s: sum(1 for e in entries if e["source"] == s) for s in {e["source"] for e in entries}},
+            "pinned": sorted(e["video_id"] for e in entries if self.is_pinned(e["video_id"])),
+            "audio_files": len(files),
+            "audio_bytes": sum(f["size_bytes"] for f in files),
+            "limits": {
+                "transcript_max_bytes": self.max_bytes,
+                "transcript_max_age_seconds": self.max_age,
+                "audio_max_bytes": self.audio_max_bytes,
+                "audio_max_age_seconds": self.audio_max_age,
+            },
+        }
+
+    def register_legacy(self):
+        """Index every plain <video_id>.json in the store so it is covered by stats and eviction."""
+        self.setup()
+        count = 0
+        for name in os.listdir(self.root):
+            if name.endswith(".json") and not name.endswith(".index.json"):
+                video_id = name[:-len(".json")]
+                if self._load(video_id) is not None:
+                    count += 1
+        return count
+
+
+def _over_limits(items, stamp, max_bytes, max_age, now):
+    """Items (newest first) to remove, oldest first, so the rest are within max_age and max_bytes (0: no limit)."""
+    total = sum(item["size_bytes"] for item in items)
+    doomed = []
+    for item in reversed(items):
+        too_old = max_age and now - stamp(item) > max_age
+        too_big = max_bytes and total > max_bytes
+        if too_old or too_big:
+            doomed.append(item)
+            total -= item["size_bytes"]
+    return doomed
+
+
+class _BusyCheck:
+    """Asks in_use about each video at most once per eviction pass, and only about videos due for removal."""
+
+    def __init__(self, in_use):
+        self.in_use = in_use
+        self.checked = set()
+        self.busy = set()
+
+    def exclude(self, items, plan):
+        """plan(items) minus busy videos; busy ones are left out of the limits, so others may go in their place."""
+        while True:
+            doomed = plan([item for item in items if item["video_id"] not in self.busy])
+            unchecked = {item["video_id"] for item in doomed} - self.checked
+            if not unchecked:
+                return doomed
+            self.checked |= unchecked
+            self.busy |= set(self.in_use(unchecked))
+
+
+def _count_tokens(text):
+    from retrieval import count_tokens
+    return count_tokens(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and prune the transcript and audio store.")
+    parser.add_argument("--root", default="transcript_cache")
+    parser.add_argument("--audio-dir", default="audio_downloads")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("ls", help="list transcripts, most recently used first")
+    sub.add_parser("stats", help="show totals and configured limits")
+    show = sub.add_parser("show", help="print one transcript entry as JSON")
+    show.add_argument("video_id")
+    rm = sub.add_parser("rm", help="delete one transcript")
+    rm.add_argument("video_id")
+    rm.add_argument("--force", action="store_true", help="also delete a pre-cached <video_id>.json shipped with the app")
+    prune = sub.add_parser("prune", help="apply size/age limits now")
+    prune.add_argument("--dry-run", action="store_true")
+    sub.add_parser("reindex", help="register legacy .json cache files in the index")
+    args = parser.parse_args(argv)
+
+    store = TranscriptStore.from_env(args.root, args.audio_dir)
+    if args.command == "ls":
+        for e in store.entries():
+            accessed = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["last_access"]))
+            duration = f"{e['duration']:.0f}s" if e["duration"] else "-"
+            print(f"{e['video_id']}  {e['source'] or '-':16} {duration:>7} {e['token_count'] or 0:>8} tok "
+                  f"{e['size_bytes']:>9} B  {accessed}")
+    elif args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+    elif args.command == "show":
+        entry = store.get(args.video_id)
+        if entry is None:
+            print(f"No transcript for {args.video_id}", file=sys.stderr)
+            return 1
+        print(json.dumps(entry, indent=2))
+    elif args.command == "rm":
+        print(f"Freed {store.delete(args.video_id, force=args.force)} bytes")
+    elif args.command == "prune":
+        print(json.dumps(store.evict(dry_run=args.dry_run), indent=2))
+    elif args.command == "reindex":
+        print(f"Indexed {store.register_legacy()} legacy transcript(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,54 +1,144 @@
-import csv
-import json
+import asyncio
+import importlib
 import logging
 import os
 import re
 import sys
+import threading
 import time
-from datetime import datetime
+import uuid
 
-import assemblyai as aai
-import yt_dlp
-from openai import OpenAI
-from ratelimit import limits, sleep_and_retry
 import base64
 import tempfile
 
-# Configure logging to print to console
+from answer_cache import AnswerCache, replay, replay_async
+from conversation_memory import ConversationHistory, ConversationMemory
+from captions import fetch_captions
+from chunked_transcription import ChunkedTranscriber
+from interaction_log import InteractionLog
+from jobs import JobQueue, RetryableJobError
+from metrics import TraceIdFilter, metrics, set_trace_id
+from rate_limiter import RateLimiter, RateLimitExceeded
+from retrieval import BM25Index, index_params, load_index, save_index, tokenize_terms
+from singleflight import SingleFlight
+from state_store import LRUCache
+from transcript_segments import Segments, format_timestamp
+from transcript_store import TranscriptStore
+
+# Configure logging to print to console, optionally tagging each line with
+# the trace id of the request or job that produced it
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.addFilter(TraceIdFilter())
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
+    format=('%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
+            if os.getenv("LOG_TRACE_IDS", "0").lower() in ("1", "true", "yes")
+            else '%(asctime)s - %(name)s - %(levelname)s - %(message)s'),
+    handlers=[_log_handler]
 )
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_FAILED = "Error: Failed to download audio from video"
+
+# Bump whenever the prompt wording changes so cached answers are not reused
+PROMPT_VERSION = 3
+DEFAULT_MODEL = "gpt-4o-mini"
+
+SYSTEM_PROMPT = (
+    "You are an AI assistant that answers questions based on the provided YouTube video transcript. "
+    "While you should prioritize information from the transcript, you can also provide general explanations "
+    "for concepts mentioned in the video, even if they're not explicitly defined. If a concept is mentioned "
+    "but not fully explained, you can provide a brief general explanation. If a question is completely "
+    "unrelated to the video content, politely redirect the user to ask about topics covered in the video."
+)
+
+# Client libraries imported on first use; start() warms them up in the background
+HEAVY_MODULES = ("openai", "yt_dlp", "assemblyai")
+
+# Feedback log written before the SQLite interaction log; imported once, by start()
+LEGACY_CSV_LOG = "qa_feedback_log.csv"
+
 
 class YouTubeQAApp:
     def __init__(self):
         logger.info("Initializing YouTubeQAApp")
-        self.transcript = ""
-        self.current_question = ""
-        self.current_answer = ""
-        self.user_info = {}
-        self.current_feedback = None
-        self.current_video_url = ""
+        self.indexes = LRUCache(max_entries=int(os.getenv("TRANSCRIPT_MEMORY_ENTRIES", "32")))
+        self.segments = LRUCache(max_entries=int(os.getenv("TRANSCRIPT_MEMORY_ENTRIES", "32")))
+        self.outlines = LRUCache(max_entries=int(os.getenv("TRANSCRIPT_MEMORY_ENTRIES", "32")))
+        # Retrieval settings: transcripts longer than the budget are cut down to
+        # the top-k BM25 chunks that fit in it before being sent to the model.
+        self.chunk_tokens = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "300"))
+        self.chunk_overlap_tokens = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP_TOKENS", "50"))
+        self.retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+        self.context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        # Optional fixed outline at the start of excerpt prompts. It lets their prefix reach OpenAI's 1024-token
+        # caching minimum, but is mostly padding, so it costs more per question than it saves; off by default
+        self.outline_tokens = int(os.getenv("PROMPT_OUTLINE_TOKENS", "0"))
+        # Timestamps of the best-matching passages streamed after each answer
+        self.citation_count = int(os.getenv("CITATION_COUNT", "3"))
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.assemblyai_api_key = os.getenv("ASSEMBLYAI_API_KEY")
         if not self.openai_api_key:
             logger.warning("OpenAI API key not set")
         if not self.assemblyai_api_key:
             logger.warning("AssemblyAI API key not set")
-        self.client = OpenAI(api_key=self.openai_api_key)
-        aai.settings.api_key = self.assemblyai_api_key
-        self.transcriber = aai.Transcriber()
-        self.feedback_provided = True
-        self.last_question_unrelated = False
+        # yt-dlp, AssemblyAI and OpenAI take most of the import time, so they
+        # are imported and their clients built on first use (see client,
+        # transcriber and cookies_file); web workers start without them.
+        self._client = None
+        self._transcriber = None
+        self._cookies_file = None
+        self._cookies_prepared = False
+        self._lazy_lock = threading.Lock()
+        # Per-deployment completion settings; unset ones use the API defaults
+        self.model = os.getenv("OPENAI_MODEL") or DEFAULT_MODEL
+        self.max_tokens = int(os.getenv("OPENAI_MAX_TOKENS")) if os.getenv("OPENAI_MAX_TOKENS") else None
+        self.temperature = float(os.getenv("OPENAI_TEMPERATURE")) if os.getenv("OPENAI_TEMPERATURE") else None
+        # Only used by the ASGI server (asgi.py); created lazily in its event loop
+        self.async_client = None
+        self.openai_max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "1000"))
+        self.rate_limiter = RateLimiter.from_env()
+        self.answer_cache = AnswerCache.from_env()
+        self.answer_replay_delay = float(os.getenv("ANSWER_CACHE_REPLAY_DELAY", "0.02"))
+        # Follow-up questions see earlier turns, older ones as a rolling summary
+        self.conversation = ConversationMemory.from_env(self.summarize_conversation)
+        self.transcribe_poll_interval = float(os.getenv("TRANSCRIBE_POLL_INTERVAL", "3"))
         self.cache_dir = "transcript_cache"
         self.download_dir = "audio_downloads"
-        os.makedirs(self.cache_dir, exist_ok=True)
-        os.makedirs(self.download_dir, exist_ok=True)
+        # Transcripts are shared by every session that loads the same video
+        self.store = TranscriptStore.from_env(self.cache_dir, self.download_dir)
+        # Captions-first ingestion skips the audio download when subtitles exist
+        self.captions_first = os.getenv("CAPTIONS_FIRST", "1").lower() in ("1", "true", "yes")
+        self.caption_languages = tuple(
+            lang.strip() for lang in os.getenv("CAPTION_LANGUAGES", "en").split(",") if lang.strip()
+        )
+        self.captions_min_words = int(os.getenv("CAPTIONS_MIN_WORDS", "50"))
+        # Optional parallel transcription of long audio as overlapping segments
+        self.chunked_transcription = os.getenv("CHUNKED_TRANSCRIPTION", "0").lower() in ("1", "true", "yes")
+        self.chunked_min_duration = float(os.getenv("CHUNKED_MIN_DURATION_SECONDS", "1200"))
+        self.chunked_transcriber = ChunkedTranscriber(
+            self,
+            os.path.join(self.cache_dir, "segments"),
+            segment_seconds=float(os.getenv("CHUNKED_SEGMENT_SECONDS", "600")),
+            overlap_seconds=float(os.getenv("CHUNKED_OVERLAP_SECONDS", "10")),
+            max_workers=int(os.getenv("CHUNKED_MAX_WORKERS", "4")),
+        )
+        # Shared between gunicorn workers; the persistent disk on Render. Like the transcript
+        # store, the databases in it are created on first use or by start(), not here.
+        self.data_dir = os.getenv("DATA_DIR") or ("/app/data" if os.path.isdir("/app/data") else "data")
+        metrics.configure(os.path.join(self.data_dir, "metrics"),
+                          flush_interval=float(os.getenv("METRICS_FLUSH_SECONDS", "10")))
+        self.flights = SingleFlight(os.path.join(self.data_dir, "locks"))
+        self.jobs = JobQueue(
+            os.path.join(self.data_dir, "jobs.sqlite3"),
+            handlers={"ingest": self._run_ingest_job},
+            workers=int(os.getenv("INGEST_WORKERS", "2")),
+            max_attempts=int(os.getenv("INGEST_MAX_ATTEMPTS", "3")),
+            retry_backoff=float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "5")),
+        )
+        # Eviction leaves alone the audio and segments of videos still being ingested
+        self.store.in_use = self.ingests_in_progress
+        self.interactions = InteractionLog.from_env(os.path.join(self.data_dir, "interactions.sqlite3"))
 
         # Environment and cookies configuration
         self.is_server = bool(os.getenv("RENDER") or os.getenv("RENDER_SERVICE_ID") or os.getenv("RENDER_EXTERNAL_URL"))
@@ -57,17 +147,103 @@ class YouTubeQAApp:
         # On servers like Render, force-disable browser cookie probing to avoid noisy failures
         if self.is_server:
             self.enable_browser_cookies = False
-        self.cookies_file = None
-        self._prepare_cookies()
         logger.info(
-            "Startup env: is_server=%s, offline_mode=%s, enable_browser_cookies=%s, cookies_file=%s",
+            "Startup env: is_server=%s, offline_mode=%s, enable_browser_cookies=%s",
             self.is_server,
             self.offline_mode,
             self.enable_browser_cookies,
-            self.cookies_file,
         )
+        # Background threads are started per process by start(); a fork (gunicorn
+        # --preload) must not inherit the parent's clients, threads or job ownership
+        self._started_pid = None
+        os.register_at_fork(after_in_child=self._after_fork)
+        # With gunicorn --preload the master imports them once and workers share them
+        self.preload_dependencies = os.getenv("PRELOAD_DEPENDENCIES", "0").lower() in ("1", "true", "yes")
+        if self.preload_dependencies:
+            self.import_dependencies()
         logger.info("YouTubeQAApp initialized successfully")
 
+    def start(self):
+        """
+        Set up the databases, import the legacy CSV log, and start this
+        process's background threads: metrics flushing and, unless
+        OFFLINE_MODE is set, the ingestion job workers. Idempotent, and cheap
+        enough to call on every request; the servers call it on startup and
+        before requests, so with a preloading master they start in each worker.
+        """
+        if self._started_pid == os.getpid():
+            return
+        with self._lazy_lock:
+            if self._started_pid == os.getpid():
+                return
+            self.store.setup()
+            self.jobs.setup()
+            self.interactions.setup()
+            try:
+                self.interactions.import_csv(LEGACY_CSV_LOG, self.extract_video_id)
+            except Exception as e:
+                logger.error(f"Failed to import {LEGACY_CSV_LOG}: {e}")
+            metrics.start()
+            if not self.offline_mode:
+                self.jobs.start()
+            if not self.preload_dependencies:
+                # So the first question doesn't wait for them
+                threading.Thread(target=self.import_dependencies, name="import-dependencies", daemon=True).start()
+            self._started_pid = os.getpid()
+            logger.info(f"Started background workers in process {self._started_pid}")
+
+    def import_dependencies(self):
+        """Import the client libraries (not the clients) ahead of first use; OFFLINE_MODE only needs openai."""
+        started = time.perf_counter()
+        for name in HEAVY_MODULES[:1] if self.offline_mode else HEAVY_MODULES:
+            importlib.import_module(name)
+        logger.info(f"Imported client libraries in {time.perf_counter() - started:.2f}s")
+
+    def _after_fork(self):
+        # Connection pools and locks may be mid-use in the parent; start over
+        self._client = None
+        self._transcriber = None
+        self.async_client = None
+        self._lazy_lock = threading.Lock()
+        self.jobs.after_fork()
+        self.interactions.after_fork()
+
+    @property
+    def client(self):
+        """OpenAI client, created on first use."""
+        if self._client is None:
+            with self._lazy_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.openai_api_key)
+        return self._client
+
+    @property
+    def transcriber(self):
+        """AssemblyAI transcriber, created on first use."""
+        if self._transcriber is None:
+            with self._lazy_lock:
+                if self._transcriber is None:
+                    import assemblyai as aai
+                    aai.settings.api_key = self.assemblyai_api_key
+                    self._transcriber = aai.Transcriber()
+        return self._transcriber
+
+    def transcribe(self, path):
+        """Blocking AssemblyAI transcription of one file, for ChunkedTranscriber."""
+        return self.transcriber.transcribe(path)
+
+    @property
+    def cookies_file(self):
+        """Cookie file for yt-dlp (or None), prepared on first download."""
+        if not self._cookies_prepared:
+            with self._lazy_lock:
+                if not self._cookies_prepared:
+                    self._prepare_cookies()
+                    self._cookies_prepared = True
+                    logger.info(f"yt-dlp cookies_file={self._cookies_file}")
+        return self._cookies_file
+
     def _prepare_cookies(self):
         """
         Prepare a cookies file for yt-dlp based on environment variables.
@@ -83,8 +259,8 @@ class YouTubeQAApp:
 
             # Prefer existing file path if valid
             if cookies_path and os.path.isfile(cookies_path):
-                self.cookies_file = cookies_path
-                logger.info(f"Using cookies file from YTDLP_COOKIES_FILE: {self.cookies_file}")
+                self._cookies_file = cookies_path
+                logger.info(f"Using cookies file from YTDLP_COOKIES_FILE: {self._cookies_file}")
                 return
 
             # If raw or b64 provided, write to a persistent file if possible
@@ -104,21 +280,22 @@ class YouTubeQAApp:
                 dest = os.path.join(base_dir, "cookies.txt")
                 with open(dest, "w") as f:
                     f.write(content)
-                self.cookies_file = dest
-                logger.info(f"Wrote cookies to: {self.cookies_file}")
+                self._cookies_file = dest
+                logger.info(f"Wrote cookies to: {self._cookies_file}")
                 return
 
             # No cookies available
-            self.cookies_file = None
+            self._cookies_file = None
             logger.info("No yt-dlp cookies provided via environment.")
         except Exception as e:
             logger.warning(f"Cookie preparation failed: {e}")
-            self.cookies_file = None
+            self._cookies_file = None
 
     @staticmethod
     def extract_video_id(url):
         logger.info(f"Extracting video ID from URL: {url}")
-        video_id_match = re.search(r"(?:v=|\/)([0-9A-Za-z_-]{11}).*", url)
+        with metrics.span("extract_video_id"):
+            video_id_match = re.search(r"(?:v=|\/)([0-9A-Za-z_-]{11}).*", url)
         if video_id_match:
             video_id = video_id_match.group(1)
             logger.info(f"Video ID extracted: {video_id}")
@@ -127,32 +304,212 @@ class YouTubeQAApp:
             logger.warning(f"Could not extract video ID from URL: {url}")
             return None
 
-    def get_cache_filename(self, video_id):
-        return os.path.join(self.cache_dir, f"{video_id}.json")
-
     def get_transcript_from_cache(self, video_id):
-        cache_file = self.get_cache_filename(video_id)
-        if os.path.exists(cache_file):
-            with open(cache_file, 'r') as f:
-                cached_data = json.load(f)
-            logger.info(f"Transcript loaded from cache for video ID: {video_id}")
-            return cached_data['transcript']
-        return None
+        entry = self.store.get(video_id)
+        if entry is None:
+            return None
+        logger.info(f"Transcript loaded from cache for video ID: {video_id}")
+        return entry['transcript']
 
-    def save_transcript_to_cache(self, video_id, transcript):
-        cache_file = self.get_cache_filename(video_id)
-        with open(cache_file, 'w') as f:
-            json.dump({'video_id': video_id, 'transcript': transcript}, f)
-        logger.info(f"Transcript saved to cache for video ID: {video_id}")
-
-    def download_progress_hook(self, d):
-        if d['status'] == 'downloading':
-            progress = int(float(d['_percent_str'].strip('%')))
-            yield ('download', progress)
-        elif d['status'] == 'finished':
-            yield ('download', 100)
+    def save_transcript_to_cache(self, video_id, transcript, source="asr", duration=None, segments=None):
+        extra = {"segments": segments.to_dict()} if segments is not None and segments.timed else None
+        self.store.put(video_id, transcript, source, duration, extra)
+        logger.info(f"Transcript saved to cache for video ID: {video_id} (source: {source})")
+
+    def get_index_filename(self, video_id):
+        return os.path.join(self.cache_dir, f"{video_id}.index.json")
+
+    def get_index(self, video_id, transcript):
+        """Return the retrieval index for video_id, building and persisting it on first use."""
+        index = self.indexes.get(video_id)
+        if index is not None:
+            return index
+        params = index_params(self.chunk_tokens, self.chunk_overlap_tokens)
+        index_file = self.get_index_filename(video_id)
+        index = load_index(index_file, params)
+        if index is None:
+            start = time.time()
+            index = BM25Index.build(transcript, self.chunk_tokens, self.chunk_overlap_tokens)
+            try:
+                save_index(index, index_file)
+            except OSError as e:
+                logger.warning(f"Could not persist retrieval index for video ID {video_id}: {e}")
+            logger.info(
+                f"Built retrieval index for video ID {video_id}: {len(index.chunks)} chunks, "
+                f"{index.total_tokens} tokens in {time.time() - start:.2f}s"
+            )
+        self.indexes.set(video_id, index)
+        return index
+
+    def get_segments(self, video_id, transcript):
+        """Timestamped segments of a cached transcript; one untimed segment for text-only entries."""
+        segments = self.segments.get(video_id)
+        if segments is None:
+            entry = self.store.get(video_id)
+            segments = Segments.from_entry(entry) if entry is not None else Segments.untimed(transcript)
+            self.segments.set(video_id, segments)
+        return segments
+
+    def get_outline(self, video_id, transcript):
+        """
+        Overview of a video sent ahead of the excerpts when it is too long to
+        send whole: the opening words of evenly spaced passages, with their
+        timestamps, within outline_tokens. It is the same for every question.
+        """
+        outline = self.outlines.get(video_id)
+        if outline is None:
+            index = self.get_index(video_id, transcript)
+            segments = self.get_segments(video_id, transcript)
+            lines = []
+            for i, text in index.outline(self.outline_tokens):
+                if segments.timed and i < len(index.spans):
+                    text = f"[{format_timestamp(segments.time_at_char(index.spans[i][0]))}] {text}"
+                lines.append(text)
+            outline = "\n".join(lines)
+            self.outlines.set(video_id, outline)
+        return outline
+
+    def select_context(self, video_id, transcript, question):
+        """
+        Return (context, is_excerpt, citations) for the prompt: the full
+        transcript if it fits the budget, else top-k chunks, and where in the
+        video the best matches of what is sent are.
+        """
+        index = self.get_index(video_id, transcript)
+        ranked = index.search(question, self.retrieval_top_k)
+        selected = index.select_chunks(ranked, self.context_token_budget)
+        citations = self.find_citations(video_id, transcript, question, ranked, selected)
+        if selected is None:
+            return transcript, False, citations
+        return index.join(selected), True, citations
+
+    def find_citations(self, video_id, transcript, question, ranked=None, selected=None):
+        """
+        Up to citation_count passages matching the question, best first, as
+        {"start", "end", "url", "text"} with times in seconds. A passage is the
+        segment of a matching retrieval chunk that shares most terms with the
+        question. Empty for transcripts without timestamps.
+        """
+        segments = self.get_segments(video_id, transcript)
+        if not segments.timed or self.citation_count <= 0:
+            return []
+        index = self.get_index(video_id, transcript)
+        if ranked is None:
+            ranked = index.search(question, self.retrieval_top_k)
+        terms = set(tokenize_terms(question))
+        citations, seen = [], set()
+        for i, score in ranked:
+            if score <= 0 or len(citations) >= self.citation_count or i >= len(index.spans):
+                break
+            if selected is not None and i not in selected:
+                continue
+            start, end = index.spans[i]
+            first, last = segments.segment_at_char(start), segments.segment_at_char(end - 1)
+            best = max(range(first, last + 1),
+                       key=lambda j: len(terms.intersection(tokenize_terms(segments.texts[j]))))
+            if best in seen:
+                continue  # overlapping chunks
+            seen.add(best)
+            # Long segments are clipped to the chunk
+            offset = segments.offsets[best]
+            lo, hi = max(start, offset), min(end, offset + len(segments.texts[best]))
+            seconds = segments.time_at_char(lo)
+            text = segments.texts[best][lo - offset:hi - offset]
+            citations.append({
+                "start": round(seconds, 1),
+                "end": round(segments.time_at_char(hi), 1),
+                "url": f"https://www.youtube.com/watch?v={video_id}&t={int(seconds)}s",
+                "text": text if len(text) <= 200 else text[:200].rsplit(" ", 1)[0] + "...",
+            })
+        return citations
+
+    def get_transcript(self, video_id):
+        """Return the transcript for video_id from the store (memory first, then disk)."""
+        if not video_id:
+            return None
+        with metrics.span("transcript_cache_lookup") as span:
+            transcript = self.get_transcript_from_cache(video_id)
+            span["result"] = "hit" if transcript else "miss"
+        metrics.inc("cache_requests_total", cache="transcript", result=span["result"])
+        return transcript
+
+    @staticmethod
+    def make_download_progress_hook(progress, info=None):
+        """
+        Build a yt-dlp progress hook that forwards download percentages to the
+        `progress` callback. Only whole-percent changes are forwarded. If `info`
+        is a dict, the video duration reported by yt-dlp is stored in it.
+        """
+        last = {"pct": -1}
 
-    def download_audio(self, video_url):
+        def hook(d):
+            if info is not None and d.get('info_dict', {}).get('duration'):
+                info['duration'] = d['info_dict']['duration']
+            if d['status'] == 'downloading':
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                if not total:
+                    return
+                pct = min(99, int(d.get('downloaded_bytes', 0) * 100 / total))
+            elif d['status'] == 'finished':
+                pct = 100
+            else:
+                return
+            if pct != last["pct"]:
+                last["pct"] = pct
+                progress(('download', pct))
+
+        return hook
+
+    @staticmethod
+    def _ydl_common_opts():
+        return {
+            'quiet': True,
+            'no_warnings': True,
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+                'Accept-Language': 'en-US,en;q=0.9'
+            }
+        }
+
+    def get_captions(self, video_url):
+        """Return (segments, source, duration) from the video's caption tracks, or None if there is no usable track."""
+        opts = {
+            **self._ydl_common_opts(),
+            'extractor_args': {'youtube': {'player_client': ['android', 'web']}},
+        }
+        if self.cookies_file:
+            opts['cookiefile'] = self.cookies_file
+        with metrics.span("captions") as span:
+            try:
+                found = fetch_captions(video_url, opts, self.caption_languages, self.captions_min_words)
+            except Exception as e:
+                logger.warning(f"Could not fetch captions for {video_url}: {e}")
+                span["result"] = "error"
+                return None
+            span["result"] = "found" if found else "none"
+        if not found:
+            return None
+        segments, source = found
+        return Segments.from_triples(segments), source, segments[-1][1]
+
+    @staticmethod
+    def _download_with(strategy, ydl_opts, video_url):
+        """Run one yt-dlp download attempt, recording its time and outcome under the cookie strategy name."""
+        with metrics.span("download", strategy=strategy) as span:
+            try:
+                import yt_dlp
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    info = ydl.extract_info(video_url, download=True)
+                    filename = ydl.prepare_filename(info)
+            except Exception:
+                span["result"] = "failed"
+                metrics.inc("download_attempts_total", strategy=strategy, result="failed")
+                raise
+            span["result"] = "ok"
+        metrics.inc("download_attempts_total", strategy=strategy, result="ok")
+        return filename
+
+    def download_audio(self, video_url, progress=None, info=None):
         logger.info(f"Downloading audio from video: {video_url}")
         video_id = self.extract_video_id(video_url)
         if not video_id:
@@ -161,29 +518,25 @@ class YouTubeQAApp:
         output_template = os.path.join(self.download_dir, f"{video_id}.%(ext)s")
 
         base_opts = {
+            **self._ydl_common_opts(),
             'format': 'm4a/bestaudio/best',
             'outtmpl': output_template,
-            'progress_hooks': [self.download_progress_hook],
-            'quiet': True,
-            'no_warnings': True,
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
-                'Accept-Language': 'en-US,en;q=0.9'
-            }
+            'progress_hooks': [self.make_download_progress_hook(progress, info)] if progress else [],
         }
+        # Strategies that failed before one worked, to see how often the fallbacks are needed
+        failed = 0
 
         # 1) Prefer an explicit cookie file provided via env
         if self.cookies_file:
             ydl_opts = {**base_opts, 'cookiefile': self.cookies_file}
             try:
                 logger.info(f"Attempting download with cookiefile: {self.cookies_file}")
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(video_url, download=True)
-                    filename = ydl.prepare_filename(info)
+                filename = self._download_with("cookiefile", ydl_opts, video_url)
                 logger.info(f"Audio downloaded successfully with cookiefile: {filename}")
                 return filename
             except Exception as e:
                 logger.warning(f"Failed with cookiefile: {e}")
+                failed += 1
                 # continue to next strategy
 
         # 2) Optionally try reading cookies from a local browser (off by default, problematic on servers)
@@ -194,13 +547,13 @@ class YouTubeQAApp:
                 ydl_opts = {**base_opts, 'cookiesfrombrowser': (browser,)}
                 try:
                     logger.info(f"Attempting download with {browser} cookies...")
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info = ydl.extract_info(video_url, download=True)
-                        filename = ydl.prepare_filename(info)
+                    filename = self._download_with(f"browser_{browser}", ydl_opts, video_url)
                     logger.info(f"Audio downloaded successfully using {browser} cookies: {filename}")
+                    metrics.inc("download_fallthroughs_total", failed, strategy=f"browser_{browser}")
                     return filename
                 except Exception as e:
                     logger.warning(f"Failed with {browser} cookies: {str(e)}")
+                    failed += 1
 
         # 3) Last resort: try without cookies with additional extractor args
         logger.info("Trying download without cookies but with additional options...")
@@ -210,10 +563,9 @@ class YouTubeQAApp:
         }
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=True)
-                filename = ydl.prepare_filename(info)
+            filename = self._download_with("no_cookies", ydl_opts, video_url)
             logger.info(f"Audio downloaded successfully without cookies: {filename}")
+            metrics.inc("download_fallthroughs_total", failed, strategy="no_cookies")
             return filename
         except Exception as e:
             logger.error(
@@ -221,22 +573,174 @@ class YouTubeQAApp:
                 "you may need to provide YouTube cookies. See README for YTDLP_COOKIES* env vars.",
                 video_id, str(e)
             )
+            metrics.inc("errors_total", stage="download")
             return None
 
-    def simulate_transcribe_progress(self):
-        for i in range(1, 101):
-            yield ('transcribe', i)
-            time.sleep(0.1)  # Adjust this value to control the speed of the simulated progress
+    def _fetch_transcript(self, transcript_id):
+        """Fetch the current state of a submitted transcript without waiting for completion."""
+        # Transcript.get_by_id blocks until the job finishes, so go through the
+        # SDK's API helper for a single status request instead.
+        import assemblyai as aai
+        return aai.api.get_transcript(aai.Client.get_default().http_client, transcript_id)
+
+    def transcribe_audio(self, audio_file, progress, duration=None):
+        """
+        Submit audio_file to AssemblyAI and poll until it finishes, reporting
+        each status change through `progress`. While the job is processing the
+        percentage is estimated from elapsed time against the audio duration.
+        Returns the completed transcript response; raises on failure.
+        """
+        import assemblyai as aai
+        progress(('status', 'uploading'))
+        submitted = self.transcriber.submit(audio_file)
+        transcript_id = submitted.id
+        logger.info(f"Transcription submitted: {transcript_id}")
+        progress(('status', 'submitted'))
+        progress(('transcribe', 5))
+
+        # AssemblyAI typically processes audio in a fraction of its duration
+        expected = max(15.0, (duration or 600) * 0.2)
+        status, started = None, time.time()
+        while True:
+            response = self._fetch_transcript(transcript_id)
+            if response.status != status:
+                status = response.status
+                logger.info(f"Transcription {transcript_id} status: {status}")
+                progress(('status', str(getattr(status, 'value', status))))
+            if status == aai.TranscriptStatus.completed:
+                progress(('transcribe', 100))
+                return response
+            if status == aai.TranscriptStatus.error:
+                raise RuntimeError(response.error or "Transcription failed")
+            if status == aai.TranscriptStatus.queued:
+                progress(('transcribe', 10))
+            else:
+                elapsed = time.time() - started
+                progress(('transcribe', min(95, 15 + int(80 * elapsed / expected))))
+            time.sleep(self.transcribe_poll_interval)
+
+    @staticmethod
+    def transcript_segments(response):
+        """Segments of a completed AssemblyAI transcript, from its word timings when it has them."""
+        words = getattr(response, "words", None)
+        if words:
+            return Segments.from_words(words)
+        return Segments.untimed(response.text or "")
+
+    def _store_transcript(self, video_id, segments, source, duration=None):
+        # Stored as the joined segment texts so character offsets line up with the segments
+        text = segments.text
+        self.save_transcript_to_cache(video_id, text, source, duration, segments)
+        self.segments.set(video_id, segments)
+        self.get_index(video_id, text)
+
+    def _ingest(self, video_url, video_id, publish):
+        """
+        Produce a transcript for a video, reporting progress through publish.
+        Caption tracks are used when available; otherwise the audio is
+        downloaded and transcribed. Returns "done" or an error line.
+        """
+        try:
+            if self.captions_first:
+                publish(('status', 'checking captions'))
+                captions = self.get_captions(video_url)
+                if captions:
+                    segments, source, duration = captions
+                    self._store_transcript(video_id, segments, source, duration)
+                    publish(('download', 100))
+                    publish(('transcribe', 100))
+                    logger.info(f"Transcript taken from {source} for video URL: {video_url}")
+                    return "done"
+                publish(('status', 'no captions, transcribing audio'))
+
+            info = {}
+            audio_file = self.download_audio(video_url, progress=publish, info=info)
+            if not audio_file:
+                return DOWNLOAD_FAILED
+            publish(('download', 100))
+
+            duration = info.get('duration')
+            chunked = self.chunked_transcription and (duration is None or duration >= self.chunked_min_duration)
+            with metrics.span("transcribe", mode="chunked" if chunked else "poll") as span:
+                if chunked:
+                    segments = self.chunked_transcriber.transcribe(audio_file, video_id, publish, duration)
+                else:
+                    segments = self.transcript_segments(self.transcribe_audio(audio_file, publish, duration))
+                span["result"] = "ok"
+            self._store_transcript(video_id, segments, "asr", duration)
+            self.chunked_transcriber.discard(video_id)
+            logger.info(f"Transcript fetched and cached successfully for video URL: {video_url}")
+            return "done"
+        except Exception as e:
+            logger.error(f"Error transcribing audio: {str(e)}")
+            metrics.inc("errors_total", stage="ingest")
+            return f"Error: Transcription failed. {str(e)}"
+
+    def _run_ingest_job(self, job, publish):
+        """Job handler for "ingest": run the pipeline for job["key"] and relay its progress."""
+        video_id = job["key"]
+        video_url = job["payload"]["video_url"]
+        set_trace_id(f"job-{job['id']}")
+        # The queue already admits one active job per video; the single-flight
+        # lock additionally covers a stale job re-queued while its original
+        # worker is still alive.
+        channel, _ = self.flights.run(
+            video_id,
+            work=lambda flight_publish: self._ingest(video_url, video_id, flight_publish),
+            check=lambda: "done" if self.get_transcript_from_cache(video_id) else None,
+        )
+        result = None
+        for item in channel.subscribe():
+            if isinstance(item, tuple):
+                publish(item)
+            else:
+                result = item
+        if result == DOWNLOAD_FAILED:
+            # Every cookie strategy failed; YouTube throttling is often transient
+            raise RetryableJobError(result)
+        if result != "done":
+            raise RuntimeError(result)
+        return result
+
+    def ingests_in_progress(self, video_ids):
+        """
+        The video_ids with a queued or running ingest job, or a pipeline
+        holding their lock in any worker; the job queue is queried once.
+        """
+        active = self.jobs.active_keys("ingest")
+        return {video_id for video_id in video_ids if video_id in active or self.flights.locked(video_id)}
+
+    def submit_ingest(self, video_url):
+        """
+        Queue (or join) the ingestion job for video_url and return its id.
+        A video already in the store gets a job that is complete from the
+        start, since there is nothing to run (and in offline mode no workers
+        to run it). Raises ValueError if it can't run.
+        """
+        video_id = self.extract_video_id(video_url or "")
+        if not video_id:
+            raise ValueError("Error: Invalid YouTube URL")
+        payload = {"video_url": video_url}
+        if self.get_transcript_from_cache(video_id):
+            return self.jobs.record_completed("ingest", video_id, payload, "done",
+                                              events=[("download", 100), ("transcribe", 100)])
+        if self.offline_mode:
+            raise ValueError("Error: Offline mode is enabled and this video is not pre-cached.")
+        return self.jobs.submit("ingest", video_id, payload)
 
-    def process_video(self, video_url):
+    def process_video(self, video_url, state):
         logger.info(f"Processing video: {video_url}")
-        self.current_video_url = video_url
         video_id = self.extract_video_id(video_url)
+        if not video_id:
+            yield "Error: Invalid YouTube URL"
+            return
+        state.video_url = video_url
+        state.video_id = video_id
 
-        cached_transcript = self.get_transcript_from_cache(video_id)
+        cached_transcript = self.get_transcript(video_id)
         if cached_transcript:
             logger.info(f"Using cached transcript for video ID: {video_id}")
-            self.transcript = cached_transcript
+            self.get_index(video_id, cached_transcript)
             yield ('download', 100)
             yield ('transcribe', 100)
             yield "done"
@@ -248,125 +752,419 @@ class YouTubeQAApp:
             yield "Error: Offline mode is enabled and this video is not pre-cached."
             return
 
-        audio_file = self.download_audio(video_url)
-        if not audio_file:
-            yield "Error: Failed to download audio from video"
-            return
+        # Ingestion runs in the background job queue, so it survives browser
+        # disconnects and every request for this video shares one job.
+        job_id = self.submit_ingest(video_url)
+        logger.info(f"Following ingestion job {job_id} for video ID: {video_id}")
+        for event in self.jobs.stream(job_id):
+            yield event
+        # Make the transcript available in this worker's memory cache
+        self.get_transcript(video_id)
 
-        yield ('download', 100)
+    def build_messages(self, question, context, is_excerpt=False, history=(), outline=""):
+        """
+        The chat request for a question. Everything that is the same for every
+        question about a video (instructions, then the transcript, or for long
+        videos its outline) comes first and is byte-for-byte identical between
+        requests, so OpenAI's prompt cache can reuse it; the excerpts picked
+        for the question, the conversation so far and the question follow.
+        """
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if is_excerpt:
+            if outline:
+                messages.append({"role": "system", "content": (
+                    f"Outline of the YouTube video (the opening words of passages across it):\n\n{outline}")})
+            intro = "Here are the most relevant excerpts from the transcript of a YouTube video:"
+        else:
+            intro = "Here's the transcript from a YouTube video:"
+        return [
+            *messages,
+            {"role": "system", "content": f"{intro}\n\n{context}"},
+            *history,
+            {"role": "user", "content": question},
+        ]
 
-        try:
-            # Simulate transcription progress
-            for progress in self.simulate_transcribe_progress():
-                yield progress
-
-            # Actual transcription
-            transcript = self.transcriber.transcribe(audio_file)
-            if transcript.status == 'completed':
-                self.transcript = transcript.text
-                self.save_transcript_to_cache(video_id, self.transcript)
-                logger.info(f"Transcript fetched and cached successfully for video URL: {video_url}")
-                yield ('transcribe', 100)
-                yield "done"
-            else:
-                logger.error(f"Transcription failed with status: {transcript.status}")
-                yield "Error: Transcription failed"
-        except Exception as e:
-            logger.error(f"Error transcribing audio: {str(e)}")
-            yield f"Error: Transcription failed. {str(e)}"
+    def completion_options(self):
+        """Model settings shared by every chat completion request."""
+        options = {"model": self.model}
+        if self.max_tokens is not None:
+            options["max_completion_tokens"] = self.max_tokens
+        if self.temperature is not None:
+            options["temperature"] = self.temperature
+        return options
 
-    @sleep_and_retry
-    @limits(calls=1, period=5)  # Adjust as needed based on API limits
-    def get_chatgpt_response(self, question, context):
-        logger.info("Generating ChatGPT response")
-        if not self.openai_api_key:
-            logger.error("OpenAI API key is not set")
-            return "API key is not set. Please set the OPENAI_API_KEY environment variable to use this feature."
+    def build_prompt(self, video_id, transcript, question, history=()):
+        """Select the transcript context for a question and build the chat messages. Returns (messages, citations)."""
+        with metrics.span("prompt_build"):
+            context, is_excerpt, citations = self.select_context(video_id, transcript, question)
+            outline = self.get_outline(video_id, transcript) if is_excerpt and self.outline_tokens > 0 else ""
+            return self.build_messages(question, context, is_excerpt, history, outline), citations
 
-        try:
-            logger.info("Sending request to OpenAI API")
+    def summarize_conversation(self, previous_summary, turns):
+        """Fold earlier question/answer turns into the running summary of a conversation."""
+        exchanges = "\n\n".join(f"Student: {question}\nAssistant: {answer}" for question, answer in turns)
+        with metrics.span("conversation_summary"):
             response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+                model=self.model,
                 messages=[
                     {
                         "role": "system",
-                        "content": "You are an AI assistant that answers questions based on the provided YouTube video transcript. While you should prioritize information from the transcript, you can also provide general explanations for concepts mentioned in the video, even if they're not explicitly defined. If a question is completely unrelated to the video content, politely redirect the user to ask about topics covered in the video."
+                        "content": "You maintain a running summary of a student's conversation with an assistant about a YouTube video. Update the summary with the new exchanges. Keep the topics asked about, facts and conclusions the student was given, and anything the student said about themselves or their goals. Be concise and write plain prose.",
                     },
                     {
                         "role": "user",
-                        "content": f"Here's the transcript from a YouTube video:\n\n{context}\n\nPlease answer the following question, primarily using information from the transcript. If the concept is mentioned but not fully explained, you can provide a brief general explanation:\n\n{question}"
+                        "content": f"Current summary:\n{previous_summary or '(none yet)'}\n\nNew exchanges:\n{exchanges}",
                     },
                 ],
-                stream=True
+                max_completion_tokens=self.conversation.summary_tokens,
+                temperature=0,
+            )
+        if response.usage is not None:
+            metrics.inc("openai_prompt_tokens_total", response.usage.prompt_tokens)
+            metrics.inc("openai_completion_tokens_total", response.usage.completion_tokens)
+        return response.choices[0].message.content or ""
+
+    def get_chatgpt_response(self, messages):
+        logger.info("Generating ChatGPT response")
+        if not self.openai_api_key:
+            logger.error("OpenAI API key is not set")
+            return "API key is not set. Please set the OPENAI_API_KEY environment variable to use this feature."
+
+        try:
+            logger.info("Sending request to OpenAI API")
+            response = self.client.chat.completions.create(
+                **self.completion_options(),
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
             )
             return response
         except Exception as e:
             error_message = str(e)
             logger.error(f"Full error details: {repr(e)}")
+            metrics.inc("errors_total", stage="openai")
             return f"Sorry, I couldn't generate an answer. Error: {error_message}"
 
-    def process_question_stream(self, youtube_url, question, user_info=None):
+    def get_async_client(self):
+        """
+        AsyncOpenAI client for the ASGI server, created on first use inside the
+        event loop. All streams in the process share its connection pool.
+        """
+        if self.async_client is None:
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            self.async_client = AsyncOpenAI(
+                api_key=self.openai_api_key,
+                http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+                    max_connections=self.openai_max_connections,
+                    max_keepalive_connections=min(self.openai_max_connections, 100),
+                )),
+            )
+        return self.async_client
+
+    async def close_async_client(self):
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+
+    async def get_chatgpt_response_async(self, messages):
+        logger.info("Generating ChatGPT response (async)")
+        if not self.openai_api_key:
+            logger.error("OpenAI API key is not set")
+            return "API key is not set. Please set the OPENAI_API_KEY environment variable to use this feature."
+
+        try:
+            return await self.get_async_client().chat.completions.create(
+                **self.completion_options(),
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        except Exception as e:
+            logger.error(f"Full error details: {repr(e)}")
+            metrics.inc("errors_total", stage="openai")
+            return f"Sorry, I couldn't generate an answer. Error: {e}"
+
+    def answer_cache_version(self):
+        """Everything besides video and question that changes the answer."""
+        return (f"p{PROMPT_VERSION}:{self.model}:{self.max_tokens}:{self.temperature}:"
+                f"{self.context_token_budget}:{self.retrieval_top_k}:{self.outline_tokens}")
+
+    def _begin_question(self, youtube_url, question, user_info, state, interaction_id=None):
+        """
+        Resolve the transcript and reset the session's current turn. Returns
+        (transcript, record) where record is the interaction log row being
+        built, or None if no video is loaded.
+        """
         logger.info(f"Processing question: {question}")
-        if not self.transcript:
+        # The URL sent with the question wins, so a session that landed on
+        # another worker still resolves the transcript from the shared cache.
+        video_id = (self.extract_video_id(youtube_url) if youtube_url else None) or state.video_id
+        transcript = self.get_transcript(video_id)
+        if not transcript:
+            return None
+
+        interaction_id = interaction_id or uuid.uuid4().hex
+        with state.lock:
+            state.video_url = youtube_url or state.video_url
+            state.video_id = video_id
+            state.user_info = user_info or {}
+            state.current_question = question
+            state.current_answer = ""
+            state.current_feedback = None
+            state.interaction_id = interaction_id
+            if state.history.video_id != video_id:
+                # Memory is about one video; a new video starts a new conversation
+                state.history = ConversationHistory(video_id)
+
+        record = {
+            "id": interaction_id,
+            "created_at": time.time(),
+            "started": time.monotonic(),
+            "session_id": state.session_id,
+            "participant_id": state.user_info.get("participant_id"),
+            "work_status": state.user_info.get("work_status"),
+            "gender": state.user_info.get("gender"),
+            "video_id": video_id,
+            "video_url": state.video_url,
+            "question": question,
+            "model": self.model,
+        }
+        return transcript, record
+
+    @staticmethod
+    def _elapsed_ms(record):
+        return (time.monotonic() - record["started"]) * 1000
+
+    def _cached_answer(self, record, state, use_cache):
+        """Return a cached answer for this turn (already logged), or None."""
+        if not use_cache:
+            self.answer_cache.record_bypass()
+            metrics.inc("cache_requests_total", cache="answer", result="bypass")
+            return None
+        with metrics.span("answer_cache_lookup") as span:
+            cached = self.answer_cache.get(record["video_id"], record["question"], self.answer_cache_version())
+            span["result"] = cached[1] if cached else "miss"
+        metrics.inc("cache_requests_total", cache="answer", result=span["result"])
+        if cached is None:
+            return None
+        answer, tier = cached
+        logger.info(f"Answering from cache ({tier}) for video ID: {record['video_id']}")
+        state.current_answer = answer
+        self.conversation.record(state.history, record["question"], answer)
+        record.update(answer=answer, cache=tier, prompt_tokens=0, completion_tokens=0, cached_tokens=0,
+                      first_token_ms=0.0, latency_ms=self._elapsed_ms(record))
+        metrics.observe("ttft_seconds", record["latency_ms"] / 1000, source="cache")
+        self.interactions.log_interaction(**record)
+        return answer
+
+    @staticmethod
+    def _record_rate_limit_wait(wait):
+        if wait > 0:
+            metrics.inc("rate_limit_waits_total")
+            metrics.observe("rate_limit_wait_seconds", wait)
+
+    def _log_failed_question(self, record, error):
+        record.update(error=error, latency_ms=self._elapsed_ms(record))
+        self.interactions.log_interaction(**record)
+
+    def _finish_question(self, record, state, answer, usage, completed, cacheable=True):
+        """
+        Log a streamed answer (complete or not). A completed answer joins the
+        conversation memory and, unless it was a follow-up, the answer cache.
+        """
+        state.current_answer = "".join(answer)
+        if not completed and "error" not in record:
+            record["error"] = "cancelled"  # client went away mid-stream
+        record.update(answer=state.current_answer, latency_ms=self._elapsed_ms(record))
+        outcome = "ok" if completed else ("cancelled" if record["error"] == "cancelled" else "error")
+        metrics.observe("answer_stream_seconds", record["latency_ms"] / 1000, outcome=outcome)
+        if outcome == "error":
+            metrics.inc("errors_total", stage="stream")
+        if usage is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", None) or 0
+            record.update(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                          cached_tokens=cached_tokens)
+            metrics.inc("openai_prompt_tokens_total", usage.prompt_tokens)
+            metrics.inc("openai_cached_prompt_tokens_total", cached_tokens)
+            metrics.inc("openai_completion_tokens_total", usage.completion_tokens)
+        self.interactions.log_interaction(**record)
+        if completed and state.current_answer:
+            self.conversation.record(state.history, record["question"], state.current_answer)
+            if cacheable:
+                self.answer_cache.put(record["video_id"], record["question"], self.answer_cache_version(),
+                                      state.current_answer)
+
+    def _chunk_text(self, chunk, record, answer):
+        """Content of one streamed completion chunk (None for the usage-only chunk)."""
+        if chunk.choices and chunk.choices[0].delta.content is not None:
+            if not answer:
+                record["first_token_ms"] = self._elapsed_ms(record)
+                metrics.observe("ttft_seconds", record["first_token_ms"] / 1000, source="openai")
+            return chunk.choices[0].delta.content
+        return None
+
+    def process_question_stream(self, youtube_url, question, user_info, state, use_cache=True, interaction_id=None):
+        """Yield the answer text in pieces, then ("citations", [...]) if the transcript has timestamps."""
+        turn = self._begin_question(youtube_url, question, user_info, state, interaction_id)
+        if turn is None:
             yield "Please load a video first before asking questions."
             return
+        transcript, record = turn
+        # A follow-up's answer depends on the conversation, so it is neither taken from nor stored in the cache;
+        # any other question is answered without the conversation, as its answer may be shared with other students
+        history = self.conversation.messages(state.history)
+        follow_up = self.conversation.depends_on_history(history, question)
+        if not follow_up:
+            history = []
+
+        cached = self._cached_answer(record, state, use_cache and not follow_up)
+        if cached is not None:
+            yield from replay(cached, self.answer_replay_delay)
+            citations = self.find_citations(record["video_id"], transcript, question)
+            if citations:
+                yield ("citations", citations)
+            return
 
-        self.user_info = user_info or {}
-        self.current_question = question
-        self.current_answer = ""
+        # Raises RateLimitExceeded before anything is streamed if the call can't be admitted
+        try:
+            wait = self.rate_limiter.acquire(state.session_id)
+        except RateLimitExceeded as e:
+            metrics.inc("rate_limit_rejections_total", reason=e.reason)
+            raise
+        self._record_rate_limit_wait(wait)
 
-        response = self.get_chatgpt_response(question, self.transcript)
+        messages, citations = self.build_prompt(record["video_id"], transcript, question, history)
+        response = self.get_chatgpt_response(messages)
         if isinstance(response, str):  # Error occurred
+            self._log_failed_question(record, response)
             yield response
             return
 
-        for chunk in response:
-            if chunk.choices[0].delta.content is not None:
-                content = chunk.choices[0].delta.content
-                self.current_answer += content
-                yield content
+        answer = []
+        usage = None
+        completed = False
+        try:
+            for chunk in response:
+                if chunk.usage is not None:
+                    usage = chunk.usage  # final chunk, sent because of include_usage
+                content = self._chunk_text(chunk, record, answer)
+                if content is not None:
+                    answer.append(content)
+                    yield content
+            completed = True
+        except Exception as e:
+            record["error"] = f"Error: {e}"
+            raise
+        finally:
+            self._finish_question(record, state, answer, usage, completed, cacheable=not follow_up)
+        if citations:
+            yield ("citations", citations)
 
-    def submit_feedback(self, feedback):
-        logger.info(f"Submitting feedback: {feedback}")
-        if not self.current_question or not self.current_answer:
-            logger.warning("Attempt to submit feedback without a question")
-            return {"error": "No question has been asked yet"}
+    async def process_question_stream_async(self, youtube_url, question, user_info, state, use_cache=True,
+                                            interaction_id=None):
+        """
+        process_question_stream() for the ASGI server. Blocking transcript and
+        retrieval work runs in a thread; cancelling the consumer closes the
+        upstream OpenAI stream.
+        """
+        turn = await asyncio.to_thread(self._begin_question, youtube_url, question, user_info, state, interaction_id)
+        if turn is None:
+            yield "Please load a video first before asking questions."
+            return
+        transcript, record = turn
+        history = self.conversation.messages(state.history)
+        follow_up = self.conversation.depends_on_history(history, question)
+        if not follow_up:
+            history = []
 
-        self.current_feedback = feedback
-        self.log_to_csv(feedback)
-        logger.info("Feedback submitted successfully")
-        return {"message": "Feedback submitted successfully"}
+        cached = self._cached_answer(record, state, use_cache and not follow_up)
+        if cached is not None:
+            async for chunk in replay_async(cached, self.answer_replay_delay):
+                yield chunk
+            citations = await asyncio.to_thread(self.find_citations, record["video_id"], transcript, question)
+            if citations:
+                yield ("citations", citations)
+            return
 
-    def log_to_csv(self, feedback=None):
-        logger.info("Logging interaction to CSV")
-        filename = "qa_feedback_log.csv"
-        fieldnames = ["timestamp", "participant_id", "work_status", "gender", "video_url", "question", "answer",
-                      "feedback"]
+        try:
+            wait = await self.rate_limiter.acquire_async(state.session_id)
+        except RateLimitExceeded as e:
+            metrics.inc("rate_limit_rejections_total", reason=e.reason)
+            raise
+        self._record_rate_limit_wait(wait)
 
-        file_exists = os.path.isfile(filename)
+        messages, citations = await asyncio.to_thread(self.build_prompt, record["video_id"], transcript, question,
+                                                      history)
+        response = await self.get_chatgpt_response_async(messages)
+        if isinstance(response, str):
+            self._log_failed_question(record, response)
+            yield response
+            return
 
+        answer = []
+        usage = None
+        completed = False
         try:
-            with open(filename, 'a', newline='') as file:
-                writer = csv.DictWriter(file, fieldnames=fieldnames)
-
-                if not file_exists:
-                    logger.info("Creating new CSV file with headers")
-                    writer.writeheader()
-
-                writer.writerow({
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "participant_id": self.user_info.get("participant_id", "N/A"),
-                    "work_status": self.user_info.get("work_status", "N/A"),
-                    "gender": self.user_info.get("gender", "N/A"),
-                    "video_url": self.current_video_url,
-                    "question": self.current_question,
-                    "answer": self.current_answer,
-                    "feedback": feedback or "N/A"
-                })
-            logger.info("Interaction logged successfully to CSV")
+            async for chunk in response:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                content = self._chunk_text(chunk, record, answer)
+                if content is not None:
+                    answer.append(content)
+                    yield content
+            completed = True
         except Exception as e:
-            logger.error(f"Error logging to CSV: {str(e)}")
+            record["error"] = f"Error: {e}"
+            raise
+        finally:
+            await response.close()
+            self._finish_question(record, state, answer, usage, completed, cacheable=not follow_up)
+        if citations:
+            yield ("citations", citations)
+
+    def submit_feedback(self, feedback, state, fallback=None):
+        """
+        Record feedback for the last answer in this session. `fallback` carries
+        the interaction id and question/answer/user fields posted by the
+        browser and is used when this worker has no state for the session
+        (e.g. it was evicted or the question was answered by another gunicorn
+        worker).
+        """
+        logger.info(f"Submitting feedback: {feedback}")
+        fallback = fallback or {}
+        with state.lock:
+            if not state.current_question or not state.current_answer:
+                if not fallback.get("question") or not fallback.get("answer"):
+                    logger.warning("Attempt to submit feedback without a question")
+                    return {"error": "No question has been asked yet"}
+                state.current_question = fallback["question"]
+                state.current_answer = fallback["answer"]
+                state.video_url = fallback.get("youtube_url") or state.video_url
+                state.video_id = self.extract_video_id(state.video_url) if state.video_url else None
+                state.user_info = {
+                    key: fallback.get(key, "N/A") for key in ("participant_id", "work_status", "gender")
+                }
+                state.interaction_id = None
 
+            state.current_feedback = feedback
+            interaction_id = fallback.get("interaction_id") or state.interaction_id or uuid.uuid4().hex
+            # The fallback fields only fill in a row this process never saw logged
+            self.interactions.log_feedback(
+                interaction_id,
+                feedback,
+                session_id=state.session_id,
+                participant_id=state.user_info.get("participant_id"),
+                work_status=state.user_info.get("work_status"),
+                gender=state.user_info.get("gender"),
+                video_id=state.video_id,
+                video_url=state.video_url,
+                question=state.current_question,
+                answer=state.current_answer,
+            )
+        logger.info("Feedback submitted successfully")
+        return {"message": "Feedback submitted successfully"}
 
 if __name__ == "__main__":
     logger.info("youtube_qa_app.py executed directly")